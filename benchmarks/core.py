@@ -0,0 +1,338 @@
+"""
+Benchmark the hot paths of blowhole's core.
+
+Each benchmark runs on synthetic environments, scaled by the number of
+components, and reports the best time of several runs, the throughput in
+components (or other items) per second, and the peak memory allocated during
+a run. Results can be saved as a baseline, and compared with a baseline to
+find regressions between versions.
+
+    python benchmarks/core.py --save baseline.json
+    python benchmarks/core.py --compare baseline.json --threshold 0.25
+
+Benchmarks which take longer than --timeout at one scale are skipped at the
+larger scales.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from io import StringIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+from blowhole import __version__
+from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+from blowhole.core.image import BuildRecipe, ImageName, RunRecipe, combine
+from blowhole.core.loader import DEFAULT_LOADER, LoaderMode
+from blowhole.core.module import Component
+from blowhole.core.optimise import optimise as optimise_recipe
+
+SCALES = [10, 100, 1000, 10000, 100000]
+
+COMPONENTS_PER_MODULE = 5
+
+# Ports and volumes are drawn from a bounded range, as they would be in real
+# environments, so that run recipes do not grow without limit.
+DISTINCT_RUN_ITEMS = 1000
+
+Results = Dict[str, Dict[str, Dict[str, float]]]
+
+
+def synthetic_component(i: int) -> Dict[str, object]:
+    """A component of a synthetic environment, varied by its index."""
+    if i == 0:
+        return {
+            "recipe": {"commands": ["FROM ubuntu:20.04"]},
+            "results": {"repository": "ubuntu", "tag": "20.04"},
+        }
+    if i % 10 == 9:
+        n = i % DISTINCT_RUN_ITEMS
+        return {
+            "recipe": {
+                "script": [f"echo {i}"],
+                "ports": [[10000 + n, 20000 + n]],
+                "volumes": [[f"/host/{n}", f"/container/{n}"]],
+            },
+        }
+    return {
+        "recipe": {"commands": [f"RUN echo {i}"]},
+        "compatible": [
+            {"repository": "ubuntu"},
+            {"repository": "debian", "tag": "buster"},
+        ],
+        "description": f"Component {i}.",
+    }
+
+
+def synthetic_definition(components: int) -> Dict[str, object]:
+    """An environment definition with the given number of components."""
+    modules = []
+    for start in range(0, components, COMPONENTS_PER_MODULE):
+        end = min(start + COMPONENTS_PER_MODULE, components)
+        modules.append({
+            "name": f"module-{start // COMPONENTS_PER_MODULE}",
+            "components": [synthetic_component(i) for i in range(start, end)],
+        })
+    return {"name": "synthetic", "modules": modules}
+
+
+Setup = Callable[[int, LoaderMode], Callable[[], object]]
+
+
+def load(n: int, loader: LoaderMode) -> Callable[[], object]:
+    """ConfigModel.load_from_file, parsing and validating a definition."""
+    text = json.dumps(synthetic_definition(n))
+    return lambda: EnvironmentDefinition.load_from_file(StringIO(text), loader=loader)
+
+
+def recipe(n: int, loader: LoaderMode) -> Callable[[], object]:
+    """EnvironmentDefinition.recipe, composing a recipe from scratch."""
+    env = EnvironmentDefinition(**synthetic_definition(n))  # type: ignore
+
+    def run() -> object:
+        env.__dict__.pop("_recipe_cache", None)
+        return env.recipe
+
+    return run
+
+
+def combine_sets(n: int, loader: LoaderMode) -> Callable[[], object]:
+    """combine, merging two sets of n tuples which partly clash."""
+    first = {(i, i) for i in range(n)}
+    second = {(i, i + 1) for i in range(0, n, 2)}
+    return lambda: combine(first, second)
+
+
+def iadd(n: int, loader: LoaderMode) -> Callable[[], object]:
+    """RunRecipe.__iadd__, accumulating n run recipes with distinct items."""
+    recipes = []
+    for i in range(n):
+        recipes.append(RunRecipe(
+            script=[f"echo {i}"],
+            ports={(10000 + i, 20000 + i)},
+            volumes={(f"/host/{i}", f"/container/{i}")},
+        ))
+
+    def run() -> object:
+        result = RunRecipe()
+        for r in recipes:
+            result += r
+        return result
+
+    return run
+
+
+def should_run(n: int, loader: LoaderMode) -> Callable[[], object]:
+    """Component.should_run, checking n source images."""
+    component = Component(
+        recipe=BuildRecipe(["RUN true"]),
+        compatible=[ImageName(f"repository-{i}") for i in range(10)]
+        + [ImageName(f"repository-{i}", "stable") for i in range(10, 20)],
+    )
+    images = [
+        ImageName(f"repository-{i % 30}", None if i % 3 else "stable")
+        for i in range(n)
+    ]
+    return lambda: sum(component.should_run(i) for i in images)
+
+
+def render(n: int, loader: LoaderMode) -> Callable[[], object]:
+    """Writing the Dockerfile of a recipe with n commands to a stream."""
+    env_recipe = EnvironmentRecipe(
+        build=BuildRecipe([f"RUN echo {i}" for i in range(n)]),
+        run=RunRecipe(),
+    )
+
+    def run() -> object:
+        stream = StringIO()
+        env_recipe.write_dockerfile(stream)
+        return stream
+
+    return run
+
+
+def optimise(n: int, loader: LoaderMode) -> Callable[[], object]:
+    """optimise, chaining a recipe of n consecutive RUN commands."""
+    build = BuildRecipe([f"RUN echo {i}" for i in range(n)])
+    return lambda: optimise_recipe(build)
+
+
+BENCHMARKS: Dict[str, Setup] = {
+    "load": load,
+    "recipe": recipe,
+    "combine": combine_sets,
+    "iadd": iadd,
+    "should_run": should_run,
+    "render": render,
+    "optimise": optimise,
+}
+
+
+def measure(
+    run: Callable[[], object],
+    repeat: int,
+    budget: float,
+) -> Tuple[float, int]:
+    """
+    The best time of several runs, and the peak memory allocated by a run.
+
+    The first run is a warm up, which also decides how many more runs fit in
+    the time budget.
+    """
+    start = time.perf_counter()
+    run()
+    first = time.perf_counter() - start
+
+    best = first
+    for _ in range(min(repeat, int(budget / max(first, 1e-9)))):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmarks(
+    names: List[str],
+    scales: List[int],
+    repeat: int,
+    budget: float,
+    timeout: float,
+    loader: LoaderMode,
+) -> Results:
+    """Run benchmarks at each scale, printing the results as they are found."""
+    results: Results = {}
+    print(f"{'benchmark':<12} {'scale':>7} {'time':>11} {'items/s':>12} {'peak':>10}")
+    for name in names:
+        results[name] = {}
+        for scale in scales:
+            run = BENCHMARKS[name](scale, loader)
+            seconds, peak = measure(run, repeat, budget)
+            results[name][str(scale)] = {
+                "seconds": seconds,
+                "throughput": scale / seconds if seconds else 0.0,
+                "peak_bytes": float(peak),
+            }
+            print(
+                f"{name:<12} {scale:>7} {seconds * 1000:>9.3f}ms "
+                f"{scale / seconds if seconds else 0.0:>12.0f} {peak / 1024:>8.0f}KB",
+            )
+            if seconds > timeout:
+                print(f"{name:<12} skipping larger scales, as it took over {timeout}s")
+                break
+    return results
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> List[str]:
+    """
+    Compare results with a baseline, printing the ratios.
+
+    Returns the benchmarks which are slower, or use more memory, than the
+    baseline by more than the threshold.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<12} {'scale':>7} {'time':>8} {'memory':>8}")
+    for name, scales in results.items():
+        for scale, result in scales.items():
+            base = baseline.get(name, {}).get(scale)
+            if base is None:
+                continue
+            time_ratio = result["seconds"] / base["seconds"] if base["seconds"] else 1.0
+            memory_ratio = (
+                result["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 1.0
+            )
+            flag = ""
+            if time_ratio > 1 + threshold or memory_ratio > 1 + threshold:
+                flag = " regression"
+                regressions.append(f"{name}@{scale}")
+            print(
+                f"{name:<12} {scale:>7} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x{flag}",
+            )
+    return regressions
+
+
+def main() -> int:
+    """Run the benchmarks, returning the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"The benchmarks to run, by default all of them: {', '.join(BENCHMARKS)}.",
+    )
+    parser.add_argument(
+        "--scales",
+        type=lambda s: [int(n) for n in s.split(",")],
+        default=SCALES,
+        help="Comma separated numbers of components.",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=2.0,
+        help="The time to spend repeating each benchmark, in seconds.",
+    )
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument(
+        "--loader",
+        type=LoaderMode,
+        default=DEFAULT_LOADER,
+        help="The parser used by the load benchmark.",
+    )
+    parser.add_argument("--save", metavar="FILE", help="Save results as a baseline.")
+    parser.add_argument("--compare", metavar="FILE", help="Compare with a baseline.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="The fraction by which a benchmark can be worse than the baseline.",
+    )
+    options = parser.parse_args()
+    unknown = set(options.benchmarks).difference(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    baseline: Optional[Results] = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = run_benchmarks(
+        options.benchmarks or list(BENCHMARKS),
+        options.scales,
+        options.repeat,
+        options.budget,
+        options.timeout,
+        options.loader,
+    )
+
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump({
+                "version": __version__,
+                "python": platform.python_version(),
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Benchmark the cold start time of the bh command.
+
+Each command is run repeatedly in a fresh interpreter, as it is from a shell,
+and the time taken is reported along with that of an interpreter doing
+nothing, which is the least that any command could take. With --max-ms, the
+benchmark fails if any command takes longer than that on top of the
+interpreter, so it can be used to catch regressions.
+
+    python benchmarks/startup.py --repeat 20 --max-ms 150
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Sequence
+
+ENVIRONMENT = """\
+name: startup
+modules:
+- name: base
+  components:
+  - recipe:
+      commands:
+      - FROM ubuntu
+    results:
+      repository: ubuntu
+- name: tools
+  components:
+  - recipe:
+      commands:
+      - RUN apt-get update && apt-get install -y git
+    compatible:
+    - repository: ubuntu
+"""
+
+BH = "from blowhole.cli import cli; cli(prog_name='bh')"
+
+
+def run(args: Sequence[str], repeat: int, env: Dict[str, str]) -> List[float]:
+    """The wall clock time, in milliseconds, of each run of a command."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            check=True,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main() -> int:
+    """Run the benchmark, returning the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="Fail if a command's median time exceeds the interpreter's by this much.",
+    )
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        envdef = os.path.join(directory, "blowhole.yml")
+        with open(envdef, "w") as f:
+            f.write(ENVIRONMENT)
+
+        # Use a cache of its own, which is warm after the first run, as it
+        # usually would be.
+        env = dict(os.environ, XDG_CACHE_HOME=os.path.join(directory, "cache"))
+        commands = {
+            "python": ["-c", "pass"],
+            "bh version": ["-c", BH, "version"],
+            "bh env df": ["-c", BH, "env", "df", envdef],
+        }
+
+        medians = {}
+        print(f"{'command':<12} {'min':>9} {'median':>9} {'max':>9}")
+        for name, args in commands.items():
+            run(args, 1, env)
+            times = run(args, options.repeat, env)
+            medians[name] = statistics.median(times)
+            print(
+                f"{name:<12} {min(times):>7.1f}ms {medians[name]:>7.1f}ms "
+                f"{max(times):>7.1f}ms",
+            )
+
+    if options.max_ms is not None:
+        slow = [
+            name for name, t in medians.items()
+            if t - medians["python"] > options.max_ms
+        ]
+        if slow:
+            print(f"Slower than {options.max_ms}ms: {', '.join(slow)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""CLI interface for the Blowhole configuration cache."""
+
+import click
+
+from blowhole.core.cache import ConfigCache
+
+
+@click.group("cache")
+def cache() -> None:
+    """
+    Blowhole.
+
+    Manage the configuration cache.
+    """
+
+
+@cache.command()
+def clear() -> None:
+    """Remove all entries from the configuration cache."""
+    removed = ConfigCache().clear()
+    click.echo(f"Removed {removed} cache entries.")
+
+
+@cache.command()
+def info() -> None:
+    """Display the location and size of the configuration cache."""
+    c = ConfigCache()
+    click.echo(f"Location: {c.directory}")
+    click.echo(f"Entries: {len(c.entries())}")
+    click.echo(f"Size: {c.size} / {c.max_size} bytes")
@@ -1,19 +1,79 @@
 """Main CLI interface for Blowhole."""
 
+from typing import Optional
+
 import click
 
 from blowhole import __version__
-from blowhole.cli.env import env
+from blowhole.cli.lazy import LazyGroup
+from blowhole.core.loader import DEFAULT_LOADER, LoaderMode
 
 
-@click.group('bh', invoke_without_command=True)
+# Subcommands are imported when they are used, as they depend on the rest of
+# blowhole, which takes far longer to import than most commands take to run.
+@click.group(
+    'bh',
+    cls=LazyGroup,
+    invoke_without_command=True,
+    lazy_commands={
+        'cache': 'blowhole.cli.cache:cache',
+        'env': 'blowhole.cli.env:env',
+        'server': 'blowhole.cli.server:server',
+    },
+)
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    envvar='BLOWHOLE_NO_CACHE',
+    help='Do not use the configuration cache.',
+)
+@click.option(
+    '--no-server',
+    is_flag=True,
+    envvar='BLOWHOLE_NO_SERVER',
+    help='Run commands here, even if a blowhole server is running.',
+)
+@click.option(
+    '--loader',
+    type=click.Choice([m.value for m in LoaderMode]),
+    default=DEFAULT_LOADER.value,
+    envvar='BLOWHOLE_LOADER',
+    help='The parser used to load configuration files.',
+)
+@click.option(
+    '--profile',
+    type=click.Path(dir_okay=False, writable=True),
+    help='Write a cProfile dump of the command to a file.',
+)
+@click.option(
+    '--trace',
+    type=click.Path(dir_okay=False, writable=True),
+    help='Write a JSON trace of the time spent in each phase to a file.',
+)
 @click.pass_context
-def cli(ctx: click.Context) -> None:
+def cli(
+    ctx: click.Context,
+    no_cache: bool,
+    no_server: bool,
+    loader: str,
+    profile: Optional[str],
+    trace: Optional[str],
+) -> None:
     """
     Blowhole.
 
     A tool for creating, managing, and using docker-based development environments.
     """
+    ctx.ensure_object(dict)
+    ctx.obj['no_cache'] = no_cache
+    ctx.obj['no_server'] = no_server
+    ctx.obj['loader'] = loader
+
+    if profile is not None:
+        start_profile(ctx, profile)
+    if trace is not None:
+        start_trace(ctx, trace)
+
     if ctx.invoked_subcommand is None:
         click.echo('Unable to find blowhole configuration.', err=True)
         click.echo('Nothing is implemented here.', err=True)
@@ -25,4 +85,30 @@ def version() -> None:
     click.echo(f"Blowhole v{__version__}")
 
 
-cli.add_command(env)
+def start_profile(ctx: click.Context, path: str) -> None:
+    """Profile the command, writing the profile when it finishes."""
+    import cProfile
+
+    profiler = cProfile.Profile()
+
+    def finish() -> None:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+    ctx.call_on_close(finish)
+    profiler.enable()
+
+
+def start_trace(ctx: click.Context, path: str) -> None:
+    """Trace the command, writing the trace when it finishes."""
+    from blowhole.core.trace import TraceRecorder, add_hook, remove_hook
+
+    recorder = TraceRecorder()
+
+    def finish() -> None:
+        remove_hook(recorder)
+        with open(path, "w") as fp:
+            recorder.write(fp)
+
+    ctx.call_on_close(finish)
+    add_hook(recorder)
@@ -0,0 +1,63 @@
+"""Options shared between Blowhole commands."""
+
+from typing import Dict, Optional
+
+import click
+
+from blowhole.core.cache import ConfigCache
+from blowhole.core.loader import DEFAULT_LOADER, LoaderMode
+
+
+def _option(ctx: click.Context, name: str) -> object:
+    root = ctx.find_root()
+    if isinstance(root.obj, dict):
+        return root.obj.get(name)
+    return None
+
+
+def config_cache(ctx: click.Context) -> Optional[ConfigCache]:
+    """The configuration cache to use, or None if caching is disabled."""
+    if _option(ctx, 'no_cache'):
+        return None
+    return ConfigCache()
+
+
+def loader_mode(ctx: click.Context) -> LoaderMode:
+    """The loader mode to use for configuration files."""
+    mode = _option(ctx, 'loader')
+    if isinstance(mode, str):
+        return LoaderMode(mode)
+    return DEFAULT_LOADER
+
+
+def forward(
+    ctx: click.Context,
+    command: str,
+    arguments: Dict[str, object],
+) -> Optional[Dict[str, object]]:
+    """
+    Run a command on the blowhole server, if one is running.
+
+    Returns the server's response, or None if the command should be run here
+    instead. The configuration options are forwarded along with the command.
+    """
+    if _option(ctx, 'no_server'):
+        return None
+
+    from blowhole.core.client import ServerError, ServerUnavailable, request
+    from blowhole.core.trace import span
+
+    arguments = dict(
+        arguments,
+        loader=loader_mode(ctx).value,
+        cache=not _option(ctx, 'no_cache'),
+    )
+    with span("server", command=command) as s:
+        try:
+            return request(command, arguments)
+        except ServerUnavailable:
+            if s is not None:
+                s.attributes["unavailable"] = True
+            return None
+        except ServerError as e:
+            raise click.ClickException(str(e))
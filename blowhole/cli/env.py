@@ -1,10 +1,25 @@
 """CLI interface for Blowhole Environments."""
 
-from typing import TextIO
+import json
+import os
+import textwrap
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, TextIO, Tuple
 
 import click
 
-from blowhole.core.environment import EnvironmentDefinition
+from blowhole.cli.context import config_cache, forward, loader_mode
+from blowhole.core.exception import BlowholeException
+
+# The rest of blowhole is imported by the commands which use it, so that
+# commands which do not, and help, start quickly.
+if TYPE_CHECKING:  # pragma: no cover
+    from blowhole.core.environment import EnvironmentDefinition
+    from blowhole.core.events import BuildEvent
+    from blowhole.core.image import ImageName
+    from blowhole.core.resolve import ModuleRegistry
+    from blowhole.core.schedule import BuildOutcome
 
 
 @click.group("env")
@@ -16,12 +31,380 @@ def env() -> None:
     """
 
 
+# Resolve module requirements from a registry file.
+registry_option = click.option(
+    '--registry', '-r',
+    type=click.File('rb'),
+    help='A file of modules, one per document, to resolve requirements from.',
+)
+
+
+def load_registry(
+    ctx: click.Context,
+    fp: Optional[TextIO],
+) -> Optional['ModuleRegistry']:
+    """Load the registry given to a command, if any."""
+    if fp is None:
+        return None
+    from blowhole.core.resolve import ModuleRegistry
+    try:
+        return ModuleRegistry.load_from_file(fp, loader=loader_mode(ctx))
+    except BlowholeException as e:
+        raise click.ClickException(str(e))
+
+
+def resolve(
+    env: 'EnvironmentDefinition',
+    registry: Optional['ModuleRegistry'],
+) -> 'EnvironmentDefinition':
+    """Resolve the requirements of an environment, if there is a registry."""
+    if registry is None:
+        return env
+    try:
+        return env.resolve(registry)
+    except BlowholeException as e:
+        raise click.ClickException(str(e))
+
+
 @env.command()
 @click.argument('envdef', type=click.File('rb'), default='blowhole.yml')
-def df(envdef: TextIO) -> None:
-    """Output the generated dockerfile for the given environment definition file."""
-    env = EnvironmentDefinition.load_from_file(envdef)
+@click.option(
+    '--name', '-n',
+    help='The environment to use from a file containing several environments.',
+)
+@click.option(
+    '--output', '-o',
+    type=click.File('w'),
+    default='-',
+    help='Write the dockerfile to a file rather than stdout.',
+)
+@click.option(
+    '--optimise', '-O',
+    is_flag=True,
+    help='Coalesce RUN, ENV and LABEL instructions to reduce the number of layers.',
+)
+@click.option(
+    '--watch', '-w',
+    is_flag=True,
+    help='Generate the dockerfile again whenever the files change, until interrupted.',
+)
+@click.option(
+    '--interval',
+    type=float,
+    default=0.5,
+    show_default=True,
+    help='How often to check for changes when watching, in seconds.',
+)
+@registry_option
+@click.pass_context
+def df(
+    ctx: click.Context,
+    envdef: TextIO,
+    name: Optional[str],
+    output: TextIO,
+    optimise: bool,
+    watch: bool,
+    interval: float,
+    registry: Optional[TextIO],
+) -> None:
+    """
+    Output the generated dockerfile for the given environment definition file.
+
+    If a blowhole server is running, the dockerfile is generated by the
+    server, which only loads the files again once they have changed.
+
+    When watching, an output file is only written when the dockerfile
+    changes, and only the modules which have changed are composed again.
+    """
+    if watch:
+        watch_dockerfile(ctx, envdef, name, output, optimise, interval, registry)
+        return
+
+    files = [envdef] if registry is None else [envdef, registry]
+    if all(os.path.isfile(f.name) for f in files):
+        response = forward(ctx, "df", {
+            "envdef": os.path.abspath(envdef.name),
+            "name": name,
+            "registry": os.path.abspath(registry.name) if registry else None,
+            "optimise": optimise,
+        })
+        if response is not None:
+            dockerfile = response.get("dockerfile")
+            if dockerfile is None:
+                raise click.ClickException(
+                    f"No environment named '{name}' in {envdef.name}.",
+                )
+            if optimise:
+                click.echo(f"Optimised away {response.get('saved')} layers.", err=True)
+            output.write(str(dockerfile))
+            return
+
+    from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+    from blowhole.core.optimise import optimise as optimise_build
+
+    try:
+        if name is None:
+            env = EnvironmentDefinition.load_from_file(
+                envdef,
+                cache=config_cache(ctx),
+                loader=loader_mode(ctx),
+            )
+        else:
+            found = EnvironmentDefinition.load_named_from_file(
+                envdef,
+                name,
+                loader=loader_mode(ctx),
+            )
+            if found is None:
+                raise click.ClickException(
+                    f"No environment named '{name}' in {envdef.name}.",
+                )
+            env = found
+    except BlowholeException as e:
+        raise click.ClickException(str(e))
+
+    recipe = resolve(env, load_registry(ctx, registry)).recipe
+
+    if optimise:
+        build, saved = optimise_build(recipe.build)
+        recipe = EnvironmentRecipe(build=build, run=recipe.run, name=recipe.name)
+        click.echo(f"Optimised away {saved} layers.", err=True)
+
+    recipe.write_dockerfile(output)
+
+
+def watch_dockerfile(
+    ctx: click.Context,
+    envdef: TextIO,
+    name: Optional[str],
+    output: TextIO,
+    optimise: bool,
+    interval: float,
+    registry: Optional[TextIO],
+) -> None:
+    """Write the dockerfile whenever it changes, until interrupted."""
+    files = [envdef] if registry is None else [envdef, registry]
+    if not all(os.path.isfile(f.name) for f in files):
+        raise click.ClickException("Only files can be watched.")
+
+    from blowhole.core.watch import DockerfileWatcher, write_if_changed
+
+    watcher = DockerfileWatcher(
+        envdef.name,
+        name=name,
+        registry=registry.name if registry else None,
+        loader=loader_mode(ctx),
+        optimised=optimise,
+    )
+    click.echo(f"Watching {', '.join(f.name for f in files)}.", err=True)
+
+    last_error = None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                dockerfile = watcher.poll()
+            except Exception as e:
+                # Files are often invalid part way through being edited, so
+                # errors are reported, once, and watching continues.
+                error = str(e) or type(e).__name__
+                if error != last_error:
+                    click.echo(f"Error: {error}", err=True)
+                    last_error = error
+                dockerfile = None
+            else:
+                last_error = None
+
+            if dockerfile is not None:
+                if output.name == '-':
+                    output.write(dockerfile)
+                    output.flush()
+                elif not write_if_changed(output.name, dockerfile):
+                    dockerfile = None
+            if dockerfile is not None:
+                saved = f", optimising away {watcher.saved} layers" if optimise else ""
+                click.echo(
+                    f"Generated the dockerfile in "
+                    f"{time.perf_counter() - start:.3f}s{saved}.",
+                    err=True,
+                )
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+@env.command()
+@click.argument('envdefs', type=click.File('rb'), nargs=-1, required=True)
+@click.option(
+    '--jobs', '-j',
+    type=click.IntRange(min=1),
+    help='The number of environments to build at once. Defaults to the number of CPUs.',
+)
+@click.option(
+    '--fail-fast/--keep-going',
+    default=True,
+    help='Stop starting builds after the first failure, or build everything possible.',
+)
+@click.option(
+    '--context', '-C',
+    type=click.Path(exists=True, file_okay=False),
+    help='The directory to copy files from. Defaults to the directory of each file.',
+)
+@click.option(
+    '--events',
+    type=click.File('w'),
+    help='Write build progress events to a file as JSON lines.',
+)
+@registry_option
+@click.pass_context
+def build(
+    ctx: click.Context,
+    envdefs: Tuple[TextIO, ...],
+    jobs: Optional[int],
+    fail_fast: bool,
+    context: Optional[str],
+    events: Optional[TextIO],
+    registry: Optional[TextIO],
+) -> None:
+    """
+    Build the environments defined in the given files.
+
+    Environments whose components result in an image which another environment
+    uses as its base are built first, and independent environments are built
+    in parallel.
+
+    Each event records the module and component which a Dockerfile step came
+    from, whether it was cached, the bytes pulled and how long it took.
+    """
+    from blowhole.core.docker import DockerManager
+    from blowhole.core.environment import EnvironmentDefinition
+    from blowhole.core.schedule import BuildTask, dependencies, run_builds
+
+    modules = load_registry(ctx, registry)
+    tasks: List[BuildTask] = []
+    for envdef in envdefs:
+        directory = context
+        if directory is None and os.path.isfile(envdef.name):
+            directory = os.path.dirname(os.path.abspath(envdef.name))
+
+        try:
+            definitions = list(EnvironmentDefinition.load_all_from_file(
+                envdef,
+                loader=loader_mode(ctx),
+            ))
+        except BlowholeException as e:
+            raise click.ClickException(str(e))
+
+        for i, definition in enumerate(definitions):
+            name = definition.name or f"{envdef.name}[{i}]"
+            definition = resolve(definition, modules)
+            tasks.append(BuildTask.from_definition(name, definition, directory))
+
+    images: Dict[str, 'ImageName'] = {}
+    events_lock = threading.Lock()
+
+    def write_event(event: 'BuildEvent') -> None:
+        if events is not None:
+            line = json.dumps(event.as_dict())
+            with events_lock:
+                events.write(line + "\n")
+                events.flush()
+
+    with DockerManager() as manager:
+        # The images are listed once, and the index shared by every build is
+        # updated as they finish, so that the digest of each environment
+        # covers the images built for the environments it depends on.
+        try:
+            # Cyclic dependencies are reported before contacting docker.
+            dependencies(tasks)
+            index = manager.image_index()
+        except BlowholeException as e:
+            raise click.ClickException(str(e))
+
+        def build_task(task: BuildTask) -> bool:
+            result = manager.build(
+                task.recipe,
+                tags=task.produces,
+                context=task.context,
+                on_event=write_event,
+                origins=task.origins,
+                index=index,
+            )
+            images[task.name] = result.image
+            return result.cached
+
+        def report(outcome: 'BuildOutcome') -> None:
+            if outcome.ok:
+                click.echo(
+                    f"{outcome.status} {outcome.name} as {images[outcome.name]} "
+                    f"in {outcome.duration:.2f}s",
+                )
+            elif outcome.duration:
+                click.echo(
+                    f"{outcome.status} {outcome.name} in {outcome.duration:.2f}s: "
+                    f"{outcome.error}",
+                    err=True,
+                )
+            else:
+                click.echo(f"{outcome.status} {outcome.name}: {outcome.error}", err=True)
+
+        try:
+            outcomes = run_builds(
+                tasks,
+                build_task,
+                jobs=jobs or os.cpu_count() or 1,
+                keep_going=not fail_fast,
+                on_outcome=report,
+            )
+        except BlowholeException as e:
+            raise click.ClickException(str(e))
+
+    failures = [o for o in outcomes if not o.ok]
+    if failures:
+        raise click.ClickException(
+            f"{len(failures)} of {len(outcomes)} environments were not built.",
+        )
+
+
+@env.command()
+@click.argument(
+    'directory',
+    type=click.Path(exists=True, file_okay=False),
+    default='.',
+)
+@click.option(
+    '--jobs', '-j',
+    type=click.IntRange(min=1),
+    help='The number of files to check at once. Defaults to the number of CPUs.',
+)
+@click.pass_context
+def check(ctx: click.Context, directory: str, jobs: Optional[int]) -> None:
+    """
+    Check every environment and module file in a directory tree.
+
+    Environments are validated and their recipes composed, and modules are
+    validated. Files are checked in parallel, and every error is reported,
+    along with how long each file took to check.
+    """
+    from blowhole.core.check import check_tree
 
-    recipe = env.recipe
+    start = time.perf_counter()
+    checked = failed = 0
+    for result in check_tree(directory, loader=loader_mode(ctx), jobs=jobs):
+        if result.ok and not (result.environments or result.modules):
+            continue
+        checked += 1
+        if result.ok:
+            click.echo(
+                f"ok     {result.path} in {result.duration:.3f}s "
+                f"({result.environments} environments, {result.modules} modules)",
+            )
+        else:
+            failed += 1
+            click.echo(f"failed {result.path} in {result.duration:.3f}s", err=True)
+            for error in result.errors:
+                click.echo(textwrap.indent(error, "    "), err=True)
 
-    click.echo(recipe.dockerfile_str)
+    click.echo(f"Checked {checked} files in {time.perf_counter() - start:.2f}s.")
+    if failed:
+        raise click.ClickException(f"{failed} of {checked} files are invalid.")
@@ -0,0 +1,42 @@
+"""Click groups whose subcommands are imported when they are used."""
+
+from importlib import import_module
+from typing import Dict, List, Optional
+
+import click
+
+
+class LazyGroup(click.Group):
+    """
+    A group of commands, some of which are only imported when they are used.
+
+    Lazy commands are given by name, as the module and attribute they are
+    found at, such as "blowhole.cli.env:env". Only the commands which are run,
+    or listed in help, are imported, along with their dependencies.
+    """
+
+    def __init__(
+        self,
+        *args: object,
+        lazy_commands: Optional[Dict[str, str]] = None,
+        **kwargs: object,
+    ) -> None:
+        super().__init__(*args, **kwargs)  # type: ignore
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        """The names of all of the commands, including lazy commands."""
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
+        """Find a command, importing it if necessary."""
+        if name in self.lazy_commands and name not in self.commands:
+            self.add_command(self._import(name), name)
+        return super().get_command(ctx, name)
+
+    def _import(self, name: str) -> click.Command:
+        module, _, attribute = self.lazy_commands[name].partition(":")
+        command = getattr(import_module(module), attribute)
+        if not isinstance(command, click.Command):
+            raise TypeError(f"{self.lazy_commands[name]} is not a command.")
+        return command
@@ -0,0 +1,117 @@
+"""CLI interface for the Blowhole server."""
+
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import click
+
+from blowhole.core.client import (
+    SOCKET_ENV,
+    ServerUnavailable,
+    default_socket_path,
+    request,
+)
+from blowhole.core.exception import BlowholeException
+
+START_TIMEOUT = 10.0
+
+socket_option = click.option(
+    '--socket', '-s', 'socket_path',
+    type=click.Path(dir_okay=False),
+    envvar=SOCKET_ENV,
+    help='The socket the server listens on.',
+)
+
+
+@click.group("server")
+def server() -> None:
+    """
+    Blowhole.
+
+    Run a server which keeps configuration loaded between commands.
+
+    While the server is running, commands such as env df are forwarded to it,
+    and it only loads files again once they have changed.
+    """
+
+
+def _running(socket_path: str) -> bool:
+    try:
+        request("ping", socket_path=socket_path, timeout=1.0)
+    except ServerUnavailable:
+        return False
+    return True
+
+
+@server.command()
+@socket_option
+@click.option(
+    '--detach', '-d',
+    is_flag=True,
+    help='Run the server in the background.',
+)
+def start(socket_path: Optional[str], detach: bool) -> None:
+    """Start the server, which runs until it is stopped."""
+    path = socket_path or default_socket_path()
+    if _running(path):
+        raise click.ClickException(f"A blowhole server is already running at {path}.")
+
+    if detach:
+        subprocess.Popen(
+            [
+                sys.executable, "-c", "from blowhole.cli import cli; cli()",
+                "server", "start", "--socket", path,
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + START_TIMEOUT
+        while not _running(path):
+            if time.monotonic() > deadline:
+                raise click.ClickException("The blowhole server did not start.")
+            time.sleep(0.05)
+        click.echo(f"Started a blowhole server at {path}.")
+        return
+
+    from blowhole.core.server import Server
+
+    try:
+        s = Server(path)
+    except BlowholeException as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"Serving at {path}.", err=True)
+    with s:
+        try:
+            s.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+@server.command()
+@socket_option
+def stop(socket_path: Optional[str]) -> None:
+    """Stop the server."""
+    path = socket_path or default_socket_path()
+    try:
+        request("stop", socket_path=path)
+    except ServerUnavailable:
+        raise click.ClickException(f"No blowhole server is running at {path}.")
+    click.echo(f"Stopped the blowhole server at {path}.")
+
+
+@server.command()
+@socket_option
+def status(socket_path: Optional[str]) -> None:
+    """Display whether the server is running."""
+    path = socket_path or default_socket_path()
+    try:
+        response = request("ping", socket_path=path, timeout=1.0)
+    except ServerUnavailable:
+        raise click.ClickException(f"No blowhole server is running at {path}.")
+    click.echo(f"Running at {path} with pid {response.get('pid')}.")
+    click.echo(f"Entries: {response.get('entries')}")
@@ -0,0 +1,467 @@
+"""
+Asynchronous docker wrapper.
+
+The daemon's HTTP API is spoken directly over its unix socket using asyncio,
+so that many builds can be driven concurrently from a single event loop,
+without a thread per operation or the docker package.
+"""
+
+import asyncio
+import json
+import os
+from functools import wraps
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from urllib.parse import quote, urlencode
+
+from .context import stream_context
+from .docker import (
+    DIGEST_LABEL,
+    BuildResult,
+    DockerException,
+    ImageIndex,
+    build_inputs,
+    image_name,
+    translate_error,
+)
+from .environment import EnvironmentRecipe, Origin
+from .events import BuildMonitor, EventCallback
+from .image import ImageName
+from .trace import span
+
+DEFAULT_HOST = "unix:///var/run/docker.sock"
+
+READ_SIZE = 64 * 1024
+
+RT = TypeVar('RT')
+
+
+def async_whale_call(  # type: ignore
+    f: Callable[..., Awaitable[RT]],
+) -> Callable[..., Awaitable[RT]]:
+    """Decorator to catch and re-throw docker errors in coroutines, as whale_call."""
+    @wraps(f)
+    async def wrapper(*args, **kwargs):  # type: ignore
+        try:
+            with span(f"docker.{f.__name__}"):
+                return await f(*args, **kwargs)
+        except asyncio.IncompleteReadError:
+            raise DockerException(
+                "Unable to communicate with the docker daemon.",
+            ) from None
+        except Exception as e:
+            error = translate_error(e)
+            if error is None:
+                raise
+            raise error from None
+
+    return wrapper
+
+
+class Response:
+    """A response from the docker daemon, with a body which is read lazily."""
+
+    def __init__(
+        self,
+        status: int,
+        headers: Dict[str, str],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.status = status
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Read the body as it arrives, handling chunked transfer encoding."""
+        try:
+            if self.headers.get("transfer-encoding", "").lower() == "chunked":
+                while True:
+                    line = await self._reader.readline()
+                    size = int(line.split(b";")[0].strip() or b"0", 16)
+                    if size == 0:
+                        # Skip any trailers, up to the blank line ending the body.
+                        while (await self._reader.readline()).strip():
+                            pass
+                        break
+                    yield await self._reader.readexactly(size)
+                    await self._reader.readexactly(2)
+            elif "content-length" in self.headers:
+                remaining = int(self.headers["content-length"])
+                while remaining > 0:
+                    data = await self._reader.read(min(remaining, READ_SIZE))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b"", remaining)
+                    remaining -= len(data)
+                    yield data
+            elif self.status not in (204, 304):
+                while True:
+                    data = await self._reader.read(READ_SIZE)
+                    if not data:
+                        break
+                    yield data
+        finally:
+            self.close()
+
+    async def read(self) -> bytes:
+        """Read the whole body."""
+        return b"".join([c async for c in self.chunks()])
+
+    async def json(self) -> object:
+        """Read and decode a JSON body."""
+        data: object = json.loads((await self.read()).decode("utf-8"))
+        return data
+
+    async def json_stream(self) -> AsyncIterator[Dict[str, object]]:
+        """Decode a body of JSON messages, one per line, as they arrive."""
+        buffer = b""
+        async for chunk in self.chunks():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    message: object = json.loads(line.decode("utf-8"))
+                    if isinstance(message, dict):
+                        yield message
+        if buffer.strip():
+            message = json.loads(buffer.decode("utf-8"))
+            if isinstance(message, dict):
+                yield message
+
+    def close(self) -> None:
+        """Close the connection used for the response."""
+        self._writer.close()
+
+
+def _error_message(status: int, body: bytes) -> str:
+    try:
+        data: object = json.loads(body.decode("utf-8"))
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and "message" in data:
+        return str(data["message"])
+    return f"The docker daemon responded with status {status}."
+
+
+def _next_chunk(body: Iterator[bytes]) -> Optional[bytes]:
+    return next(body, None)
+
+
+class AsyncDockerManager:
+    """
+    Manages and wraps interfacing with docker from asyncio.
+
+    Builds are content-addressed in the same way as DockerManager, so the two
+    can be used interchangeably. Each request uses its own connection, so any
+    number of operations can be in progress at once. By default the daemon is
+    found from the DOCKER_HOST environment variable, and only unix sockets
+    are supported.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> None:
+        self.base_url = base_url or os.environ.get("DOCKER_HOST") or DEFAULT_HOST
+        self.version = version or os.environ.get("DOCKER_API_VERSION")
+
+    @property
+    def socket_path(self) -> str:
+        """The path to the daemon's socket."""
+        if not self.base_url.startswith("unix://"):
+            raise DockerException(
+                f"Only unix sockets are supported, not {self.base_url}.",
+            )
+        return self.base_url[len("unix://"):]
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        query: Optional[Dict[str, str]] = None,
+        body: Union[bytes, Iterator[bytes]] = b"",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """
+        Make a request to the daemon.
+
+        A body given as an iterator is sent with chunked transfer encoding as
+        it is generated, without blocking the event loop. Raises a
+        DockerException if the daemon responds with an error, otherwise the
+        response must be read or closed.
+        """
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            if self.version is not None:
+                path = f"/v{self.version}{path}"
+            if query:
+                path = f"{path}?{urlencode(query)}"
+
+            lines = [
+                f"{method} {path} HTTP/1.1",
+                "Host: docker",
+                "Connection: close",
+                f"Content-Length: {len(body)}"
+                if isinstance(body, bytes) else "Transfer-Encoding: chunked",
+            ] + [f"{k}: {v}" for k, v in (headers or {}).items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+            if isinstance(body, bytes):
+                writer.write(body)
+            else:
+                await self._write_chunked(writer, body)
+            await writer.drain()
+
+            status, response_headers = await self._read_head(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+        response = Response(status, response_headers, reader, writer)
+        if status >= 400:
+            raise DockerException(_error_message(status, await response.read()))
+        return response
+
+    @staticmethod
+    async def _write_chunked(writer: asyncio.StreamWriter, body: Iterator[bytes]) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            # Generating the body may read files, so is done in a thread.
+            data = await loop.run_in_executor(None, _next_chunk, body)
+            if data is None:
+                break
+            if not data:
+                continue
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            # Wait for each chunk to be sent, so that memory use is bounded.
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+        status_line = (await reader.readuntil(b"\r\n")).decode("latin-1").split()
+        if len(status_line) < 2 or not status_line[0].startswith("HTTP/"):
+            raise DockerException("The docker daemon sent an invalid response.")
+
+        headers = {}
+        while True:
+            line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return int(status_line[1]), headers
+
+    @async_whale_call
+    async def ping(self) -> bool:
+        """Check that the daemon is responding."""
+        response = await self.request("GET", "/_ping")
+        return (await response.read()).strip(b'"') == b"OK"
+
+    @async_whale_call
+    async def cached_digests(self) -> Set[str]:
+        """The digests of every environment image that has already been built."""
+        return set(await self.cached_images())
+
+    @async_whale_call
+    async def cached_images(self) -> Dict[str, Tuple[str, Set[str]]]:
+        """The ID and names of every environment image built, by digest."""
+        response = await self.request(
+            "GET",
+            "/images/json",
+            {"filters": json.dumps({"label": [DIGEST_LABEL]})},
+        )
+        return ImageIndex(await response.json()).digests
+
+    @async_whale_call
+    async def image_index(self) -> ImageIndex:
+        """An index of every image the daemon has, from a single request."""
+        response = await self.request("GET", "/images/json")
+        return ImageIndex(await response.json())
+
+    @async_whale_call
+    async def tag(self, image: Union[ImageName, str], name: ImageName) -> None:
+        """Tag an image, given by name or ID, with another name."""
+        response = await self.request(
+            "POST",
+            f"/images/{quote(str(image), safe='/:')}/tag",
+            {"repo": name.repository, "tag": name.tag or "latest"},
+        )
+        response.close()
+
+    @async_whale_call
+    async def build(
+        self,
+        recipe: EnvironmentRecipe,
+        buildargs: Optional[Dict[str, str]] = None,
+        tags: Optional[List[ImageName]] = None,
+        context: Optional[str] = None,
+        on_event: Optional[EventCallback] = None,
+        origins: Optional[List[Origin]] = None,
+        index: Optional[ImageIndex] = None,
+    ) -> BuildResult:
+        """
+        Build an environment, unless an identical image already exists.
+
+        The image is also tagged with any given names, as DockerManager.build.
+        """
+        index = index or await self.image_index()
+        result = (await self.build_all(
+            [recipe], buildargs, context, on_event, [origins or []], index,
+        ))[0]
+        for t in tags or []:
+            await self.tag(result.image, t)
+            index.add(result.digest, t)
+        return result
+
+    @async_whale_call
+    async def build_all(
+        self,
+        recipes: List[EnvironmentRecipe],
+        buildargs: Optional[Dict[str, str]] = None,
+        context: Optional[str] = None,
+        on_event: Optional[EventCallback] = None,
+        origins: Optional[List[List[Origin]]] = None,
+        index: Optional[ImageIndex] = None,
+    ) -> List[BuildResult]:
+        """
+        Build several environments concurrently, skipping any that exist.
+
+        Identical recipes are only built once, and the image is tagged with
+        the name of each. Existing images are found as DockerManager.build_all.
+        Files copied or added by a recipe are sent from the context directory,
+        if one is given. Progress is reported to on_event, as
+        DockerManager.build_all.
+        """
+        if index is None:
+            index = await self.image_index() if recipes else ImageIndex([])
+        loop = asyncio.get_event_loop()
+        inputs = await loop.run_in_executor(
+            None, build_inputs, recipes, buildargs, context, index,
+        )
+        cached = {digest for digest, _ in inputs if digest in index}
+
+        # Environments waiting for the image built for each digest.
+        waiting: Dict[str, List[Tuple[ImageName, BuildMonitor]]] = {}
+        runs: List[Awaitable[None]] = []
+        for i, (r, (digest, files)) in enumerate(zip(recipes, inputs)):
+            image = image_name(r, digest)
+            monitor = BuildMonitor(
+                r.name or str(image), on_event, origins[i] if origins else None,
+            )
+            if digest in cached:
+                runs.append(self._reuse(index, digest, image, monitor))
+            elif digest in waiting:
+                waiting[digest].append((image, monitor))
+            else:
+                waiting[digest] = []
+                runs.append(self._build(
+                    r, image, digest, buildargs, files, monitor,
+                    index, waiting[digest],
+                ))
+
+        # The other builds are cancelled as soon as one fails.
+        tasks = [asyncio.ensure_future(run) for run in runs]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        return [
+            BuildResult(
+                image=image_name(r, digest), digest=digest, cached=digest in cached,
+            )
+            for r, (digest, _) in zip(recipes, inputs)
+        ]
+
+    async def _reuse(
+        self,
+        index: ImageIndex,
+        digest: str,
+        image: ImageName,
+        monitor: BuildMonitor,
+    ) -> None:
+        # Environments with the same digest share an image, which may not have
+        # been built with this environment's name.
+        monitor.start()
+        try:
+            source = index.source(digest, image)
+            if source is not None:
+                await self.tag(source, image)
+            index.add(digest, image)
+        except Exception as e:
+            monitor.finish(error=str(e))
+            raise
+        monitor.finish(cached=True)
+
+    async def _build(
+        self,
+        recipe: EnvironmentRecipe,
+        image: ImageName,
+        digest: str,
+        buildargs: Optional[Dict[str, str]],
+        files: List[Tuple[str, str]],
+        monitor: BuildMonitor,
+        index: ImageIndex,
+        waiting: List[Tuple[ImageName, BuildMonitor]],
+    ) -> None:
+        monitor.start()
+        try:
+            await self._build_stream(recipe, image, digest, buildargs, files, monitor)
+        except asyncio.CancelledError:
+            monitor.finish(error="The build was cancelled.")
+            raise
+        except Exception as e:
+            monitor.finish(error=str(translate_error(e) or e))
+            raise
+        monitor.finish()
+
+        # Identical environments are only reported once their image exists.
+        index.add(digest, image)
+        for other, other_monitor in waiting:
+            await self._reuse(index, digest, other, other_monitor)
+
+    async def _build_stream(
+        self,
+        recipe: EnvironmentRecipe,
+        image: ImageName,
+        digest: str,
+        buildargs: Optional[Dict[str, str]],
+        files: List[Tuple[str, str]],
+        monitor: BuildMonitor,
+    ) -> None:
+        response = await self.request(
+            "POST",
+            "/build",
+            {
+                "t": str(image),
+                "labels": json.dumps({DIGEST_LABEL: digest}),
+                "buildargs": json.dumps(buildargs or {}),
+                "rm": "1",
+            },
+            body=stream_context(recipe, files),
+            headers={"Content-Type": "application/x-tar"},
+        )
+        async for message in response.json_stream():
+            monitor.feed(message)
+            if "error" in message:
+                response.close()
+                raise DockerException(
+                    f"Unable to build {image}: {str(message['error']).strip()}",
+                )
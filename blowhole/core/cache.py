@@ -0,0 +1,167 @@
+"""On-disk cache of validated configuration models."""
+
+import dataclasses
+import hashlib
+import os
+import pickle
+from functools import lru_cache
+from typing import List, Optional, Set, Tuple, Union
+
+from blowhole import __version__
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+ENTRY_SUFFIX = ".pickle"
+
+
+@lru_cache(maxsize=None)
+def schema(cls: type) -> str:
+    """
+    A description of the fields of a dataclass, and of any dataclasses they use.
+
+    This is part of each cache key, so that entries pickled before a model
+    changed are not loaded, even without a new release.
+    """
+    seen: Set[type] = set()
+    parts = []
+    pending = [cls]
+    while pending:
+        current = pending.pop()
+        if current in seen or not dataclasses.is_dataclass(current):
+            continue
+        seen.add(current)
+        fields = dataclasses.fields(current)
+        parts.append(f"{current.__module__}.{current.__qualname__}(" + ",".join(
+            f"{f.name}:{f.type}" for f in fields
+        ) + ")")
+        for f in fields:
+            pending.extend(_types(f.type))
+    return ";".join(sorted(parts))
+
+
+def _types(annotation: object) -> List[type]:
+    """The classes used in a type annotation."""
+    if isinstance(annotation, type):
+        return [annotation]
+    types = []
+    for arg in getattr(annotation, "__args__", None) or ():
+        types.extend(_types(arg))
+    return types
+
+
+def default_cache_dir() -> str:
+    """The default directory for cached configuration models."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"),
+        ".cache",
+    )
+    return os.path.join(base, "blowhole", "config")
+
+
+class ConfigCache:
+    """
+    A size-bounded on-disk cache of validated configuration models.
+
+    Entries are keyed by the hash of the source file contents, the model class
+    and the blowhole version, and are stored pickled so that loading them
+    skips both parsing and validation. Least recently used entries are evicted
+    once the cache grows beyond max_size bytes.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ) -> None:
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+
+    def key(self, cls: type, content: Union[str, bytes]) -> str:
+        """The cache key for a file's contents loaded as the given class."""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        h = hashlib.sha256()
+        h.update(f"{__version__}\0{schema(cls)}\0".encode())
+        h.update(content)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[object]:
+        """Fetch a cached object, or None if it is not cached."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                obj: object = pickle.load(fp)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # A stale or corrupt entry is just a cache miss.
+            self._remove(path)
+            return None
+        return obj
+
+    def put(self, key: str, obj: object) -> None:
+        """Store an object in the cache, evicting old entries if required."""
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "wb") as fp:
+                pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            self._remove(tmp)
+            return
+        self.evict()
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """List the (path, size, last used time) of every cache entry."""
+        result = []
+        try:
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if e.name.endswith(ENTRY_SUFFIX):
+                        try:
+                            st = e.stat()
+                        except FileNotFoundError:
+                            continue
+                        result.append((e.path, st.st_size, st.st_mtime))
+        except FileNotFoundError:
+            pass
+        return result
+
+    @property
+    def size(self) -> int:
+        """The total size of the cache in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in max_size."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_size:
+            return
+
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            self._remove(path)
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self) -> int:
+        """Remove every entry from the cache, returning the number removed."""
+        entries = self.entries()
+        for path, _, _ in entries:
+            self._remove(path)
+        return len(entries)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
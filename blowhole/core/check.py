@@ -0,0 +1,117 @@
+"""Validate every environment and module file in a directory tree."""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import field
+from itertools import repeat
+from typing import Iterator, List, Optional, TextIO
+
+from pydantic.dataclasses import dataclass
+
+from blowhole.core.config import DEFAULT_LOADER, LoaderMode, parse_all
+from blowhole.core.environment import EnvironmentDefinition
+from blowhole.core.module import Module
+
+EXTENSIONS = (".yml", ".yaml", ".json", ".jsonl")
+
+
+@dataclass
+class CheckResult:
+    """The outcome of checking a file, and how long it took."""
+
+    path: str
+    environments: int = 0
+    modules: int = 0
+    errors: List[str] = field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """Was the file valid."""
+        return not self.errors
+
+
+def discover(directory: str) -> List[str]:
+    """
+    The configuration files in a directory tree, in a consistent order.
+
+    Hidden files and directories are skipped.
+    """
+    paths: List[str] = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        paths.extend(
+            os.path.join(root, f)
+            for f in sorted(files)
+            if f.endswith(EXTENSIONS) and not f.startswith(".")
+        )
+    return paths
+
+
+def _documents(fp: TextIO, path: str, loader: LoaderMode) -> Iterator[object]:
+    """Parse each document of a file, as JSON or YAML as its extension suggests."""
+    if path.endswith((".json", ".jsonl")):
+        yield from parse_all(fp, LoaderMode.JSON)
+    else:
+        yield from parse_all(fp, DEFAULT_LOADER if loader is LoaderMode.JSON else loader)
+
+
+def check_file(path: str, loader: LoaderMode = DEFAULT_LOADER) -> CheckResult:
+    """
+    Check each document of a file, as an environment or module.
+
+    Documents with modules are environment definitions, which are validated
+    and composed into a recipe, and documents with components are modules,
+    which are validated. Every invalid document is reported, but the rest of
+    the file is not checked once it cannot be parsed. Files with neither kind
+    of document are not blowhole files, and are not counted.
+    """
+    result = CheckResult(path)
+    start = time.perf_counter()
+    try:
+        with open(path, encoding="utf-8") as fp:
+            for i, data in enumerate(_documents(fp, path, loader)):
+                if not isinstance(data, dict):
+                    continue
+                try:
+                    if "modules" in data:
+                        result.environments += 1
+                        env = EnvironmentDefinition.validate(data)
+                        # Composing the recipe fills in module parameters.
+                        env.recipe
+                    elif "components" in data:
+                        result.modules += 1
+                        Module.validate(data)
+                except Exception as e:
+                    result.errors.append(f"Document {i}: {e}")
+    except Exception as e:
+        result.errors.append(str(e) or type(e).__name__)
+    result.duration = time.perf_counter() - start
+    return result
+
+
+def check_tree(
+    directory: str,
+    loader: LoaderMode = DEFAULT_LOADER,
+    jobs: Optional[int] = None,
+) -> Iterator[CheckResult]:
+    """
+    Check every configuration file in a directory tree, across processes.
+
+    Files are checked on a pool of jobs processes, by default one for each
+    CPU, or in this process if jobs is 1. Results are yielded in the order of
+    the files, as soon as each is available.
+    """
+    paths = discover(directory)
+    jobs = min(jobs or os.cpu_count() or 1, len(paths))
+    if jobs <= 1:
+        for path in paths:
+            yield check_file(path, loader)
+        return
+
+    # Files are handed out in chunks, as a single file is usually checked in
+    # far less time than sending it to a process takes.
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(check_file, paths, repeat(loader), chunksize=chunksize)
@@ -0,0 +1,97 @@
+"""
+Talk to a running blowhole server.
+
+Requests and responses are JSON objects, sent one per line over a unix
+socket, with a connection per request. This module has no dependencies, so
+that a command forwarded to the server starts as quickly as possible.
+"""
+
+import json
+import os
+import socket
+import tempfile
+from typing import Dict, Optional
+
+from blowhole import __version__
+from blowhole.core.exception import BlowholeException
+
+SOCKET_ENV = "BLOWHOLE_SOCKET"
+
+TIMEOUT = 60.0
+
+Message = Dict[str, object]
+
+
+class ServerUnavailable(BlowholeException):
+    """There is no server to handle a request, so it must be handled locally."""
+
+
+class ServerError(BlowholeException):
+    """The server was unable to handle a request."""
+
+
+def default_socket_path() -> str:
+    """
+    The socket of the server for the current user.
+
+    This is given by the BLOWHOLE_SOCKET environment variable, and otherwise
+    is in the user's runtime directory.
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime, f"blowhole-{os.getuid()}.sock")
+
+
+def send_message(sock: socket.socket, message: Message) -> None:
+    """Send a message over a socket."""
+    sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def receive_message(sock: socket.socket) -> Optional[Message]:
+    """Receive a message from a socket, or None if it was closed first."""
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = sock.recv(64 * 1024)
+        if not chunk:
+            return None
+        data += chunk
+    message: object = json.loads(data.decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("A message must be a JSON object.")
+    return message
+
+
+def request(
+    command: str,
+    arguments: Optional[Message] = None,
+    socket_path: Optional[str] = None,
+    timeout: float = TIMEOUT,
+) -> Message:
+    """
+    Ask the server to run a command, returning its result.
+
+    Raises ServerUnavailable if there is no server, it is running a different
+    version of blowhole, or it stops before responding, and ServerError if
+    the command fails.
+    """
+    message: Message = dict(arguments or {}, command=command, version=__version__)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path or default_socket_path())
+            send_message(sock, message)
+            response = receive_message(sock)
+    except (OSError, ValueError) as e:
+        raise ServerUnavailable(f"Unable to reach the blowhole server: {e}") from None
+
+    if response is None:
+        raise ServerUnavailable("The blowhole server stopped before responding.")
+    if response.get("version") != __version__:
+        raise ServerUnavailable(
+            f"The blowhole server is running version {response.get('version')}.",
+        )
+    if "error" in response:
+        raise ServerError(str(response["error"]))
+    return response
@@ -1,13 +1,124 @@
 """Base Configuration File."""
 
-from typing import TextIO, Type, TypeVar
+import dataclasses
+import json
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, TextIO, Type, TypeVar, Union
 
 from pydantic import Extra
 from pydantic.dataclasses import dataclass
 from ruamel.yaml import YAML
 
+from blowhole.core.cache import ConfigCache
+from blowhole.core.exception import BlowholeException
+from blowhole.core.loader import DEFAULT_LOADER, LoaderMode
+from blowhole.core.trace import span
+
 T = TypeVar("T", bound='ConfigModel')
 
+_loaders = threading.local()
+
+_END = object()
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+class ConfigError(BlowholeException):
+    """A configuration file cannot be parsed."""
+
+
+def new_yaml_loader(mode: LoaderMode) -> YAML:
+    """
+    Create a YAML loader for a loader mode.
+
+    The C loader falls back to the pure python safe loader if libyaml is not
+    available.
+    """
+    if mode is LoaderMode.ROUND_TRIP:
+        return YAML()
+    elif mode is LoaderMode.SAFE:
+        return YAML(typ="safe", pure=True)
+    elif mode is LoaderMode.C:
+        return YAML(typ="safe")
+    else:
+        raise ValueError(f"{mode} is not a YAML loader mode.")
+
+
+def yaml_loader(mode: LoaderMode) -> YAML:
+    """The YAML loader for a loader mode, created once per thread and reused."""
+    cache: Dict[LoaderMode, YAML] = _loaders.__dict__.setdefault("yaml", {})
+    if mode not in cache:
+        cache[mode] = new_yaml_loader(mode)
+    return cache[mode]
+
+
+def parse(content: str, mode: LoaderMode = DEFAULT_LOADER) -> object:
+    """Parse the contents of a configuration file."""
+    data: object
+    with span("parse", loader=mode.value):
+        if mode is LoaderMode.JSON:
+            try:
+                data = json.loads(content)
+            except ValueError as e:
+                raise ConfigError(f"Invalid JSON: {e}") from None
+        else:
+            data = yaml_loader(mode).load(content)
+    return data
+
+
+def parse_all(fp: TextIO, mode: LoaderMode = DEFAULT_LOADER) -> Iterator[object]:
+    """
+    Lazily parse each document in a configuration file.
+
+    YAML documents are separated by ``---``, and are read from the file as
+    they are consumed, so only the current document is held in memory. JSON
+    documents are whole values one after another, such as JSON lines, or the
+    items of a top-level array, and may each span many lines.
+    """
+    documents = _documents(fp, mode)
+    while True:
+        # Trace parsing each document, but not whatever consumes it.
+        with span("parse", loader=mode.value):
+            data = next(documents, _END)
+        if data is _END:
+            return
+        yield data
+
+
+def _documents(fp: TextIO, mode: LoaderMode) -> Iterator[object]:
+    if mode is LoaderMode.JSON:
+        yield from _json_documents(fp.read())
+    else:
+        # A fresh loader, so that other files can be loaded while this
+        # generator is suspended.
+        yield from new_yaml_loader(mode).load_all(fp)
+
+
+def _json_documents(content: Union[str, bytes]) -> Iterator[object]:
+    text = content.decode("utf-8") if isinstance(content, bytes) else content
+    decoder = json.JSONDecoder()
+    end = 0
+    while True:
+        space = _WHITESPACE.match(text, end)
+        start = end if space is None else space.end()
+        if start == len(text):
+            return
+        try:
+            data, end = decoder.raw_decode(text, start)
+        except ValueError as e:
+            raise ConfigError(f"Invalid JSON: {e}") from None
+        if isinstance(data, list):
+            yield from data
+        else:
+            yield data
+
+
+@lru_cache(maxsize=None)
+def _fields(cls: type) -> Dict[str, 'dataclasses.Field[object]']:
+    return {f.name: f for f in dataclasses.fields(cls)}
+
 
 @dataclass
 class ConfigModel:
@@ -20,12 +131,79 @@ class ConfigModel:
         validate_assignment = True
 
     @classmethod
-    def load_from_file(cls: Type[T], fp: TextIO) -> T:
-        """Load a ConfigModel object from a file."""
-        yaml = YAML()
+    def load_from_file(
+        cls: Type[T],
+        fp: TextIO,
+        cache: Optional[ConfigCache] = None,
+        loader: LoaderMode = DEFAULT_LOADER,
+    ) -> T:
+        """
+        Load a ConfigModel object from a file.
 
-        data = yaml.load(fp)
-        if data is None:
-            return cls()
-        else:
+        If a cache is given, a previously validated object is returned when the
+        contents of the file are unchanged, and newly loaded objects are stored.
+        """
+        content = fp.read()
+
+        if cache is not None:
+            with span("cache", model=cls.__name__):
+                key = cache.key(cls, content)
+                cached = cache.get(key)
+            if isinstance(cached, cls):
+                return cached
+
+        result = cls.validate(parse(content, loader))
+
+        if cache is not None:
+            cache.put(key, result)
+
+        return result
+
+    @classmethod
+    def load_all_from_file(
+        cls: Type[T],
+        fp: TextIO,
+        loader: LoaderMode = DEFAULT_LOADER,
+    ) -> Iterator[T]:
+        """Lazily load a ConfigModel object from each document in a file."""
+        for data in parse_all(fp, loader):
+            yield cls.validate(data)
+
+    @classmethod
+    def validate(cls: Type[T], data: object) -> T:
+        """Create a ConfigModel object from parsed data, validating it."""
+        with span("validate", model=cls.__name__):
+            if data is None:
+                return cls()
             return cls(**data)  # type: ignore
+
+    @classmethod
+    def construct(cls: Type[T], **values: object) -> T:
+        """
+        Create a ConfigModel object from values which are already valid.
+
+        Validation is skipped entirely, so this is for values which come from
+        validated objects, where validating them again would only repeat the
+        work. Values are used as they are, rather than copied, and fields
+        which are not given take their defaults. Otherwise the object is the
+        same as a validated one.
+        """
+        fields = _fields(cls)
+        unknown = values.keys() - fields.keys()
+        if unknown:
+            raise TypeError(f"{cls.__name__} has no field {min(unknown)}.")
+
+        obj: T = cls.__new__(cls)
+        d = obj.__dict__
+        for name, f in fields.items():
+            if name in values:
+                d[name] = values[name]
+            elif f.default_factory is not dataclasses.MISSING:  # type: ignore
+                d[name] = f.default_factory()  # type: ignore
+            elif f.default is not dataclasses.MISSING:
+                d[name] = f.default
+            else:
+                raise TypeError(f"{cls.__name__} requires {name}.")
+        # Set by pydantic once an object has been validated.
+        d["__initialised__"] = True
+        return obj
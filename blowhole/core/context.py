@@ -0,0 +1,152 @@
+"""Generate docker build contexts as tar streams."""
+
+import glob
+import hashlib
+import json
+import os
+import stat
+import tarfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from blowhole.core.environment import EnvironmentRecipe
+from blowhole.core.exception import BlowholeException
+from blowhole.core.optimise import split_instruction
+
+BLOCK_SIZE = 512
+
+READ_SIZE = 64 * 1024
+
+
+class ContextException(BlowholeException):
+    """A build context cannot be created."""
+
+
+def _sources(args: str) -> List[str]:
+    """The sources of a COPY or ADD instruction, excluding other build stages."""
+    args = args.strip()
+    if args.startswith("["):
+        try:
+            words: object = json.loads(args)
+        except ValueError:
+            return []
+        if not isinstance(words, list):
+            return []
+        paths = [str(w) for w in words]
+    else:
+        paths = args.split()
+        while paths and paths[0].startswith("--"):
+            if paths[0].startswith("--from="):
+                return []
+            paths = paths[1:]
+    return [
+        p for p in paths[:-1] if "://" not in p and not p.startswith("git@")
+    ]
+
+
+def context_files(recipe: EnvironmentRecipe, directory: str) -> List[Tuple[str, str]]:
+    """
+    The files in a directory referenced by the COPY and ADD instructions of a recipe.
+
+    Sources may be glob patterns, and directories are included recursively.
+    Returns the name of each file in the context, and its path, in a stable
+    order. Raises a ContextException if a source is outside the directory.
+    """
+    root = os.path.abspath(directory)
+    found: Dict[str, str] = {}
+
+    def add(path: str) -> None:
+        name = os.path.relpath(path, root).replace(os.sep, "/")
+        if name != "." and name not in found:
+            found[name] = path
+
+    for command in recipe.build.commands:
+        instruction, args = split_instruction(command)
+        if instruction not in ("COPY", "ADD"):
+            continue
+
+        for source in _sources(args):
+            pattern = os.path.normpath(os.path.join(root, source.lstrip("/")))
+            if os.path.commonpath([root, pattern]) != root:
+                raise ContextException(f"{source} is outside of the build context.")
+
+            for path in sorted(glob.glob(pattern)):
+                add(path)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    for parent, dirs, files in os.walk(path):
+                        dirs.sort()
+                        for name in dirs + sorted(files):
+                            add(os.path.join(parent, name))
+
+    return sorted(found.items())
+
+
+def _tarinfo(name: str, path: str) -> tarfile.TarInfo:
+    st = os.lstat(path)
+    info = tarfile.TarInfo(name)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = int(st.st_mtime)
+    if stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(path)
+    elif stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    else:
+        info.size = st.st_size
+    return info
+
+
+def _read(path: str, size: int) -> Iterator[bytes]:
+    """Read exactly size bytes from a file, in bounded chunks."""
+    with open(path, "rb") as f:
+        remaining = size
+        while remaining > 0:
+            data = f.read(min(remaining, READ_SIZE))
+            if not data:
+                raise ContextException(f"{path} changed while it was being read.")
+            remaining -= len(data)
+            yield data
+
+
+def _entry(info: tarfile.TarInfo, data: Iterator[bytes]) -> Iterator[bytes]:
+    yield info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+    yield from data
+    if info.size % BLOCK_SIZE:
+        yield bytes(BLOCK_SIZE - info.size % BLOCK_SIZE)
+
+
+def stream_context(
+    recipe: EnvironmentRecipe,
+    files: Optional[List[Tuple[str, str]]] = None,
+) -> Iterator[bytes]:
+    """
+    Generate a tar archive of a build context, piece by piece.
+
+    The archive contains the rendered Dockerfile and the given files, which
+    are read as the archive is consumed, so that memory use is bounded
+    however large the context is.
+    """
+    dockerfile = recipe.dockerfile_str.encode("utf-8")
+    info = tarfile.TarInfo("Dockerfile")
+    info.size = len(dockerfile)
+    info.mode = 0o644
+    yield from _entry(info, iter([dockerfile]))
+
+    for name, path in files or []:
+        info = _tarinfo(name, path)
+        yield from _entry(info, _read(path, info.size) if info.isfile() else iter([]))
+
+    # An archive ends with two empty blocks.
+    yield bytes(2 * BLOCK_SIZE)
+
+
+def context_digest(files: List[Tuple[str, str]]) -> str:
+    """A digest of the names, modes and contents of the files in a context."""
+    h = hashlib.sha256()
+    for name, path in files:
+        info = _tarinfo(name, path)
+        h.update(f"{name}\0{info.mode:o}\0{info.type!r}\0{info.linkname}\0".encode())
+        if info.isfile():
+            for data in _read(path, info.size):
+                h.update(data)
+        h.update(b"\0")
+    return h.hexdigest()
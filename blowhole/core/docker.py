@@ -1,9 +1,34 @@
 """Docker wrapper."""
 
+import hashlib
+import json
+import re
+import sys
+import threading
 from functools import wraps
-from typing import Callable, TypeVar
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
+from pydantic.dataclasses import dataclass
+
+from .context import context_digest, context_files, stream_context
+from .environment import EnvironmentRecipe, Origin
+from .events import BuildMonitor, EventCallback
 from .exception import BlowholeException
+from .image import ImageName
+from .schedule import base_images
+from .trace import span
+
+if TYPE_CHECKING:  # pragma: no cover
+    from docker.client import DockerClient
 
 
 class DockerException(BlowholeException):
@@ -13,19 +38,377 @@ class DockerException(BlowholeException):
 RT = TypeVar('RT')
 
 
+def is_connection_error(e: BaseException) -> bool:
+    """Was an error caused by failing to communicate with the docker daemon."""
+    if isinstance(e, (FileNotFoundError, ConnectionError)):
+        return True
+    # Only check for errors from packages that have already been imported.
+    requests = sys.modules.get("requests.exceptions")
+    return requests is not None and isinstance(e, getattr(requests, "ConnectionError"))
+
+
+def is_docker_error(e: BaseException) -> bool:
+    """Was an error raised by the docker SDK."""
+    errors = sys.modules.get("docker.errors")
+    return errors is not None and isinstance(e, getattr(errors, "DockerException"))
+
+
+def translate_error(e: BaseException) -> Optional[DockerException]:
+    """The friendly DockerException to raise in place of an error, if any."""
+    if is_connection_error(e):
+        return DockerException("Unable to communicate with the docker daemon.")
+    if is_docker_error(e):
+        return DockerException(str(e))
+    return None
+
+
 def whale_call(f: Callable[..., RT]) -> Callable[..., RT]:  # type: ignore
-    """Decorator to catch and re-throw docker errors in a friendly manner."""
+    """
+    Decorator to catch and re-throw docker errors in a friendly manner.
+
+    When decorating a DockerManager method, a failed connection is retried
+    once with a new client, in case the pooled connection was dropped.
+    """
     @wraps(f)
     def wrapper(*args, **kwargs):  # type: ignore
         try:
-            return f(*args, **kwargs)
-        except FileNotFoundError:
-            raise DockerException(
-                "Unable to communicate with the docker daemon.",
-            ) from None
+            with span(f"docker.{f.__name__}"):
+                try:
+                    return f(*args, **kwargs)
+                except Exception as e:
+                    manager = args[0] if args else None
+                    if (
+                        is_connection_error(e)
+                        and isinstance(manager, DockerManager)
+                        and manager.reset()
+                    ):
+                        return f(*args, **kwargs)
+                    raise
+        except Exception as e:
+            error = translate_error(e)
+            if error is None:
+                raise
+            raise error from (None if is_connection_error(e) else e)
 
     return wrapper
 
 
+DIGEST_LABEL = "org.blowhole.digest"
+
+DEFAULT_REPOSITORY = "blowhole"
+
+
+@dataclass
+class BuildResult:
+    """The outcome of building an environment."""
+
+    image: ImageName
+    digest: str
+    cached: bool
+
+
+def build_digest(
+    recipe: EnvironmentRecipe,
+    buildargs: Optional[Dict[str, str]] = None,
+    files: Optional[List[Tuple[str, str]]] = None,
+    bases: Optional[List[str]] = None,
+) -> str:
+    """
+    A digest of everything that determines the image built from a recipe.
+
+    Bases are the identities of the images used as a base by the recipe, as
+    given by ImageIndex.identity, so that the digest changes when they do.
+    """
+    h = hashlib.sha256()
+    h.update(recipe.dockerfile_str.encode("utf-8"))
+    h.update(b"\0")
+    h.update(json.dumps(buildargs or {}, sort_keys=True).encode("utf-8"))
+    if files:
+        h.update(b"\0")
+        h.update(context_digest(files).encode("utf-8"))
+    if bases:
+        h.update(b"\0")
+        h.update(json.dumps(bases).encode("utf-8"))
+    return h.hexdigest()
+
+
+def build_inputs(
+    recipes: List[EnvironmentRecipe],
+    buildargs: Optional[Dict[str, str]],
+    context: Optional[str],
+    index: Optional['ImageIndex'] = None,
+) -> List[Tuple[str, List[Tuple[str, str]]]]:
+    """The digest and context files of each recipe to be built."""
+    inputs = []
+    for r in recipes:
+        files = context_files(r, context) if context is not None else []
+        bases = None if index is None else [
+            index.identity(i) for i in base_images(r.build)
+        ]
+        inputs.append((build_digest(r, buildargs, files, bases), files))
+    return inputs
+
+
+def _tagged(image: ImageName) -> str:
+    """An image name as the daemon lists it, with the implicit latest tag."""
+    if image.tag is None and image.digest is None:
+        return f"{image.repository}:latest"
+    return str(image)
+
+
+class ImageIndex:
+    """
+    The images the daemon has, by digest and by name.
+
+    The index is made from a single listing of the daemon's images, and is
+    kept up to date as environments are built and tagged, so that it can be
+    shared by builds which use each other's images.
+
+    The identity of an image built from a recipe is its digest, and of any
+    other image its ID. Images which the daemon does not have yet, such as
+    bases which have not been pulled, are identified by their name.
+    """
+
+    def __init__(self, images: object) -> None:
+        if not isinstance(images, list):
+            raise DockerException("The docker daemon sent an invalid response.")
+        # The ID and names of the image built for each digest. Images with
+        # the same digest are identical, so the names of each are gathered
+        # under the ID of the first.
+        self.digests: Dict[str, Tuple[str, Set[str]]] = {}
+        # The identity of the image with each name.
+        self.names: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        for image in images:
+            tags = set(image.get("RepoTags") or [])
+            digest = (image.get("Labels") or {}).get(DIGEST_LABEL)
+            for t in tags:
+                self.names[t] = digest or image["Id"]
+            if digest is None:
+                continue
+            if digest in self.digests:
+                self.digests[digest][1].update(tags)
+            else:
+                self.digests[digest] = (image["Id"], tags)
+
+    def __contains__(self, digest: object) -> bool:
+        return digest in self.digests
+
+    def identity(self, image: ImageName) -> str:
+        """The identity of the image with a name."""
+        name = _tagged(image)
+        with self._lock:
+            return self.names.get(name, name)
+
+    def source(self, digest: str, name: ImageName) -> Optional[str]:
+        """
+        The image to tag, to give the image built for a digest a name.
+
+        Returns None if the image already has the name.
+        """
+        with self._lock:
+            source, names = self.digests[digest]
+            return None if _tagged(name) in names else source
+
+    def add(self, digest: str, name: ImageName) -> None:
+        """Record that the image built for a digest has a name."""
+        with self._lock:
+            self.names[_tagged(name)] = digest
+            self.digests.setdefault(digest, (str(name), set()))[1].add(_tagged(name))
+
+
+def image_name(recipe: EnvironmentRecipe, digest: str) -> ImageName:
+    """The content-addressed name for the image built from a recipe."""
+    name = re.sub(r"[^a-z0-9._-]+", "-", (recipe.name or "").lower()).strip(".-_")
+    return ImageName(f"{DEFAULT_REPOSITORY}/{name or 'environment'}", digest[:32])
+
+
 class DockerManager:
-    """Manages and wraps interfacing with docker."""
+    """
+    Manages and wraps interfacing with docker.
+
+    Environments are built into content-addressed images, labelled with a
+    digest of their Dockerfile and build arguments, so that an environment is
+    only built if no image with the same digest already exists. The digest
+    also covers the images the environment is built FROM, so an environment is
+    built again when they change. An existing image is tagged with the name of
+    each environment it is used for.
+
+    A single docker client, and its pool of connections, is shared by every
+    operation. The client is created, and the docker package imported, the
+    first time it is needed. By default the client is configured from the
+    environment, as with the docker CLI.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        version: Optional[str] = None,
+        max_pool_size: int = 10,
+    ) -> None:
+        self.base_url = base_url
+        self.version = version
+        self.max_pool_size = max_pool_size
+        self._client: Optional[DockerClient] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> 'DockerClient':
+        """The shared docker client, which is created when first used."""
+        with self._lock:
+            if self._client is None:
+                from docker.client import DockerClient
+
+                kwargs: Dict[str, object] = {"max_pool_size": self.max_pool_size}
+                if self.version is not None:
+                    kwargs["version"] = self.version
+                if self.base_url is None:
+                    self._client = DockerClient.from_env(**kwargs)
+                else:
+                    self._client = DockerClient(base_url=self.base_url, **kwargs)
+            return self._client
+
+    def reset(self) -> bool:
+        """
+        Close the shared client, so that a new one is created when next used.
+
+        Returns whether there was a client to close.
+        """
+        with self._lock:
+            client, self._client = self._client, None
+        if client is None:
+            return False
+        client.api.close()
+        return True
+
+    def close(self) -> None:
+        """Close the shared client."""
+        self.reset()
+
+    def __enter__(self) -> 'DockerManager':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    @whale_call
+    def cached_digests(self) -> Set[str]:
+        """The digests of every environment image that has already been built."""
+        return set(self.cached_images())
+
+    @whale_call
+    def cached_images(self) -> Dict[str, Tuple[str, Set[str]]]:
+        """The ID and names of every environment image built, by digest."""
+        # The low level API lists every image in one request, whereas the
+        # high level API inspects each image separately.
+        images = self.client.api.images(filters={"label": DIGEST_LABEL})
+        return ImageIndex(images).digests
+
+    @whale_call
+    def image_index(self) -> ImageIndex:
+        """An index of every image the daemon has, from a single request."""
+        return ImageIndex(self.client.api.images())
+
+    @whale_call
+    def build(
+        self,
+        recipe: EnvironmentRecipe,
+        buildargs: Optional[Dict[str, str]] = None,
+        tags: Optional[List[ImageName]] = None,
+        context: Optional[str] = None,
+        on_event: Optional[EventCallback] = None,
+        origins: Optional[List[Origin]] = None,
+        index: Optional[ImageIndex] = None,
+    ) -> BuildResult:
+        """
+        Build an environment, unless an identical image already exists.
+
+        The image is also tagged with any given names, whether or not it was
+        already built, so that other environments can be built FROM it. The
+        names are added to the index, if one is given, as build_all.
+        """
+        index = index or self.image_index()
+        result = self.build_all(
+            [recipe], buildargs, context, on_event, [origins or []], index,
+        )[0]
+        for t in tags or []:
+            self.client.api.tag(str(result.image), t.repository, t.tag or "latest")
+            index.add(result.digest, t)
+        return result
+
+    @whale_call
+    def build_all(
+        self,
+        recipes: List[EnvironmentRecipe],
+        buildargs: Optional[Dict[str, str]] = None,
+        context: Optional[str] = None,
+        on_event: Optional[EventCallback] = None,
+        origins: Optional[List[List[Origin]]] = None,
+        index: Optional[ImageIndex] = None,
+    ) -> List[BuildResult]:
+        """
+        Build several environments, skipping any that already exist.
+
+        Existing images are found with a single query to the daemon, unless
+        an index of them is given, which is updated as environments are
+        built. Files copied or added by a recipe are sent from the context
+        directory, if one is given.
+
+        Progress is reported to on_event as each build runs, with each step
+        mapped to the module and component of the recipe's origins, if given.
+        """
+        if index is None:
+            index = self.image_index() if recipes else ImageIndex([])
+        inputs = build_inputs(recipes, buildargs, context, index)
+
+        results = []
+        for i, (r, (digest, files)) in enumerate(zip(recipes, inputs)):
+            image = image_name(r, digest)
+            monitor = BuildMonitor(
+                r.name or str(image), on_event, origins[i] if origins else None,
+            )
+            monitor.start()
+            hit = digest in index
+            try:
+                if hit:
+                    # Environments with the same digest share an image, which
+                    # may not have been built with this environment's name.
+                    source = index.source(digest, image)
+                    if source is not None:
+                        self.client.api.tag(source, image.repository, image.tag)
+                else:
+                    self._build(r, image, digest, buildargs, files, monitor)
+                index.add(digest, image)
+            except Exception as e:
+                monitor.finish(error=str(translate_error(e) or e))
+                raise
+            monitor.finish(cached=hit)
+            results.append(BuildResult(image=image, digest=digest, cached=hit))
+        return results
+
+    def _build(
+        self,
+        recipe: EnvironmentRecipe,
+        image: ImageName,
+        digest: str,
+        buildargs: Optional[Dict[str, str]],
+        files: List[Tuple[str, str]],
+        monitor: BuildMonitor,
+    ) -> None:
+        # The context is streamed to the daemon as it is generated.
+        output = self.client.api.build(
+            fileobj=stream_context(recipe, files),
+            custom_context=True,
+            tag=str(image),
+            labels={DIGEST_LABEL: digest},
+            buildargs=buildargs or {},
+            rm=True,
+            decode=True,
+        )
+        for chunk in output:
+            monitor.feed(chunk)
+            if "error" in chunk:
+                raise DockerException(
+                    f"Unable to build {image}: {chunk['error'].strip()}",
+                )
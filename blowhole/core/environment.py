@@ -1,13 +1,34 @@
 """Build containers and images."""
 
+from dataclasses import field
 from io import StringIO
-from typing import List, Optional, TextIO
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Dict,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
 
 from pydantic.dataclasses import dataclass
 
-from blowhole.core.config import ConfigModel
-from blowhole.core.image import BuildRecipe, RunRecipe
-from blowhole.core.module import Module
+from blowhole.core.config import (
+    DEFAULT_LOADER,
+    ConfigModel,
+    LoaderMode,
+    parse_all,
+)
+from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
+from blowhole.core.module import Component, Module
+from blowhole.core.trace import span
+
+if TYPE_CHECKING:  # pragma: no cover
+    from blowhole.core.resolve import ModuleRegistry
+
+Origin = Tuple[Module, Component]
 
 
 @dataclass
@@ -18,18 +39,41 @@ class EnvironmentRecipe:
     run: RunRecipe
     name: Optional[str] = None
 
+    def copy(self) -> 'EnvironmentRecipe':
+        """A copy of the recipe, which can be changed independently."""
+        return EnvironmentRecipe(
+            build=BuildRecipe.construct(commands=list(self.build.commands)),
+            run=RunRecipe.construct(
+                script=list(self.run.script),
+                ports=set(self.run.ports),
+                sockets=set(self.run.sockets),
+                volumes=set(self.run.volumes),
+            ),
+            name=self.name,
+        )
+
     @property
     def dockerfile_str(self) -> str:
         """The Dockerfile string to build this environment."""
-        r = ""
-        for c in self.build.commands:
-            r += f"{c}\n"
-        return r
+        with span("render"):
+            return self.build.build_str
 
     @property
     def dockerfile(self) -> TextIO:
         """The file-like Dockerfile to build this environment."""
-        return StringIO(self.dockerfile_str)
+        f = StringIO()
+        self.write_dockerfile(f)
+        f.seek(0)
+        return f
+
+    def write_dockerfile(
+        self,
+        stream: Union[IO[str], IO[bytes]],
+        encoding: str = "utf-8",
+    ) -> None:
+        """Write the Dockerfile to build this environment to a text or binary stream."""
+        with span("render"):
+            self.build.write(stream, encoding)
 
 
 @dataclass
@@ -38,26 +82,181 @@ class EnvironmentDefinition(ConfigModel):
 
     modules: List[Module]
     name: Optional[str] = None
+    parameters: Dict[str, Dict[str, str]] = field(default_factory=dict)
+
+    @classmethod
+    def load_named_from_file(
+        cls,
+        fp: TextIO,
+        name: str,
+        loader: LoaderMode = DEFAULT_LOADER,
+    ) -> Optional['EnvironmentDefinition']:
+        """
+        Load the environment with the given name from a multi-document file.
+
+        Only the matching document is validated. Returns None if no document
+        defines an environment with that name.
+        """
+        for data in parse_all(fp, loader):
+            if isinstance(data, dict) and data.get("name") == name:
+                return cls.validate(data)
+        return None
+
+    def resolve(self, registry: 'ModuleRegistry') -> 'EnvironmentDefinition':
+        """
+        A definition including every module required, after its requirements.
+
+        Resolving again after modules are appended gives modules with the
+        previous resolution as a prefix, so the recipe composed for the
+        previous resolution is extended rather than composed again.
+        """
+        resolved = EnvironmentDefinition.construct(
+            modules=registry.resolve(self.modules),
+            name=self.name,
+            parameters=self.parameters,
+        )
+        previous: Optional[EnvironmentDefinition] = self.__dict__.get("_resolved")
+        if previous is not None and "_recipe_cache" in previous.__dict__:
+            resolved.__dict__["_recipe_cache"] = previous.__dict__["_recipe_cache"]
+        self.__dict__["_resolved"] = resolved
+        return resolved
 
     @property
     def recipe(self) -> EnvironmentRecipe:
-        """Create a buildable Recipe from this definition."""
-        current_image = None
-        build = BuildRecipe()
-        run = RunRecipe()
-
-        for m in self.modules:
-            for c in m.components:
-                if c.should_run(current_image):
-                    if isinstance(c.recipe, BuildRecipe):
-                        build += c.recipe
-                    elif isinstance(c.recipe, RunRecipe):
-                        run += c.recipe
-                    if c.results is not None:
-                        current_image = c.results
+        """
+        Create a buildable Recipe from this definition.
 
-        return EnvironmentRecipe(
-            build=build,
-            run=run,
-            name=self.name,
+        The parameters given for each module, by name, are filled in to its
+        recipes. The recipe is cached until the modules, name or parameters
+        are changed, including changes made to modules in place. The cached
+        recipe is then cut back to the first modules which are unchanged, and
+        only the modules after them are composed again.
+
+        Each call returns a copy of the cached recipe, so that it can be
+        changed without changing the cache.
+        """
+        return self._composed().recipe.copy()
+
+    @property
+    def origins(self) -> List[Origin]:
+        """The module and component which each build command of the recipe came from."""
+        return list(self._composed().origins)
+
+    @property
+    def image(self) -> Optional[ImageName]:
+        """The image which results from the components run by the recipe, if any."""
+        return self._composed().image
+
+    def _composed(self) -> '_RecipeCache':
+        cached: Optional[_RecipeCache] = self.__dict__.get("_recipe_cache")
+        if cached is None:
+            cache = _RecipeCache(self.name, self.parameters)
+        else:
+            unchanged = cached.unchanged(self.modules, self.parameters)
+            if (
+                unchanged == len(cached.modules) == len(self.modules)
+                and cached.recipe.name == self.name
+                and cached.parameters == self.parameters
+            ):
+                return cached
+            cache = cached.prefix(unchanged, self.name, self.parameters)
+
+        with span("compose", modules=len(self.modules) - len(cache.modules)):
+            cache.extend(self.modules[len(cache.modules):])
+        self.__dict__["_recipe_cache"] = cache
+        return cache
+
+
+class _RecipeCache:
+    """
+    The recipe composed from a sequence of modules.
+
+    The state of the recipe after each module is recorded, so that it can be
+    cut back to any of the first modules, and extended from there.
+    """
+
+    def __init__(
+        self,
+        name: Optional[str],
+        parameters: Dict[str, Dict[str, str]],
+    ) -> None:
+        # A copy of the parameters, so that changes to them can be detected.
+        self.parameters = {k: v.copy() for k, v in parameters.items()}
+        self.modules: List[Module] = []
+        self.fingerprints: List[Tuple[object, ...]] = []
+        self.origins: List[Origin] = []
+        self.image: Optional[ImageName] = None
+        # The number of build commands, and the image, after each module, and
+        # the run recipes which each module added.
+        self.ends: List[Tuple[int, Optional[ImageName]]] = []
+        self.runs: List[List[RunRecipe]] = []
+        self.recipe = EnvironmentRecipe(
+            build=BuildRecipe.construct(),
+            run=RunRecipe.construct(),
+            name=name,
         )
+
+    def unchanged(
+        self,
+        modules: List[Module],
+        parameters: Dict[str, Dict[str, str]],
+    ) -> int:
+        """
+        The number of modules which are the first ones used to compose this recipe.
+
+        Modules can be changed in place, so whether each is unchanged since it
+        was composed is checked by its contents, rather than just identity.
+        """
+        n = 0
+        for m, cached, fingerprint in zip(modules, self.modules, self.fingerprints):
+            if (
+                m is not cached
+                or parameters.get(m.name) != self.parameters.get(m.name)
+                or m.fingerprint() != fingerprint
+            ):
+                break
+            n += 1
+        return n
+
+    def prefix(
+        self,
+        n: int,
+        name: Optional[str],
+        parameters: Dict[str, Dict[str, str]],
+    ) -> '_RecipeCache':
+        """A copy of the recipe composed from the first n modules, to be extended."""
+        c = _RecipeCache(name, parameters)
+        c.modules = self.modules[:n]
+        c.fingerprints = self.fingerprints[:n]
+        c.ends = self.ends[:n]
+        c.runs = self.runs[:n]
+        commands, c.image = c.ends[-1] if c.ends else (0, None)
+        c.origins = self.origins[:commands]
+        c.recipe.build.commands = self.recipe.build.commands[:commands]
+        run = c.recipe.run
+        for recipes in c.runs:
+            for r in recipes:
+                run += r
+        return c
+
+    def extend(self, modules: List[Module]) -> None:
+        """Compose additional modules onto the recipe."""
+        build = self.recipe.build
+        run = self.recipe.run
+
+        for m in modules:
+            self.fingerprints.append(m.fingerprint())
+            runs = []
+            for c, recipe in zip(m.components, m.recipes(self.parameters.get(m.name))):
+                if c.should_run(self.image):
+                    if isinstance(recipe, BuildRecipe):
+                        build += recipe
+                        self.origins.extend((m, c) for _ in recipe.commands)
+                    elif isinstance(recipe, RunRecipe):
+                        run += recipe
+                        runs.append(recipe)
+                    if c.results is not None:
+                        self.image = c.results
+            self.modules.append(m)
+            self.ends.append((len(build.commands), self.image))
+            self.runs.append(runs)
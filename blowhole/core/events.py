@@ -0,0 +1,161 @@
+"""Structured progress events for builds."""
+
+import re
+import time
+from dataclasses import fields
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydantic.dataclasses import dataclass
+
+from blowhole.core.environment import Origin
+
+BUILD_START = "build_start"
+STEP_START = "step_start"
+STEP_END = "step_end"
+BUILD_END = "build_end"
+
+STEP = re.compile(r"^Step (\d+)/(\d+) : (.*)$")
+
+
+@dataclass
+class BuildEvent:
+    """
+    Something which happened while building an environment.
+
+    Step events refer to a Dockerfile instruction, numbered from one, and the
+    module and component which it came from, where known. Components are
+    identified by their index within their module.
+    """
+
+    event: str
+    environment: str
+    time: float
+    step: Optional[int] = None
+    steps: Optional[int] = None
+    instruction: Optional[str] = None
+    module: Optional[str] = None
+    component: Optional[int] = None
+    cached: Optional[bool] = None
+    pulled: Optional[int] = None
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, object]:
+        """The fields of the event which are set."""
+        values = ((f.name, getattr(self, f.name)) for f in fields(self))
+        return {k: v for k, v in values if v is not None}
+
+
+EventCallback = Callable[[BuildEvent], None]
+
+
+class BuildMonitor:
+    """
+    Turns the output of a docker build into build events.
+
+    Output messages are fed to the monitor as they arrive from the daemon.
+    The classic builder's output is understood, in which each step starts
+    with a "Step n/m" line, and cached steps are reported as using the cache.
+    """
+
+    def __init__(
+        self,
+        environment: str,
+        callback: Optional[EventCallback],
+        origins: Optional[List[Origin]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.environment = environment
+        self.callback = callback
+        self.origins = origins or []
+        self.clock = clock
+        self._start = 0.0
+        self._step: Optional[BuildEvent] = None
+        self._cached = False
+        # The bytes downloaded so far, and expected in total, for each layer
+        # pulled during the current step.
+        self._layers: Dict[str, Tuple[int, int]] = {}
+
+    def _emit(self, event: str, **values: object) -> BuildEvent:
+        e = BuildEvent(event, self.environment, self.clock(), **values)  # type: ignore
+        if self.callback is not None:
+            self.callback(e)
+        return e
+
+    def start(self) -> None:
+        """Report that the build has started."""
+        self._start = self.clock()
+        self._emit(BUILD_START)
+
+    def feed(self, message: Dict[str, object]) -> None:
+        """Process an output message from the daemon."""
+        stream = message.get("stream")
+        if isinstance(stream, str):
+            for line in stream.splitlines():
+                self._line(line.strip())
+
+        detail = message.get("progressDetail")
+        layer = message.get("id")
+        if self._step is not None and isinstance(layer, str) and isinstance(detail, dict):
+            current = detail.get("current")
+            total = detail.get("total")
+            if message.get("status") == "Downloading" and isinstance(current, int):
+                self._layers[layer] = (current, total if isinstance(total, int) else 0)
+            elif message.get("status") == "Download complete" and layer in self._layers:
+                done, expected = self._layers[layer]
+                self._layers[layer] = (max(done, expected), expected)
+
+    def _line(self, line: str) -> None:
+        match = STEP.match(line)
+        if match is not None:
+            self._end_step()
+            step = int(match.group(1))
+            origin: Dict[str, object] = {}
+            if step <= len(self.origins):
+                module, component = self.origins[step - 1]
+                index = next(
+                    (i for i, c in enumerate(module.components) if c is component),
+                    None,
+                )
+                # The module may have been changed since the recipe was
+                # composed, in which case the origin is no longer known.
+                if index is not None:
+                    origin = {"module": module.name, "component": index}
+            self._step = self._emit(
+                STEP_START,
+                step=step,
+                steps=int(match.group(2)),
+                instruction=match.group(3),
+                **origin,
+            )
+        elif line == "---> Using cache":
+            self._cached = True
+
+    def _end_step(self, error: Optional[str] = None) -> None:
+        step, self._step = self._step, None
+        if step is None:
+            return
+        self._emit(
+            STEP_END,
+            step=step.step,
+            steps=step.steps,
+            instruction=step.instruction,
+            module=step.module,
+            component=step.component,
+            cached=self._cached,
+            pulled=sum(done for done, _ in self._layers.values()),
+            duration=self.clock() - step.time,
+            error=error,
+        )
+        self._cached = False
+        self._layers = {}
+
+    def finish(self, error: Optional[str] = None, cached: bool = False) -> None:
+        """Report that the build has finished, or failed with an error."""
+        self._end_step(error)
+        self._emit(
+            BUILD_END,
+            cached=cached,
+            duration=self.clock() - self._start,
+            error=error,
+        )
@@ -1,43 +1,145 @@
 """Classes for docker images."""
 
-from dataclasses import field
-from typing import List, Optional, Set, Tuple, TypeVar
+import io
+from dataclasses import FrozenInstanceError, field
+from functools import lru_cache
+from typing import (
+    IO,
+    AbstractSet,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from pydantic.dataclasses import dataclass
 
 from blowhole.core.config import ConfigModel
 
+PARSE_CACHE_SIZE = 4096
 
-@dataclass
+
+@dataclass(unsafe_hash=True)
 class ImageName(ConfigModel):
-    """A class for docker image names, defining separate repository and tags."""
+    """
+    A class for docker image names, defining separate repository and tags.
+
+    The repository may include a registry and namespace, and an image may be
+    pinned to a digest. Image names cannot be changed once created, so they
+    can be used as keys, and shared between the objects which use them.
+    """
 
     repository: str
     tag: Optional[str] = None
+    digest: Optional[str] = None
+
+    def __setattr__(self, name: str, value: object) -> None:
+        # Fields are set while an object is created, before pydantic marks it
+        # as initialised.
+        if self.__dict__.get("__initialised__"):
+            raise FrozenInstanceError(f"cannot assign to field {name}")
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name: str) -> None:
+        raise FrozenInstanceError(f"cannot delete field {name}")
 
     def is_compatible(self, other: 'ImageName') -> bool:
-        """Determine if an ImageName is compatible with another."""
-        return (self == other) or (
+        """
+        Determine if an ImageName is compatible with another.
+
+        It is if they have the same repository, and the same tag and digest
+        where this image name gives them.
+        """
+        return (
             self.repository == other.repository
-            and self.tag is None
+            and (self.tag is None or self.tag == other.tag)
+            and (self.digest is None or self.digest == other.digest)
         )
 
+    def intern(self) -> 'ImageName':
+        """
+        An equal image name, shared with every other interned one.
+
+        Only the most recently used image names are kept, so the first equal
+        image name interned is returned while it is still kept.
+        """
+        return _intern(self)
+
     @classmethod
     def from_str(cls, full_name: str) -> 'ImageName':
-        """Take a fully qualified image name and returns an ImageName instance."""
-        name = full_name.split(":")
-        if len(name) == 1:
-            return ImageName(name[0])
-        elif len(name) == 2:
-            return ImageName(name[0], name[1])
-        else:
-            raise ValueError("Image name cannot contain multiple tags.")
+        """
+        Take a fully qualified image name and returns an ImageName instance.
+
+        Names are of the form registry/namespace/repository:tag@digest, where
+        only the repository is required. Parsed names are cached and interned,
+        so parsing a name again returns the same object.
+        """
+        return _parse(full_name)
 
     def __str__(self) -> str:
-        if self.tag is None:
-            return self.repository
-        else:
-            return f"{self.repository}:{self.tag}"
+        name = self.repository
+        if self.tag is not None:
+            name = f"{name}:{self.tag}"
+        if self.digest is not None:
+            name = f"{name}@{self.digest}"
+        return name
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _intern(image: ImageName) -> ImageName:
+    return image
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(full_name: str) -> ImageName:
+    name, at, digest = full_name.partition("@")
+    if at and (not digest or "@" in digest or ":" not in digest):
+        raise ValueError(f"Image name {full_name} has an invalid digest.")
+
+    # A colon in the first component of the path is a registry's port, so
+    # only a colon after the last slash starts a tag.
+    repository, tag = name, None
+    colon = name.rfind(":")
+    if colon > name.rfind("/"):
+        repository, tag = name[:colon], name[colon + 1:]
+
+    components = repository.split("/")
+    if ":" in repository and (len(components) == 1 or ":" in "".join(components[1:])):
+        raise ValueError("Image name cannot contain multiple tags.")
+    if not all(components) or tag == "":
+        raise ValueError(f"Image name {full_name} has an empty part.")
+
+    return _intern(ImageName(repository, tag, digest or None))
+
+
+def is_binary(stream: Union[IO[str], IO[bytes]]) -> bool:
+    """Determine whether a stream expects bytes rather than str."""
+    if isinstance(stream, io.TextIOBase):
+        return False
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    return "b" in getattr(stream, "mode", "")
+
+
+def write_lines(
+    lines: Iterable[str],
+    stream: Union[IO[str], IO[bytes]],
+    encoding: str = "utf-8",
+) -> None:
+    """Write each line to a text or binary stream, followed by a newline."""
+    if is_binary(stream):
+        bstream: IO[bytes] = stream  # type: ignore
+        for line in lines:
+            bstream.write(f"{line}\n".encode(encoding))
+    else:
+        tstream: IO[str] = stream  # type: ignore
+        for line in lines:
+            tstream.write(f"{line}\n")
 
 
 @dataclass
@@ -47,27 +149,19 @@ class BuildRecipe(ConfigModel):
     commands: List[str] = field(default_factory=list)
 
     def __str__(self) -> str:
-        r = "BuildRecipe ["
-
-        for c in self.commands:
-            r += f"\n\t{c}"
-
-        r += "\n]"
-
-        return r
+        return "".join(["BuildRecipe [", *(f"\n\t{c}" for c in self.commands), "\n]"])
 
     @property
     def build_str(self) -> str:
         """The string to insert into the Dockerfile."""
-        r = ""
+        return "".join(f"{c}\n" for c in self.commands)
 
-        for c in self.commands:
-            r += f"{c}\n"
-
-        return r
+    def write(self, stream: Union[IO[str], IO[bytes]], encoding: str = "utf-8") -> None:
+        """Write the Dockerfile lines to a text or binary stream."""
+        write_lines(self.commands, stream, encoding)
 
     def __add__(self, other: 'BuildRecipe') -> 'BuildRecipe':
-        return BuildRecipe(self.commands + other.commands)
+        return BuildRecipe.construct(commands=self.commands + other.commands)
 
     def __iadd__(self, other: 'BuildRecipe') -> 'BuildRecipe':
         self.commands += other.commands
@@ -75,25 +169,151 @@ class BuildRecipe(ConfigModel):
 
 
 T = TypeVar('T', Tuple[str, str], Tuple[int, int])
+E = TypeVar('E')
 
 
 def combine(first: Set[T], second: Set[T]) -> Set[T]:
-    """Combine two sets of tuples, prioritising the second."""
+    """
+    Combine two sets of tuples, prioritising the second.
+
+    A tuple from the first set is dropped if its source or destination is
+    already used by the result. Both sides are indexed, so this is linear in
+    the size of the two sets.
+    """
     result = second.copy()
+    sources = {pr[0] for pr in result}
+    destinations = {pr[1] for pr in result}
     for pf in first:
-        include = True
-        for pr in result:
-            if pf[0] == pr[0]:
-                include = False
-                break
-            if pf[1] == pr[1]:
-                include = False
-                break
-        if include:
+        if pf[0] not in sources and pf[1] not in destinations:
             result.add(pf)
+            sources.add(pf[0])
+            destinations.add(pf[1])
     return result
 
 
+class _VersionedSet(Set[E]):
+    """A set which counts the changes made to it in place."""
+
+    version = 0
+
+    def __repr__(self) -> str:
+        return repr(set(self))
+
+    def add(self, element: E) -> None:
+        super().add(element)
+        self.version += 1
+
+    def clear(self) -> None:
+        super().clear()
+        self.version += 1
+
+    def discard(self, element: E) -> None:
+        super().discard(element)
+        self.version += 1
+
+    def pop(self) -> E:
+        element = super().pop()
+        self.version += 1
+        return element
+
+    def remove(self, element: E) -> None:
+        super().remove(element)
+        self.version += 1
+
+    def update(self, *s: Iterable[E]) -> None:
+        super().update(*s)
+        self.version += 1
+
+    def difference_update(self, *s: Iterable[object]) -> None:
+        super().difference_update(*s)
+        self.version += 1
+
+    def intersection_update(self, *s: Iterable[object]) -> None:
+        super().intersection_update(*s)
+        self.version += 1
+
+    def symmetric_difference_update(self, s: Iterable[E]) -> None:
+        super().symmetric_difference_update(s)
+        self.version += 1
+
+    def __ior__(self, s: AbstractSet[E]) -> '_VersionedSet[E]':  # type: ignore
+        super().__ior__(s)
+        self.version += 1
+        return self
+
+    def __iand__(self, s: AbstractSet[object]) -> '_VersionedSet[E]':
+        super().__iand__(s)
+        self.version += 1
+        return self
+
+    def __isub__(self, s: AbstractSet[object]) -> '_VersionedSet[E]':
+        super().__isub__(s)
+        self.version += 1
+        return self
+
+    def __ixor__(self, s: AbstractSet[E]) -> '_VersionedSet[E]':  # type: ignore
+        super().__ixor__(s)
+        self.version += 1
+        return self
+
+
+class _PairIndex(Generic[T]):
+    """
+    A set of tuples, indexed by source and destination.
+
+    Merging tuples into the set costs time in proportion to the number of
+    tuples merged, rather than the size of the set. The set is changed in
+    place, and the index is only valid until the set is changed otherwise,
+    which is told by its version.
+    """
+
+    def __init__(self, pairs: _VersionedSet[T]) -> None:
+        self.pairs: _VersionedSet[T] = pairs
+        self.sources: Dict[object, Set[T]] = {}
+        self.destinations: Dict[object, Set[T]] = {}
+        for p in pairs:
+            self._index(p)
+        self.version = pairs.version
+
+    def indexes(self, pairs: Set[T]) -> bool:
+        """
+        Is this the index of a set.
+
+        A set which has been replaced, or changed in place other than by
+        merging, needs to be indexed again.
+        """
+        return pairs is self.pairs and self.pairs.version == self.version
+
+    def merge(self, other: Set[T]) -> None:
+        """
+        Add tuples to the set, prioritising them, as combine does.
+
+        Each tuple already in the set with the same source or destination as
+        an added tuple is removed.
+        """
+        for p in other:
+            clashes = [*self.sources.get(p[0], ()), *self.destinations.get(p[1], ())]
+            for q in clashes:
+                self._remove(q)
+        for p in other:
+            self.pairs.add(p)
+            self._index(p)
+        self.version = self.pairs.version
+
+    def _index(self, p: T) -> None:
+        self.sources.setdefault(p[0], set()).add(p)
+        self.destinations.setdefault(p[1], set()).add(p)
+
+    def _remove(self, q: T) -> None:
+        self.pairs.discard(q)
+        for index, key in ((self.sources, q[0]), (self.destinations, q[1])):
+            entries = index.get(key)
+            if entries is not None:
+                entries.discard(q)
+                if not entries:
+                    del index[key]
+
+
 @dataclass
 class RunRecipe(ConfigModel):
     """A set of instructions to set up a running image."""
@@ -123,16 +343,34 @@ class RunRecipe(ConfigModel):
         return r
 
     def __add__(self, other: 'RunRecipe') -> 'RunRecipe':
-        return RunRecipe(
-            self.script + other.script,
-            combine(self.ports, other.ports),
-            combine(self.sockets, other.sockets),
-            combine(self.volumes, other.volumes),
+        return RunRecipe.construct(
+            script=self.script + other.script,
+            ports=combine(self.ports, other.ports),
+            sockets=combine(self.sockets, other.sockets),
+            volumes=combine(self.volumes, other.volumes),
         )
 
     def __iadd__(self, other: 'RunRecipe') -> 'RunRecipe':
+        # The sets are merged into in place, using an index kept between
+        # calls, so that accumulating many recipes is linear.
         self.script += other.script
-        self.ports = combine(self.ports, other.ports)
-        self.sockets = combine(self.sockets, other.sockets)
-        self.volumes = combine(self.volumes, other.volumes)
+        self._index("ports", self.ports).merge(other.ports)
+        self._index("sockets", self.sockets).merge(other.sockets)
+        self._index("volumes", self.volumes).merge(other.volumes)
         return self
+
+    def _index(self, name: str, pairs: Set[T]) -> _PairIndex[T]:
+        key = f"_{name}_index"
+        index: Optional[_PairIndex[T]] = self.__dict__.get(key)
+        if index is None or not index.indexes(pairs):
+            # The set is swapped for one which counts its changes, so that
+            # any change made outside merging is noticed.
+            versioned: _VersionedSet[T]
+            if isinstance(pairs, _VersionedSet):
+                versioned = pairs
+            else:
+                versioned = _VersionedSet(pairs)
+                self.__dict__[name] = versioned
+            index = _PairIndex(versioned)
+            self.__dict__[key] = index
+        return index
@@ -0,0 +1,20 @@
+"""
+Parser backends for configuration files.
+
+This module has no dependencies, so that the choice of parser can be offered
+without importing the parsers themselves.
+"""
+
+from enum import Enum
+
+
+class LoaderMode(Enum):
+    """The parser backend used to load configuration files."""
+
+    ROUND_TRIP = "rt"
+    SAFE = "safe"
+    C = "c"
+    JSON = "json"
+
+
+DEFAULT_LOADER = LoaderMode.C
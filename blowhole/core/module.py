@@ -1,11 +1,27 @@
 """Modules and associated components."""
 
-from typing import List, Optional, Union
+from dataclasses import field
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    overload,
+)
 
 from pydantic.dataclasses import dataclass
 
 from blowhole.core.config import ConfigModel
 from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
+from blowhole.core.template import Template, TemplateError, compile_template
+
+Recipe = Union[BuildRecipe, RunRecipe]
 
 
 @dataclass
@@ -17,15 +33,166 @@ class Component(ConfigModel):
     results: Union[None, ImageName] = None
     description: Optional[str] = None
 
+    def __post_init__(self) -> None:
+        # Share one object for each distinct image between components, rather
+        # than keeping a copy of each in every component.
+        if self.compatible is not None:
+            self.compatible = [i.intern() for i in self.compatible]
+        if self.results is not None:
+            self.results = self.results.intern()
+
+    def fingerprint(self) -> Tuple[object, ...]:
+        """
+        A snapshot of the contents of the component.
+
+        Snapshots are only equal if the component has the same recipe and
+        images, so they show whether it has changed, including in place.
+        """
+        r = self.recipe
+        recipe: Tuple[object, ...]
+        if isinstance(r, BuildRecipe):
+            recipe = (BuildRecipe, tuple(r.commands))
+        else:
+            recipe = (
+                RunRecipe,
+                tuple(r.script),
+                frozenset(r.ports),
+                frozenset(r.sockets),
+                frozenset(r.volumes),
+            )
+        compatible = None if self.compatible is None else tuple(self.compatible)
+        return recipe, compatible, self.results
+
     def should_run(self, source_image: Optional[ImageName]) -> bool:
         """Should this component be executed for a given source image."""
         if self.compatible is None or source_image is None:
             return True
         else:
-            for image in self.compatible:
-                if image.is_compatible(source_image):
-                    return True
-            return False
+            keys = self._compatible_index().keys
+            r, t, d = source_image.repository, source_image.tag, source_image.digest
+            return (
+                (r, t, d) in keys
+                or (r, None, None) in keys
+                or (r, t, None) in keys
+                or (r, None, d) in keys
+            )
+
+    def _compatible_index(self) -> '_CompatibleIndex':
+        """
+        An index of the compatible images.
+
+        The index is rebuilt whenever compatible is reassigned or modified in
+        place. The list is swapped for one which counts its changes, so that
+        telling whether the index is still valid takes constant time.
+        """
+        index: Optional[_CompatibleIndex] = self.__dict__.get("_index")
+        if index is None or not index.indexes(self.compatible):
+            images = self.compatible if self.compatible is not None else []
+            if not isinstance(images, _VersionedList):
+                images = _VersionedList(images)
+                if self.compatible is not None:
+                    self.__dict__["compatible"] = images
+            index = _CompatibleIndex(images)
+            self.__dict__["_index"] = index
+        return index
+
+
+class _VersionedList(List[ImageName]):
+    """A list of images which counts the changes made to it in place."""
+
+    version = 0
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def append(self, image: ImageName) -> None:
+        super().append(image)
+        self.version += 1
+
+    def extend(self, images: Iterable[ImageName]) -> None:
+        super().extend(images)
+        self.version += 1
+
+    def insert(self, index: int, image: ImageName) -> None:
+        super().insert(index, image)
+        self.version += 1
+
+    def pop(self, index: int = -1) -> ImageName:
+        image = super().pop(index)
+        self.version += 1
+        return image
+
+    def remove(self, image: ImageName) -> None:
+        super().remove(image)
+        self.version += 1
+
+    def clear(self) -> None:
+        super().clear()
+        self.version += 1
+
+    def reverse(self) -> None:
+        super().reverse()
+        self.version += 1
+
+    def sort(
+        self,
+        *,
+        key: Optional[Callable[[ImageName], object]] = None,
+        reverse: bool = False,
+    ) -> None:
+        super().sort(key=key, reverse=reverse)
+        self.version += 1
+
+    @overload
+    def __setitem__(self, index: int, image: ImageName) -> None:
+        ...
+
+    @overload
+    def __setitem__(self, index: slice, image: Iterable[ImageName]) -> None:
+        ...
+
+    def __setitem__(
+        self,
+        index: Union[int, slice],
+        image: Union[ImageName, Iterable[ImageName]],
+    ) -> None:
+        super().__setitem__(index, image)  # type: ignore
+        self.version += 1
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        super().__delitem__(index)
+        self.version += 1
+
+    def __iadd__(self, images: Iterable[ImageName]) -> '_VersionedList':
+        super().__iadd__(images)
+        self.version += 1
+        return self
+
+    def __imul__(self, n: int) -> '_VersionedList':
+        super().__imul__(n)
+        self.version += 1
+        return self
+
+
+class _CompatibleIndex:
+    """
+    Compatible images indexed for constant time lookup.
+
+    An image without a tag matches every tag of the repository, and one
+    without a digest matches every digest, so an image is compatible if any
+    of the less specific names of it is in the index.
+    """
+
+    def __init__(self, images: _VersionedList) -> None:
+        self.images = images
+        self.version = images.version
+        self.keys: FrozenSet[Tuple[str, Optional[str], Optional[str]]] = frozenset(
+            (i.repository, i.tag, i.digest) for i in images
+        )
+
+    def indexes(self, images: Optional[List[ImageName]]) -> bool:
+        """Is this the index of a list of images, as it is now."""
+        return images is self.images and self.images.version == self.version
 
 
 @dataclass
@@ -35,3 +202,101 @@ class Module(ConfigModel):
     name: str
     components: List[Component]
     description: Optional[str] = None
+    requires: List[str] = field(default_factory=list)
+    parameters: Dict[str, str] = field(default_factory=dict)
+
+    def recipes(self, parameters: Optional[Mapping[str, str]] = None) -> List[Recipe]:
+        """
+        The recipe of each component, with {{ parameter }} templates filled in.
+
+        Given parameters take precedence over the defaults of the module. The
+        templates are compiled once, and compiled again only when the lines of
+        the recipes change.
+        """
+        templates = self._compiled()
+        if not any(templates.lines):
+            return [c.recipe for c in self.components]
+
+        values = {**self.parameters, **(parameters or {})}
+        missing = templates.names.difference(values)
+        if missing:
+            raise TemplateError(
+                f"The module {self.name} has no value for the parameter "
+                f"{min(missing)}. Write \\{{{{ for literal braces.",
+            )
+
+        return [
+            c.recipe if t is None else _expand(c.recipe, t, values)
+            for c, t in zip(self.components, templates.lines)
+        ]
+
+    def fingerprint(self) -> Tuple[object, ...]:
+        """
+        A snapshot of the contents of the module which its recipes depend on.
+
+        Snapshots are only equal if the module has not changed in between.
+        """
+        return (
+            self.name,
+            tuple(sorted(self.parameters.items())),
+            tuple(c.fingerprint() for c in self.components),
+        )
+
+    def _compiled(self) -> '_ModuleTemplates':
+        templates: Optional[_ModuleTemplates] = self.__dict__.get("_templates")
+        if templates is None or templates.source != _template_source(self.components):
+            templates = _ModuleTemplates(self.components)
+            self.__dict__["_templates"] = templates
+        return templates
+
+
+def _lines(recipe: Recipe) -> List[str]:
+    """The lines of a recipe which may contain templates."""
+    if isinstance(recipe, BuildRecipe):
+        return recipe.commands
+    return recipe.script
+
+
+def _template_source(components: List[Component]) -> Tuple[Tuple[str, ...], ...]:
+    """The lines which the templates of some components are compiled from."""
+    return tuple(tuple(_lines(c.recipe)) for c in components)
+
+
+def _expand(
+    recipe: Recipe,
+    templates: List[Template],
+    values: Mapping[str, str],
+) -> Recipe:
+    lines = [t.substitute(values) for t in templates]
+    if isinstance(recipe, BuildRecipe):
+        return BuildRecipe.construct(commands=lines)
+    return RunRecipe.construct(
+        script=lines,
+        ports=recipe.ports,
+        sockets=recipe.sockets,
+        volumes=recipe.volumes,
+    )
+
+
+class _ModuleTemplates:
+    """
+    The compiled templates of each component of a module.
+
+    Components without any parameters or escaped braces have no templates, so
+    that their recipes can be used as they are.
+    """
+
+    def __init__(self, components: List[Component]) -> None:
+        self.source = _template_source(components)
+        self.lines: List[Optional[List[Template]]] = []
+        self.names: Set[str] = set()
+
+        for c in components:
+            lines = _lines(c.recipe)
+            templates = [compile_template(line) for line in lines]
+            if any(t.literals != (line,) for t, line in zip(templates, lines)):
+                self.lines.append(templates)
+                for t in templates:
+                    self.names.update(t.names)
+            else:
+                self.lines.append(None)
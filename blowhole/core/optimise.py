@@ -0,0 +1,198 @@
+"""Optimise Dockerfiles by coalescing layers."""
+
+import re
+import shlex
+from typing import List, Optional, Set, Tuple
+
+from blowhole.core.image import BuildRecipe
+
+# Instructions which have no further effect when immediately repeated.
+IDEMPOTENT = {
+    "ARG",
+    "CMD",
+    "ENTRYPOINT",
+    "ENV",
+    "EXPOSE",
+    "HEALTHCHECK",
+    "LABEL",
+    "MAINTAINER",
+    "SHELL",
+    "STOPSIGNAL",
+    "USER",
+    "VOLUME",
+}
+
+
+def split_instruction(command: str) -> Tuple[str, str]:
+    """Split a Dockerfile line into its upper case instruction and arguments."""
+    parts = command.strip().split(None, 1)
+    if not parts:
+        return "", ""
+    if len(parts) == 1:
+        return parts[0].upper(), ""
+    return parts[0].upper(), parts[1]
+
+
+# Shell builtins which change the state of the shell running them, and so
+# would affect the commands chained after them.
+STATEFUL = {
+    ".",
+    "alias",
+    "cd",
+    "declare",
+    "eval",
+    "exec",
+    "exit",
+    "export",
+    "local",
+    "popd",
+    "pushd",
+    "readonly",
+    "return",
+    "set",
+    "shopt",
+    "source",
+    "trap",
+    "typeset",
+    "ulimit",
+    "umask",
+    "unalias",
+    "unset",
+}
+
+# Operators after which a shell word is in command position.
+_SEPARATORS = {"&&", "||", ";", ";;", "&", "|", "|&", "(", ")", "{", "}", "!"}
+
+_ASSIGNMENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*=")
+
+
+def _can_chain(args: str) -> bool:
+    """Can a shell form RUN be safely chained with another using &&."""
+    stripped = args.strip()
+    return bool(stripped) and not (
+        stripped.startswith(("[", "--"))
+        or "#" in stripped
+        or "<<" in stripped
+        or stripped.endswith(("&", ";", "|", "\\"))
+    )
+
+
+def _isolated(args: str) -> bool:
+    """
+    Does chaining a shell form RUN after others with && keep its meaning.
+
+    It does not if it has operators which bind less tightly than &&, such as
+    || and ;, or if it changes the state of the shell, as later commands in
+    the chain would then be affected.
+    """
+    if "\n" in args:
+        return False
+    try:
+        # Quotes are kept on words, so that quoted operators are not mistaken
+        # for real ones.
+        lexer = shlex.shlex(args, posix=False, punctuation_chars=True)
+        tokens = list(lexer)
+    except ValueError:
+        return False
+
+    command = True
+    for token in tokens:
+        if token in ("||", ";", ";;", "&"):
+            return False
+        if command and (token in STATEFUL or _ASSIGNMENT.match(token)):
+            return False
+        command = token in _SEPARATORS
+    return True
+
+
+def _chained(args: str) -> str:
+    """The arguments of a RUN, as they are chained with others."""
+    args = args.strip()
+    return args if _isolated(args) else f"( {args} )"
+
+
+def _assigned_keys(args: str) -> Optional[Set[str]]:
+    """The keys set by a key=value ENV or LABEL, or None for any other form."""
+    try:
+        tokens = shlex.split(args)
+    except ValueError:
+        return None
+    if not tokens or not all("=" in t for t in tokens):
+        return None
+    return {t.split("=", 1)[0] for t in tokens}
+
+
+def _references(args: str, keys: Set[str]) -> bool:
+    """Does an instruction reference any of the given variables."""
+    return any(re.search(rf"\$({re.escape(k)}\b|{{{re.escape(k)}\b)", args) for k in keys)
+
+
+def optimise(build: BuildRecipe) -> Tuple[BuildRecipe, int]:
+    """
+    Coalesce the layers of a build recipe.
+
+    Consecutive shell form RUN instructions are chained together with &&,
+    with those which would otherwise affect each other run in subshells,
+    adjacent key=value ENV and LABEL instructions are folded together, and
+    immediate repeats of instructions that have no further effect are dropped.
+    Anything which cannot be merged without changing its meaning is kept as
+    is, and RUN instructions are not merged at all after a SHELL instruction.
+
+    Returns the optimised recipe and the number of layers saved.
+    """
+    result: List[str] = []
+    # The instruction, arguments and keys set by the last line in the result,
+    # if further ENV or LABEL lines may still be merged into it.
+    last: Optional[Tuple[str, str, Set[str]]] = None
+    # The arguments of the RUN instructions chained into the last line in the
+    # result, which are joined once no more can be chained.
+    chained: List[str] = []
+    shell_changed = False
+
+    def end_chain() -> None:
+        if len(chained) > 1:
+            result[-1] = f"RUN {' && '.join(chained)}"
+        chained.clear()
+
+    for command in build.commands:
+        instruction, args = split_instruction(command)
+
+        if result and command == result[-1] and instruction in IDEMPOTENT:
+            if instruction != "ENV" or "$" not in args:
+                continue
+
+        if instruction == "SHELL":
+            shell_changed = True
+
+        if instruction == "RUN" and not shell_changed and _can_chain(args):
+            # Each command is run in a subshell if chaining it would change
+            # what it, or the commands after it, do.
+            if not chained:
+                result.append(command)
+            chained.append(_chained(args))
+            last = None
+            continue
+
+        end_chain()
+
+        if instruction in ("ENV", "LABEL"):
+            keys = _assigned_keys(args)
+            if keys is not None:
+                if (
+                    last is not None
+                    and last[0] == instruction
+                    and not (instruction == "ENV" and _references(args, last[2]))
+                ):
+                    args = f"{last[1]} {args.strip()}"
+                    result[-1] = f"{instruction} {args}"
+                    keys |= last[2]
+                else:
+                    result.append(command)
+                last = (instruction, args, keys)
+                continue
+
+        result.append(command)
+        last = None
+
+    end_chain()
+    return BuildRecipe.construct(commands=result), len(build.commands) - len(result)
@@ -0,0 +1,140 @@
+"""Plan shared base images for building several environments."""
+
+import hashlib
+from typing import Dict, List, Optional
+
+from pydantic.dataclasses import dataclass
+
+from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+from blowhole.core.image import BuildRecipe, ImageName
+from blowhole.core.optimise import split_instruction
+
+DEFAULT_REPOSITORY = "blowhole/base"
+
+
+@dataclass
+class PlannedImage:
+    """An intermediate image shared between environments."""
+
+    tag: ImageName
+    build: BuildRecipe
+    base: Optional[ImageName] = None
+
+
+@dataclass
+class BuildPlan:
+    """Shared base images, and environments built on top of them."""
+
+    bases: List[PlannedImage]
+    environments: List[EnvironmentRecipe]
+
+
+class _Node:
+    """A prefix of build commands shared by one or more environments."""
+
+    def __init__(self, depth: int, digest: "hashlib._Hash") -> None:
+        self.depth = depth
+        self.digest = digest
+        self.count = 0
+        self.children: Dict[str, _Node] = {}
+
+    def child(self, command: str) -> "_Node":
+        if command not in self.children:
+            digest = self.digest.copy()
+            digest.update(command.encode("utf-8"))
+            digest.update(b"\n")
+            self.children[command] = _Node(self.depth + 1, digest)
+        return self.children[command]
+
+
+def is_splittable(build: BuildRecipe) -> bool:
+    """
+    Can a build be split into a base image and the rest of the build.
+
+    Only single stage builds starting with FROM can be split. Builds using ARG
+    or ONBUILD are not split, as these behave differently across a FROM.
+    """
+    instructions = [split_instruction(c)[0] for c in build.commands]
+    return (
+        bool(instructions)
+        and instructions[0] == "FROM"
+        and instructions.count("FROM") == 1
+        and "ARG" not in instructions
+        and "ONBUILD" not in instructions
+    )
+
+
+def plan(
+    definitions: List[EnvironmentDefinition],
+    repository: str = DEFAULT_REPOSITORY,
+) -> BuildPlan:
+    """
+    Plan shared base images for a set of environments.
+
+    The build commands of every environment are inserted into a prefix tree.
+    Each point at which environments sharing a prefix diverge (or end) becomes
+    an intermediate image, tagged with a digest of its commands, and every
+    environment is rebuilt to start FROM the deepest intermediate image it
+    shares. Parent images are listed before the images built on them, and
+    environments are returned in the order they were given.
+    """
+    recipes = [d.recipe for d in definitions]
+    root = _Node(0, hashlib.sha256())
+
+    paths: List[Optional[List[_Node]]] = []
+    for r in recipes:
+        if not is_splittable(r.build):
+            paths.append(None)
+            continue
+
+        node = root
+        path = []
+        for c in r.build.commands:
+            node = node.child(c)
+            node.count += 1
+            path.append(node)
+        paths.append(path)
+
+    images: Dict[int, PlannedImage] = {}
+    environments = []
+
+    for r, nodes in zip(recipes, paths):
+        if nodes is None:
+            environments.append(r)
+            continue
+
+        base: Optional[ImageName] = None
+        base_depth = 0
+        for i, node in enumerate(nodes):
+            is_split = node.count > 1 and (
+                i + 1 == len(nodes) or nodes[i + 1].count < node.count
+            )
+            if not is_split:
+                continue
+
+            if id(node) not in images:
+                commands = r.build.commands[base_depth:node.depth]
+                if base is not None:
+                    commands = [f"FROM {base}"] + commands
+                images[id(node)] = PlannedImage(
+                    tag=ImageName(repository, node.digest.hexdigest()[:32]),
+                    build=BuildRecipe.construct(commands=commands),
+                    base=base,
+                )
+            base = images[id(node)].tag
+            base_depth = node.depth
+
+        if base is None:
+            environments.append(r)
+        else:
+            environments.append(EnvironmentRecipe(
+                build=BuildRecipe.construct(
+                    commands=[f"FROM {base}"] + r.build.commands[base_depth:],
+                ),
+                run=r.run,
+                name=r.name,
+            ))
+
+    # Images are planned walking down from the root, so each parent image is
+    # always inserted before the images built on it.
+    return BuildPlan(bases=list(images.values()), environments=environments)
@@ -0,0 +1,204 @@
+"""Resolve dependencies between modules."""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from blowhole.core.config import DEFAULT_LOADER, LoaderMode
+from blowhole.core.exception import BlowholeException
+from blowhole.core.module import Module
+from blowhole.core.trace import span
+
+
+class DependencyError(BlowholeException):
+    """Dependencies between modules cannot be resolved."""
+
+
+class ModuleRegistry:
+    """
+    A collection of modules which can be required by name.
+
+    The closure of each module, that is the module and everything it
+    transitively requires, is memoised once resolved. Modules should not be
+    modified once they are in the registry, as memoised closures are only
+    discarded when modules are added.
+    """
+
+    def __init__(self, modules: Iterable[Module] = ()) -> None:
+        self._modules: Dict[str, Module] = {}
+        self._closures: Dict[str, Tuple[Module, ...]] = {}
+        for m in modules:
+            self.add(m)
+
+    @classmethod
+    def load_from_file(
+        cls,
+        fp: TextIO,
+        loader: LoaderMode = DEFAULT_LOADER,
+    ) -> 'ModuleRegistry':
+        """Load a registry from a file containing a module in each document."""
+        return cls(Module.load_all_from_file(fp, loader))
+
+    def add(self, module: Module) -> None:
+        """Add a module to the registry."""
+        if module.name in self._modules:
+            raise DependencyError(f"The module {module.name} is defined twice.")
+        self._modules[module.name] = module
+        self._closures.clear()
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._modules
+
+    def __getitem__(self, name: str) -> Module:
+        return self._modules[name]
+
+    def __iter__(self) -> Iterator[Module]:
+        return iter(self._modules.values())
+
+    def __len__(self) -> int:
+        return len(self._modules)
+
+    def _require(self, name: str, by: Optional[str]) -> Module:
+        try:
+            return self._modules[name]
+        except KeyError:
+            if by is None:
+                raise DependencyError(f"There is no module named {name}.") from None
+            raise DependencyError(
+                f"The module {by} requires {name}, which is not defined.",
+            ) from None
+
+    def closure(self, name: str) -> Tuple[Module, ...]:
+        """
+        A module and everything it requires, with requirements first.
+
+        Requirements are ordered by a depth first search, visiting them in
+        the order they are declared, so the order is stable. The search is
+        iterative and each requirement is followed once, so it is linear in
+        the size of the dependency graph. The closure of every module visited
+        is memoised along the way, and a memoised closure is reused when it is
+        reached before anything else. Raises a DependencyError if a
+        requirement is missing or cyclic.
+        """
+        memo = self._closures.get(name)
+        if memo is not None:
+            return memo
+
+        order: List[Module] = []
+        position: Dict[str, int] = {}
+        path: List[_Visit] = []
+        visiting: Dict[str, int] = {}
+
+        def enter(module: Module) -> None:
+            visiting[module.name] = len(path)
+            path.append(_Visit(module, len(order)))
+
+        def reached(visit: _Visit, m: Module) -> None:
+            # A module which was reached before the current visit started is
+            # not part of the order since then, so that visit's closure can
+            # not be read off from the order. Its own requirements were reached
+            # before it, so its position is enough to tell.
+            if m.name in position:
+                visit.earliest = min(visit.earliest, position[m.name])
+            else:
+                position[m.name] = len(order)
+                order.append(m)
+
+        enter(self._require(name, None))
+        while path:
+            visit = path[-1]
+            for r in visit.requires:
+                if r in visiting:
+                    cycle = [v.module.name for v in path[visiting[r]:]] + [r]
+                    raise DependencyError(
+                        f"The modules {' -> '.join(cycle)} form a cycle.",
+                    )
+                memo = self._closures.get(r)
+                if r in position:
+                    reached(visit, self._modules[r])
+                elif memo is not None and not order:
+                    # Nothing has been reached yet, so none of the memoised
+                    # closure is walked twice.
+                    order.extend(memo)
+                    position.update((m.name, i) for i, m in enumerate(memo))
+                else:
+                    enter(self._require(r, visit.module.name))
+                    break
+            else:
+                path.pop()
+                del visiting[visit.module.name]
+                reached(visit, visit.module)
+                visited = visit.module.name
+                if visit.earliest >= visit.start and visited not in self._closures:
+                    self._closures[visited] = tuple(order[visit.start:])
+                if path:
+                    path[-1].earliest = min(path[-1].earliest, visit.earliest)
+
+        return self._closures[name]
+
+    def resolve(self, modules: Iterable[Module]) -> List[Module]:
+        """
+        Order modules after everything they require.
+
+        Requirements are taken from the given modules where possible, and
+        otherwise from the registry. Given modules keep their relative order
+        unless one requires another, and each is preceded by any requirements
+        which are not already included. Modules are included once by name,
+        and the requirements of a given module are followed even when it
+        stands in for one in the registry.
+        """
+        with span("resolve"):
+            return self._resolve(list(modules))
+
+    def _resolve(self, modules: List[Module]) -> List[Module]:
+        given: Dict[str, Module] = {}
+        for m in modules:
+            given.setdefault(m.name, m)
+
+        result: List[Module] = []
+        included: Set[str] = set()
+        # The modules being visited, with the requirements left to visit, and
+        # the position of each on the path by name, as in closure.
+        path: List[Tuple[Module, Iterator[str]]] = []
+        visiting: Dict[str, int] = {}
+
+        def include(module: Module) -> None:
+            included.add(module.name)
+            result.append(module)
+
+        def enter(module: Module) -> None:
+            if module.name in visiting:
+                cycle = [m.name for m, _ in path[visiting[module.name]:]]
+                raise DependencyError(
+                    f"The modules {' -> '.join(cycle + [module.name])} form a cycle.",
+                )
+            visiting[module.name] = len(path)
+            path.append((module, iter(module.requires)))
+
+        for m in modules:
+            if m.name in included:
+                continue
+            enter(m)
+            while path:
+                module, requires = path[-1]
+                for r in requires:
+                    if r in included:
+                        continue
+                    enter(given.get(r) or self._require(r, module.name))
+                    break
+                else:
+                    path.pop()
+                    del visiting[module.name]
+                    include(module)
+
+        return result
+
+
+class _Visit:
+    """A module being visited while searching the dependency graph."""
+
+    def __init__(self, module: Module, start: int) -> None:
+        self.module = module
+        self.requires = iter(module.requires)
+        # The position in the order at which the visit started, and of the
+        # earliest module reached during it.
+        self.start = start
+        self.earliest = start
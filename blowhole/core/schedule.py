@@ -0,0 +1,242 @@
+"""Schedule building several environments in parallel."""
+
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Callable, Dict, List, Optional, Set
+
+from pydantic.dataclasses import dataclass
+
+from blowhole.core.environment import (
+    EnvironmentDefinition,
+    EnvironmentRecipe,
+    Origin,
+)
+from blowhole.core.exception import BlowholeException
+from blowhole.core.image import BuildRecipe, ImageName
+from blowhole.core.optimise import split_instruction
+
+
+class ScheduleException(BlowholeException):
+    """Environments cannot be scheduled to be built."""
+
+
+def normalise(image: ImageName) -> ImageName:
+    """An image name with the implicit latest tag made explicit."""
+    if image.tag is not None or image.digest is not None:
+        return image
+    return ImageName(image.repository, "latest").intern()
+
+
+def base_images(build: BuildRecipe) -> List[ImageName]:
+    """The images used as a base by each stage of a build."""
+    images = []
+    stages: Set[str] = set()
+
+    for c in build.commands:
+        instruction, args = split_instruction(c)
+        if instruction != "FROM":
+            continue
+
+        words = [w for w in args.split() if not w.startswith("--")]
+        if not words:
+            continue
+        if words[0].lower() not in stages:
+            images.append(ImageName.from_str(words[0]))
+        if len(words) >= 3 and words[1].lower() == "as":
+            stages.add(words[2].lower())
+
+    return images
+
+
+class BuildTask:
+    """
+    An environment to be built, along with the images it uses and produces.
+
+    Files copied into the environment are taken from the context directory,
+    and origins records the module and component of each build command.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        recipe: EnvironmentRecipe,
+        produces: Optional[List[ImageName]] = None,
+        context: Optional[str] = None,
+        origins: Optional[List[Origin]] = None,
+    ) -> None:
+        self.name = name
+        self.recipe = recipe
+        self.context = context
+        self.origins = origins
+        self.uses = [normalise(i) for i in base_images(recipe.build)]
+        self.produces = [
+            normalise(i) for i in produces or [] if normalise(i) not in self.uses
+        ]
+
+    @classmethod
+    def from_definition(
+        cls,
+        name: str,
+        definition: EnvironmentDefinition,
+        context: Optional[str] = None,
+    ) -> 'BuildTask':
+        """
+        Create a task from an environment definition.
+
+        The task produces the image resulting from the last of its components
+        which is run, unless it is used as a base.
+        """
+        image = definition.image
+        return cls(
+            name,
+            definition.recipe,
+            [] if image is None else [image],
+            context,
+            definition.origins,
+        )
+
+
+def dependencies(tasks: List[BuildTask]) -> List[Set[int]]:
+    """
+    The indices of the tasks which each task depends on.
+
+    A task depends on another if it uses an image as a base which the other
+    task produces. Raises a ScheduleException if the dependencies are cyclic.
+    """
+    producers: Dict[ImageName, int] = {}
+    for i, t in enumerate(tasks):
+        for image in t.produces:
+            if image in producers and producers[image] != i:
+                raise ScheduleException(
+                    f"Both {tasks[producers[image]].name} and {t.name} produce {image}.",
+                )
+            producers[image] = i
+
+    deps = [
+        {producers[image] for image in t.uses if image in producers}
+        for t in tasks
+    ]
+
+    # Kahn's algorithm, to check that every task can eventually be built.
+    remaining = [len(d) for d in deps]
+    dependents: List[List[int]] = [[] for _ in tasks]
+    for i, d in enumerate(deps):
+        for j in d:
+            dependents[j].append(i)
+
+    ready = [i for i, n in enumerate(remaining) if n == 0]
+    ordered = 0
+    while ready:
+        i = ready.pop()
+        ordered += 1
+        for j in dependents[i]:
+            remaining[j] -= 1
+            if remaining[j] == 0:
+                ready.append(j)
+
+    if ordered != len(tasks):
+        cyclic = ", ".join(t.name for t, n in zip(tasks, remaining) if n)
+        raise ScheduleException(f"Cyclic dependencies between {cyclic}.")
+
+    return deps
+
+
+BUILT = "built"
+CACHED = "cached"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class BuildOutcome:
+    """The outcome of a scheduled build."""
+
+    name: str
+    status: str
+    duration: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """Was the environment built successfully."""
+        return self.status in (BUILT, CACHED)
+
+
+def run_builds(
+    tasks: List[BuildTask],
+    build: Callable[[BuildTask], bool],
+    jobs: int = 1,
+    keep_going: bool = False,
+    on_outcome: Optional[Callable[[BuildOutcome], None]] = None,
+) -> List[BuildOutcome]:
+    """
+    Build tasks on a pool of worker threads, respecting their dependencies.
+
+    The build function builds a single task, returning whether the image was
+    already cached. Once a build fails, nothing that depends on it is built,
+    and unless keep_going is set no further builds are started at all. Every
+    task which is not built is reported as skipped.
+
+    Returns the outcome of each task, in the order that the tasks were given.
+    """
+    deps = dependencies(tasks)
+    outcomes: List[Optional[BuildOutcome]] = [None for _ in tasks]
+    waiting = set(range(len(tasks)))
+    failed = False
+
+    def run(i: int) -> BuildOutcome:
+        start = time.monotonic()
+        try:
+            cached = build(tasks[i])
+        except Exception as e:
+            return BuildOutcome(tasks[i].name, FAILED, time.monotonic() - start, str(e))
+        return BuildOutcome(
+            tasks[i].name,
+            CACHED if cached else BUILT,
+            time.monotonic() - start,
+        )
+
+    def finish(i: int, outcome: BuildOutcome) -> None:
+        outcomes[i] = outcome
+        if on_outcome is not None:
+            on_outcome(outcome)
+
+    jobs = max(jobs, 1)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running: Dict[Future[BuildOutcome], int] = {}
+
+        while waiting or running:
+            for i in sorted(waiting):
+                # Builds are only submitted once a worker is free, so that
+                # nothing is left queued to start after a failure.
+                if (failed and not keep_going) or len(running) >= jobs:
+                    break
+                states = [outcomes[j] for j in deps[i]]
+                if any(s is not None and not s.ok for s in states):
+                    waiting.remove(i)
+                    finish(i, BuildOutcome(
+                        tasks[i].name, SKIPPED, error="A dependency was not built.",
+                    ))
+                elif all(s is not None for s in states):
+                    waiting.remove(i)
+                    running[pool.submit(run, i)] = i
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                finish(running.pop(future), outcome)
+                failed = failed or not outcome.ok
+
+    for i in sorted(waiting):
+        finish(i, BuildOutcome(tasks[i].name, SKIPPED, error="The build was stopped."))
+
+    return [o for o in outcomes if o is not None]
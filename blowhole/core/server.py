@@ -0,0 +1,278 @@
+"""
+A server which keeps configuration loaded between commands.
+
+Environment definitions, module registries and the dockerfiles generated from
+them are kept in memory, and are reused for as long as the files they were
+loaded from are unchanged. Commands forwarded to the server then skip parsing,
+validation and composing recipes entirely.
+"""
+
+import os
+import socket
+import socketserver
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    cast,
+)
+
+from blowhole import __version__
+from blowhole.core.cache import ConfigCache
+from blowhole.core.client import (
+    Message,
+    ServerError,
+    default_socket_path,
+    receive_message,
+    send_message,
+)
+from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+from blowhole.core.loader import DEFAULT_LOADER, LoaderMode
+from blowhole.core.optimise import optimise
+from blowhole.core.resolve import ModuleRegistry
+
+T = TypeVar('T')
+
+Signature = Tuple[Tuple[int, int, int], ...]
+
+
+def signature(paths: List[str]) -> Signature:
+    """
+    Identify the current version of some files.
+
+    The inode, size and modification time of each file are used, so that a
+    file which is replaced or edited in place has a different signature.
+    """
+    result = []
+    for path in paths:
+        st = os.stat(path)
+        result.append((st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(result)
+
+
+WARM_STORE_SIZE = 256
+
+
+class WarmStore:
+    """
+    Objects loaded from files, which are kept until the files change.
+
+    The files an object was loaded from are checked with stat each time it is
+    used, which is far cheaper than reading them. Each object is loaded by one
+    request at a time, while other objects are loaded concurrently. At most
+    size objects are kept, and the least recently used are discarded first.
+    """
+
+    def __init__(self, size: int = WARM_STORE_SIZE) -> None:
+        self.size = size
+        # Entries are ordered from least to most recently used.
+        self._entries: Dict[Hashable, Tuple[Signature, object]] = {}
+        # The lock for loading each object, and how many requests are using it,
+        # which is discarded once no request is.
+        self._loading: Dict[Hashable, Tuple[threading.Lock, int]] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, paths: List[str], load: Callable[[], T]) -> T:
+        """Fetch an object, loading it again if any of its files have changed."""
+        with self._lock:
+            lock, users = self._loading.get(key) or (threading.Lock(), 0)
+            self._loading[key] = (lock, users + 1)
+        try:
+            with lock:
+                return self._get(key, paths, load)
+        finally:
+            with self._lock:
+                lock, users = self._loading[key]
+                if users == 1:
+                    del self._loading[key]
+                else:
+                    self._loading[key] = (lock, users - 1)
+
+    def _get(self, key: Hashable, paths: List[str], load: Callable[[], T]) -> T:
+        current = signature(paths)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] == current:
+                self._entries[key] = entry
+                return cast(T, entry[1])
+
+        obj = load()
+        with self._lock:
+            self.loads += 1
+            self._entries[key] = (current, obj)
+            while len(self._entries) > self.size:
+                del self._entries[next(iter(self._entries))]
+        return obj
+
+    def definition(
+        self,
+        path: str,
+        name: Optional[str] = None,
+        loader: LoaderMode = DEFAULT_LOADER,
+        cache: Optional[ConfigCache] = None,
+    ) -> Optional[EnvironmentDefinition]:
+        """
+        The environment defined in a file, or the one with the given name.
+
+        Returns None if there is no environment with that name.
+        """
+        def load() -> Optional[EnvironmentDefinition]:
+            with open(path, encoding="utf-8") as fp:
+                if name is None:
+                    return EnvironmentDefinition.load_from_file(
+                        fp, cache=cache, loader=loader,
+                    )
+                return EnvironmentDefinition.load_named_from_file(fp, name, loader)
+
+        return self.get(("definition", path, name, loader), [path], load)
+
+    def registry(self, path: str, loader: LoaderMode = DEFAULT_LOADER) -> ModuleRegistry:
+        """The registry of modules in a file."""
+        def load() -> ModuleRegistry:
+            with open(path, encoding="utf-8") as fp:
+                return ModuleRegistry.load_from_file(fp, loader)
+
+        return self.get(("registry", path, loader), [path], load)
+
+    def dockerfile(
+        self,
+        path: str,
+        name: Optional[str] = None,
+        registry: Optional[str] = None,
+        loader: LoaderMode = DEFAULT_LOADER,
+        optimised: bool = False,
+        cache: Optional[ConfigCache] = None,
+    ) -> Optional[Tuple[str, int]]:
+        """
+        The dockerfile for an environment, as the env df command.
+
+        Returns the dockerfile and the number of layers optimised away, or
+        None if there is no environment with that name.
+        """
+        def load() -> Optional[Tuple[str, int]]:
+            env = self.definition(path, name, loader, cache)
+            if env is None:
+                return None
+            if registry is not None:
+                env = env.resolve(self.registry(registry, loader))
+
+            recipe = env.recipe
+            saved = 0
+            if optimised:
+                build, saved = optimise(recipe.build)
+                recipe = EnvironmentRecipe(build=build, run=recipe.run, name=recipe.name)
+            return recipe.dockerfile_str, saved
+
+        paths = [path] if registry is None else [path, registry]
+        key = ("dockerfile", path, name, registry, loader, optimised)
+        return self.get(key, paths, load)
+
+
+def _string(message: Message, key: str) -> Optional[str]:
+    value = message.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ServerError(f"{key} must be a string.")
+    return value
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Handles commands forwarded from the CLI, using a warm store.
+
+    The server listens on a unix socket which only the current user can
+    connect to. Each connection is handled in its own thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        store: Optional[WarmStore] = None,
+    ) -> None:
+        self.socket_path = socket_path or default_socket_path()
+        self.store = store or WarmStore()
+        _remove_stale_socket(self.socket_path)
+
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.socket_path, _Handler)  # type: ignore
+        finally:
+            os.umask(umask)
+
+    def server_close(self) -> None:
+        """Stop listening, and remove the socket."""
+        super().server_close()
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def respond(self, message: Message) -> Message:
+        """Run the command in a request, returning the response."""
+        response: Message
+        if message.get("version") != __version__:
+            response = {"error": f"The server is running blowhole {__version__}."}
+        else:
+            try:
+                response = self._run(message)
+            except Exception as e:
+                # Any failure is reported to the client, rather than stopping
+                # the server.
+                response = {"error": str(e) or type(e).__name__}
+        response["version"] = __version__
+        return response
+
+    def _run(self, message: Message) -> Message:
+        command = message.get("command")
+        if command == "ping":
+            return {"pid": os.getpid(), "entries": len(self.store)}
+        elif command == "stop":
+            # Shutting down waits for requests to finish, including this one.
+            threading.Thread(target=self.shutdown).start()
+            return {}
+        elif command == "df":
+            envdef = _string(message, "envdef")
+            if envdef is None:
+                raise ServerError("No environment definition file was given.")
+            result = self.store.dockerfile(
+                envdef,
+                name=_string(message, "name"),
+                registry=_string(message, "registry"),
+                loader=LoaderMode(message.get("loader", DEFAULT_LOADER.value)),
+                optimised=bool(message.get("optimise")),
+                cache=ConfigCache() if message.get("cache", True) else None,
+            )
+            if result is None:
+                return {"dockerfile": None}
+            return {"dockerfile": result[0], "saved": result[1]}
+        raise ServerError(f"Unknown command {command}.")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        message = receive_message(self.request)
+        if message is not None:
+            send_message(self.request, cast(Server, self.server).respond(message))
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Remove a socket left behind by a server which has stopped."""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            os.remove(path)
+            return
+    raise ServerError(f"A blowhole server is already running at {path}.")
@@ -0,0 +1,68 @@
+"""Templates for parameterising modules."""
+
+import re
+from functools import lru_cache
+from typing import List, Mapping, Tuple
+
+from blowhole.core.exception import BlowholeException
+
+PARAMETER = re.compile(r"{{\s*([A-Za-z_][A-Za-z0-9_.-]*)\s*}}")
+
+# A backslash before the braces of a placeholder makes them literal text.
+_TOKEN = re.compile(r"\\{{|" + PARAMETER.pattern)
+
+
+class TemplateError(BlowholeException):
+    """A template is invalid or cannot be filled in."""
+
+
+class Template:
+    """
+    A string with {{ parameter }} placeholders, compiled for substitution.
+
+    The string is split into the literal text between placeholders, and the
+    names of the parameters in between, so that filling in the template only
+    joins strings together. Braces which are not a placeholder, such as Go
+    templates like {{.Id}}, are literal text, as are the braces of a
+    placeholder after a backslash.
+    """
+
+    def __init__(self, literals: Tuple[str, ...], names: Tuple[str, ...]) -> None:
+        self.literals = literals
+        self.names = names
+
+    def substitute(self, values: Mapping[str, str]) -> str:
+        """Fill in the template. Every parameter must have a value."""
+        if not self.names:
+            return self.literals[0]
+        parts = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            parts.append(values[name])
+            parts.append(literal)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=4096)
+def compile_template(text: str) -> Template:
+    """
+    Compile a template string.
+
+    Compiled templates are cached, so a string is only parsed once however
+    many times it is used.
+    """
+    literals: List[str] = []
+    names: List[str] = []
+    literal: List[str] = []
+    end = 0
+    for m in _TOKEN.finditer(text):
+        literal.append(text[end:m.start()])
+        end = m.end()
+        if m.group(1) is None:
+            literal.append("{{")
+        else:
+            literals.append("".join(literal))
+            names.append(m.group(1))
+            literal = []
+    literal.append(text[end:])
+    literals.append("".join(literal))
+    return Template(tuple(literals), tuple(names))
@@ -0,0 +1,163 @@
+"""
+Trace the time spent in each phase of blowhole.
+
+Phases such as parsing, validation, composing recipes, rendering Dockerfiles
+and calls to docker are wrapped in spans. When a span finishes it is passed
+to each hook which has been added, so library users can record spans however
+they like. When there are no hooks, spans record nothing.
+
+Spans nest within the spans which are open in the same thread when they
+start. Coroutines running concurrently on one thread may be given each
+other's spans as parents.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, TextIO
+
+# Only CPython counts memory blocks.
+_allocated_blocks: Callable[[], int] = getattr(sys, "getallocatedblocks", lambda: 0)
+
+
+class Span:
+    """
+    A phase of work, timed from when it starts until it finishes.
+
+    Blocks is the net number of memory blocks allocated during the span, which
+    is cheap enough to count for every span, unlike the memory allocated.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        attributes: Dict[str, object],
+        parent: Optional['Span'] = None,
+    ) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.depth: int = 0 if parent is None else parent.depth + 1
+        self.thread = threading.get_ident()
+        self.duration = 0.0
+        self.blocks = 0
+        self._blocks = _allocated_blocks()
+        self.start = time.perf_counter()
+
+    def finish(self) -> None:
+        """Record the end of the span."""
+        self.duration = time.perf_counter() - self.start
+        self.blocks = _allocated_blocks() - self._blocks
+
+
+SpanHook = Callable[[Span], None]
+
+_hooks: List[SpanHook] = []
+
+_local = threading.local()
+
+
+def add_hook(hook: SpanHook) -> None:
+    """Call a function with every span as it finishes."""
+    global _hooks
+    # Hooks are replaced rather than modified, so that spans finishing in
+    # other threads can iterate over them safely.
+    _hooks = _hooks + [hook]
+
+
+def remove_hook(hook: SpanHook) -> None:
+    """Stop calling a function with spans."""
+    global _hooks
+    _hooks = [h for h in _hooks if h != hook]
+
+
+def _open_spans() -> List[Span]:
+    spans: Optional[List[Span]] = getattr(_local, "spans", None)
+    if spans is None:
+        spans = _local.spans = []
+    return spans
+
+
+@contextmanager
+def span(name: str, **attributes: object) -> Iterator[Optional[Span]]:
+    """
+    Trace a phase of work, which runs inside the with block.
+
+    The span is given to the block, so that it can add attributes, or None
+    if nothing is being traced.
+    """
+    hooks = _hooks
+    if not hooks:
+        yield None
+        return
+
+    spans = _open_spans()
+    s = Span(name, attributes, spans[-1] if spans else None)
+    spans.append(s)
+    try:
+        yield s
+    finally:
+        s.finish()
+        # Spans usually finish in order, except in concurrent coroutines.
+        for i in range(len(spans) - 1, -1, -1):
+            if spans[i] is s:
+                del spans[i]
+                break
+        for hook in hooks:
+            hook(s)
+
+
+class TraceRecorder:
+    """
+    A hook which records spans, and writes them as a JSON trace.
+
+    The trace is in the Trace Event Format, so it can be viewed with
+    chrome://tracing or Perfetto.
+    """
+
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def __call__(self, span: Span) -> None:
+        """Record a span."""
+        self.spans.append(span)
+
+    def events(self) -> List[Dict[str, object]]:
+        """A trace event for each span, in the order that they started."""
+        pid = os.getpid()
+        return [
+            {
+                "name": s.name,
+                "cat": "blowhole",
+                "ph": "X",
+                "ts": (s.start - self.origin) * 1e6,
+                "dur": s.duration * 1e6,
+                "pid": pid,
+                "tid": s.thread,
+                "args": dict(s.attributes, blocks=s.blocks),
+            }
+            for s in sorted(self.spans, key=lambda s: s.start)
+        ]
+
+    def write(self, fp: TextIO) -> None:
+        """Write the trace to a file."""
+        json.dump(
+            {"traceEvents": self.events(), "displayTimeUnit": "ms"},
+            fp,
+            default=str,
+        )
+
+
+@contextmanager
+def recording() -> Iterator[TraceRecorder]:
+    """Record the spans which finish within the with block."""
+    recorder = TraceRecorder()
+    add_hook(recorder)
+    try:
+        yield recorder
+    finally:
+        remove_hook(recorder)
@@ -0,0 +1,171 @@
+"""
+Regenerate a dockerfile as its definition and modules are edited.
+
+Files are polled with stat, and only the files which have changed are parsed
+again. Only the modules which have changed are validated again, and the rest
+are kept, so the recipe composed from them is reused, and only the modules
+after the first one which changed are composed again.
+"""
+
+import os
+import stat
+import tempfile
+from functools import partial
+from typing import Dict, Optional, Tuple
+
+from blowhole.core.config import parse, parse_all
+from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+from blowhole.core.exception import BlowholeException
+from blowhole.core.loader import DEFAULT_LOADER, LoaderMode
+from blowhole.core.module import Module
+from blowhole.core.optimise import optimise
+from blowhole.core.resolve import ModuleRegistry
+from blowhole.core.server import Signature, WarmStore, signature
+
+
+class WatchError(BlowholeException):
+    """A watched dockerfile cannot be generated."""
+
+
+class DockerfileWatcher:
+    """
+    Generates the dockerfile for an environment, again whenever its files change.
+
+    The environment is loaded from a definition file, and its requirements
+    are resolved from a registry file, if one is given. When a file is loaded
+    again, only the modules whose data has changed are validated again, and
+    the rest are kept.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: Optional[str] = None,
+        registry: Optional[str] = None,
+        loader: LoaderMode = DEFAULT_LOADER,
+        optimised: bool = False,
+    ) -> None:
+        self.path = path
+        self.name = name
+        self.registry = registry
+        self.loader = loader
+        self.optimised = optimised
+        self.paths = [path] if registry is None else [path, registry]
+        self.environment: Optional[EnvironmentDefinition] = None
+        self.dockerfile: Optional[str] = None
+        self.saved = 0
+        self._store = WarmStore()
+        self._signature: Optional[Signature] = None
+        # The data each module was last validated from, by name.
+        self._modules: Dict[str, Tuple[object, Module]] = {}
+
+    def poll(self) -> Optional[str]:
+        """
+        Generate the dockerfile again if any of the files have changed.
+
+        Returns the dockerfile if it is different to the previous one, or None
+        if it is the same. Files which cannot be loaded raise an exception,
+        once, and are not loaded again until they change.
+        """
+        current = signature(self.paths)
+        if current == self._signature:
+            return None
+        self._signature = current
+
+        env = self._store.get(("definition",), [self.path], self._load_definition)
+        path = self.registry
+        if path is not None:
+            registry = self._store.get(
+                ("registry",), [path], partial(self._load_registry, path),
+            )
+            env = env.resolve(registry)
+        if self.environment is not None and "_recipe_cache" not in env.__dict__:
+            # Modules which are unchanged are the same objects, so the recipe
+            # composed from them is extended rather than composed again.
+            cache = self.environment.__dict__.get("_recipe_cache")
+            if cache is not None:
+                env.__dict__["_recipe_cache"] = cache
+        self.environment = env
+
+        recipe = env.recipe
+        if self.optimised:
+            build, self.saved = optimise(recipe.build)
+            recipe = EnvironmentRecipe(build=build, run=recipe.run, name=recipe.name)
+
+        dockerfile = recipe.dockerfile_str
+        if dockerfile == self.dockerfile:
+            return None
+        self.dockerfile = dockerfile
+        return dockerfile
+
+    def _module(self, data: object) -> Module:
+        """The module for some data, validating it only if it has changed."""
+        name = data.get("name") if isinstance(data, dict) else None
+        previous = self._modules.get(name) if isinstance(name, str) else None
+        if previous is not None and previous[0] == data:
+            return previous[1]
+
+        module = Module.validate(data)
+        self._modules[module.name] = (data, module)
+        return module
+
+    def _load_definition(self) -> EnvironmentDefinition:
+        with open(self.path, encoding="utf-8") as fp:
+            if self.name is None:
+                data = parse(fp.read(), self.loader)
+            else:
+                data = next(
+                    (
+                        d for d in parse_all(fp, self.loader)
+                        if isinstance(d, dict) and d.get("name") == self.name
+                    ),
+                    None,
+                )
+                if data is None:
+                    raise WatchError(
+                        f"No environment named '{self.name}' in {self.path}.",
+                    )
+
+        if not isinstance(data, dict) or not isinstance(data.get("modules"), list):
+            return EnvironmentDefinition.validate(data)
+        modules = [self._module(m) for m in data["modules"]]
+        env = EnvironmentDefinition.validate(dict(data, modules=[]))
+        env.modules = modules
+        return env
+
+    def _load_registry(self, path: str) -> ModuleRegistry:
+        with open(path, encoding="utf-8") as fp:
+            return ModuleRegistry(self._module(d) for d in parse_all(fp, self.loader))
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """
+    Write a file, unless it already has the content.
+
+    The file is replaced atomically, so it is never seen half written, and
+    keeps its permissions. Returns whether the file was written.
+    """
+    path = os.path.realpath(path)
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(path),
+        prefix=f".{os.path.basename(path)}.",
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return True
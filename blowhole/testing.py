@@ -0,0 +1,331 @@
+"""
+Testing utilities for blowhole.
+
+FakeDaemon is a stand-in for the docker daemon, which serves a small subset of
+the Docker Engine API over a local unix socket. It keeps images in memory, and
+records every request made to it, so that code using docker can be tested
+without a docker installation.
+"""
+
+import hashlib
+import io
+import json
+import os
+import socketserver
+import tarfile
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+API_VERSION = "1.40"
+
+
+class FakeImage:
+    """An image stored by the fake daemon."""
+
+    def __init__(
+        self,
+        dockerfile: str,
+        tags: List[str],
+        labels: Dict[str, str],
+        context: Optional[Dict[str, bytes]] = None,
+    ) -> None:
+        self.dockerfile = dockerfile
+        self.tags = tags
+        self.labels = labels
+        self.context = context or {}
+        digest = hashlib.sha256(dockerfile.encode("utf-8"))
+        digest.update(json.dumps(labels, sort_keys=True).encode("utf-8"))
+        self.id = "sha256:" + digest.hexdigest()
+
+    def summary(self) -> Dict[str, object]:
+        """The image as it is listed by the Engine API."""
+        return {
+            "Id": self.id,
+            "RepoTags": self.tags,
+            "Labels": self.labels,
+            "Size": len(self.dockerfile),
+        }
+
+    def inspect(self) -> Dict[str, object]:
+        """The image as it is inspected by the Engine API."""
+        return {
+            "Id": self.id,
+            "RepoTags": self.tags,
+            "Config": {"Labels": self.labels},
+            "Size": len(self.dockerfile),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def _read_body(self) -> bytes:
+        if str(self.headers.get("Transfer-Encoding", "")).lower() == "chunked":
+            body = io.BytesIO()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body.write(self.rfile.read(size))
+                self.rfile.readline()
+            return body.getvalue()
+        return self.rfile.read(int(str(self.headers.get("Content-Length", "0"))))
+
+    def _send(self, status: int, body: object) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, messages: List[Dict[str, object]]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for m in messages:
+            data = json.dumps(m).encode("utf-8") + b"\r\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _route(self, method: str) -> None:
+        url = urlsplit(self.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        if parts and parts[0].startswith("v1."):
+            parts = parts[1:]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._read_body()
+
+        daemon = self.server.daemon
+        with daemon.lock:
+            daemon.requests.append((method, "/" + "/".join(parts)))
+        daemon.handle(self, method, parts, query, body)
+
+    def do_GET(self) -> None:
+        self._route("GET")
+
+    def do_HEAD(self) -> None:
+        self._route("HEAD")
+
+    def do_POST(self) -> None:
+        self._route("POST")
+
+    def do_DELETE(self) -> None:
+        self._route("DELETE")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: "FakeDaemon") -> None:
+        self.daemon = daemon
+        super().__init__(path, _Handler)  # type: ignore
+
+
+class FakeDaemon:
+    """
+    A fake docker daemon listening on a unix socket.
+
+    Use it as a context manager, and connect to it using base_url. Builds
+    succeed unless the Dockerfile contains a ``RUN false`` instruction, or
+    copies a file which is missing from the build context.
+
+    Each step is reported as using the cache when an earlier build ran the
+    same steps, and base images which have not been seen before are pulled
+    in a single layer of PULL_SIZE bytes.
+    """
+
+    PULL_SIZE = 1024
+
+    def __init__(self) -> None:
+        self.images: Dict[str, FakeImage] = {}
+        self.layers: Set[str] = set()
+        self.pulled: Set[str] = set()
+        self.requests: List[Tuple[str, str]] = []
+        self.lock = threading.Lock()
+        self._dir: Optional[tempfile.TemporaryDirectory[str]] = None
+        self._server: Optional[_Server] = None
+
+    @property
+    def socket_path(self) -> str:
+        """The path to the daemon's socket."""
+        if self._dir is None:
+            raise RuntimeError("The fake daemon is not running.")
+        return os.path.join(self._dir.name, "docker.sock")
+
+    @property
+    def base_url(self) -> str:
+        """The URL used to connect to the daemon."""
+        return f"unix://{self.socket_path}"
+
+    def start(self) -> None:
+        """Start serving requests in a background thread."""
+        self._dir = tempfile.TemporaryDirectory()
+        self._server = _Server(self.socket_path, self)
+        threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        ).start()
+
+    def stop(self) -> None:
+        """Stop serving requests and remove the socket."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._dir is not None:
+            self._dir.cleanup()
+            self._dir = None
+
+    def __enter__(self) -> "FakeDaemon":
+        self.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+    def count(self, method: str, path: str) -> int:
+        """The number of requests made to an endpoint."""
+        with self.lock:
+            return self.requests.count((method, path))
+
+    def find(self, name: str) -> Optional[FakeImage]:
+        """Find an image by ID, short ID or tag."""
+        if ":" not in name and not name.startswith("sha256"):
+            name += ":latest"
+        for image in self.images.values():
+            if name in image.tags or image.id in (name, "sha256:" + name):
+                return image
+        return None
+
+    def handle(
+        self,
+        request: _Handler,
+        method: str,
+        parts: List[str],
+        query: Dict[str, str],
+        body: bytes,
+    ) -> None:
+        """Respond to a request."""
+        if parts == ["_ping"]:
+            request._send(200, "OK")
+        elif parts == ["version"]:
+            request._send(200, {"ApiVersion": API_VERSION, "Version": "fake"})
+        elif method == "GET" and parts == ["images", "json"]:
+            request._send(200, self.list_images(query))
+        elif method == "POST" and parts == ["build"]:
+            request._send_stream(self.build(query, body))
+        elif method == "GET" and parts[:1] == ["images"] and parts[-1:] == ["json"]:
+            image = self.find("/".join(parts[1:-1]))
+            if image is None:
+                request._send(404, {"message": "No such image"})
+            else:
+                request._send(200, image.inspect())
+        elif method == "POST" and parts[:1] == ["images"] and parts[-1:] == ["tag"]:
+            image = self.find("/".join(parts[1:-1]))
+            if image is None:
+                request._send(404, {"message": "No such image"})
+            else:
+                tag = f"{query['repo']}:{query.get('tag') or 'latest'}"
+                with self.lock:
+                    for other in self.images.values():
+                        if tag in other.tags:
+                            other.tags.remove(tag)
+                    image.tags.append(tag)
+                request._send(201, {})
+        else:
+            request._send(404, {"message": f"{method} /{'/'.join(parts)} is not faked"})
+
+    def _pull(self, name: str) -> List[Dict[str, object]]:
+        with self.lock:
+            if self.find(name) is not None or name in self.pulled:
+                return []
+            self.pulled.add(name)
+
+        layer = hashlib.sha256(name.encode("utf-8")).hexdigest()[:12]
+        half = {"current": self.PULL_SIZE // 2, "total": self.PULL_SIZE}
+        return [
+            {"status": f"Pulling from {name}", "id": "latest"},
+            {"status": "Pulling fs layer", "progressDetail": {}, "id": layer},
+            {"status": "Downloading", "progressDetail": half, "id": layer},
+            {"status": "Download complete", "progressDetail": {}, "id": layer},
+            {"status": "Pull complete", "progressDetail": {}, "id": layer},
+        ]
+
+    def list_images(self, query: Dict[str, str]) -> List[Dict[str, object]]:
+        """List images, filtered by label."""
+        filters: Dict[str, List[str]] = json.loads(query.get("filters", "{}"))
+        labels: Set[str] = set(filters.get("label", []))
+        with self.lock:
+            return [
+                i.summary()
+                for i in self.images.values()
+                if all(
+                    f in i.labels or f in (f"{k}={v}" for k, v in i.labels.items())
+                    for f in labels
+                )
+            ]
+
+    def build(self, query: Dict[str, str], context: bytes) -> List[Dict[str, object]]:
+        """Build an image from a tarred context."""
+        files: Dict[str, bytes] = {}
+        with tarfile.open(fileobj=io.BytesIO(context)) as tar:
+            for info in tar:
+                member = tar.extractfile(info)
+                files[info.name] = b"" if member is None else member.read()
+        dockerfile_name = query.get("dockerfile", "Dockerfile")
+        if dockerfile_name not in files:
+            return [{"error": "Cannot locate specified Dockerfile"}]
+        dockerfile = files.pop(dockerfile_name).decode("utf-8")
+
+        lines = [line for line in dockerfile.splitlines() if line.strip()]
+        output: List[Dict[str, object]] = []
+        for n, line in enumerate(lines, 1):
+            output.append({"stream": f"Step {n}/{len(lines)} : {line}\n"})
+            message = None
+            words = line.split()
+            layer = "\n".join(lines[:n])
+            if line.strip() == "RUN false":
+                message = f"The command '{line[4:]}' returned a non-zero code: 1"
+            elif words[0].upper() in ("COPY", "ADD") and not words[1].startswith("--"):
+                missing = [
+                    w for w in words[1:-1]
+                    if w.strip("/") not in files and not any(c in w for c in "*?[")
+                ]
+                if missing:
+                    message = f"COPY failed: {missing[0]} not found in build context"
+            if message is not None:
+                output.append({"errorDetail": {"message": message}, "error": message})
+                return output
+
+            if words[0].upper() == "FROM":
+                output.extend(self._pull(words[1]))
+            elif layer in self.layers:
+                output.append({"stream": " ---> Using cache\n"})
+            with self.lock:
+                self.layers.add(layer)
+            layer_id = hashlib.sha256(layer.encode("utf-8")).hexdigest()
+            output.append({"stream": f" ---> {layer_id[:12]}\n"})
+
+        labels: Dict[str, str] = json.loads(query.get("labels", "{}"))
+        tags = [query["t"]] if "t" in query else []
+        image = FakeImage(dockerfile, tags, labels, files)
+        with self.lock:
+            self.images[image.id] = image
+        output.append({"aux": {"ID": image.id}})
+        output.append({"stream": f"Successfully built {image.id[7:19]}\n"})
+        for t in tags:
+            output.append({"stream": f"Successfully tagged {t}\n"})
+        return output
@@ -5,7 +5,7 @@ ruamel.yaml does have type comments, but they are not very strict.
 It does not have a PEP561 marker either, so we can't use them.
 """
 from pathlib import Path
-from typing import Any, Mapping, Union, IO
+from typing import Any, Iterator, Mapping, Union, IO
 
 
 Loadable = Union[str, Path, IO[str]]
@@ -14,4 +14,6 @@ class YAML:
 
     def __init__(self, typ: str = 'safe', pure: bool = False): ...
 
-    def load(self, stream: Loadable) -> Mapping[str, Any]: ...
\ No newline at end of file
+    def load(self, stream: Loadable) -> Mapping[str, Any]: ...
+
+    def load_all(self, stream: Loadable) -> Iterator[Mapping[str, Any]]: ...
@@ -0,0 +1,45 @@
+"""Test the cache cli."""
+
+from os import path
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from blowhole.cli.cli import cli
+
+CURR_DIR = path.dirname(__file__)
+ENV_VALID = path.join(CURR_DIR, "files", "env.yaml")
+
+runner = CliRunner()
+
+
+def test_cache_populated_and_cleared(tmp_path: Path) -> None:
+    """Test that env df populates the cache and cache clear empties it."""
+    env = {"XDG_CACHE_HOME": str(tmp_path)}
+
+    result = runner.invoke(cli, args=["env", "df", ENV_VALID], env=env)
+    assert result.exit_code == 0
+    assert len(list(tmp_path.glob("blowhole/config/*.pickle"))) == 1
+
+    result = runner.invoke(cli, args=["cache", "info"], env=env)
+    assert result.exit_code == 0
+    assert "Entries: 1\n" in result.output
+
+    result = runner.invoke(cli, args=["cache", "clear"], env=env)
+    assert result.exit_code == 0
+    assert result.output == "Removed 1 cache entries.\n"
+    assert list(tmp_path.glob("blowhole/config/*.pickle")) == []
+
+
+def test_no_cache(tmp_path: Path) -> None:
+    """Test that the cache can be disabled."""
+    env = {"XDG_CACHE_HOME": str(tmp_path)}
+
+    result = runner.invoke(cli, args=["--no-cache", "env", "df", ENV_VALID], env=env)
+    assert result.exit_code == 0
+    assert list(tmp_path.glob("blowhole/config/*.pickle")) == []
+
+    env["BLOWHOLE_NO_CACHE"] = "1"
+    result = runner.invoke(cli, args=["env", "df", ENV_VALID], env=env)
+    assert result.exit_code == 0
+    assert list(tmp_path.glob("blowhole/config/*.pickle")) == []
@@ -1,5 +1,12 @@
 """Test the cli endpoint and basic commands."""
 
+import json
+import pstats
+import subprocess
+import sys
+from os import path
+from pathlib import Path
+
 from click.testing import CliRunner
 
 from blowhole import __version__
@@ -7,6 +14,8 @@ from blowhole.cli.cli import cli, version
 
 runner = CliRunner()
 
+ENV_VALID = path.join(path.dirname(__file__), "files", "env.yaml")
+
 
 def test_cli_endpoint() -> None:
     """Test that the CLI endpoint does something."""
@@ -19,3 +28,51 @@ def test_cli_version() -> None:
     result = runner.invoke(version)
     assert result.exit_code == 0
     assert result.output == f"Blowhole v{__version__}\n"
+
+
+def test_cli_lists_lazy_commands() -> None:
+    """Test that commands which are imported lazily are listed in help."""
+    result = runner.invoke(cli, ["--help"])
+    assert result.exit_code == 0
+    assert "cache" in result.output
+    assert "env" in result.output
+
+
+def test_cli_version_imports() -> None:
+    """Test that the version command does not import the rest of blowhole."""
+    script = (
+        "import sys\n"
+        "from blowhole.cli import cli\n"
+        "cli(['version'], standalone_mode=False)\n"
+        "heavy = ['pydantic', 'ruamel.yaml', 'blowhole.cli.env']\n"
+        "print([m for m in heavy if m in sys.modules])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    assert result.stdout.splitlines() == [f"Blowhole v{__version__}", "[]"]
+
+
+def test_cli_trace(tmp_path: Path) -> None:
+    """Test writing a trace of a command."""
+    trace = tmp_path / "trace.json"
+    result = runner.invoke(
+        cli, ["--no-cache", "--no-server", "--trace", str(trace), "env", "df", ENV_VALID],
+    )
+    assert result.exit_code == 0
+
+    events = json.loads(trace.read_text())["traceEvents"]
+    assert [e["name"] for e in events] == ["parse", "validate", "compose", "render"]
+
+
+def test_cli_profile(tmp_path: Path) -> None:
+    """Test writing a profile of a command."""
+    profile = tmp_path / "bh.prof"
+    result = runner.invoke(cli, ["--profile", str(profile), "env", "df", ENV_VALID])
+    assert result.exit_code == 0
+
+    stats = pstats.Stats(str(profile))
+    assert any(name == "df" for _, _, name in stats.stats)  # type: ignore
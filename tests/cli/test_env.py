@@ -1,13 +1,24 @@
 """Test the env cli."""
 
-from os import path
+import json
+import signal
+import subprocess
+import sys
+import time
+from os import devnull, path
+from pathlib import Path
+from typing import List, Tuple
 
-from click.testing import CliRunner
+from click.testing import CliRunner, Result
 
-from blowhole.cli.env import df, env
+from blowhole.cli.cli import cli
+from blowhole.cli.env import build, df, env
+from blowhole.core.config import parse, parse_all
+from blowhole.testing import API_VERSION, FakeDaemon
 
 CURR_DIR = path.dirname(__file__)
 ENV_VALID = path.join(CURR_DIR, "files", "env.yaml")
+ENV_JSON = path.join(CURR_DIR, "files", "env.json")
 
 runner = CliRunner()
 
@@ -25,4 +36,306 @@ def test_env_df() -> None:
     assert result.exit_code == 0
     assert result.output == "FROM ubuntu\n" \
         "RUN apt update && apt install zsh\n" \
-        "CMD zsh\n\n"
+        "CMD zsh\n"
+
+
+def test_env_df_loaders() -> None:
+    """Test that each loader produces the same dockerfile."""
+    expected = runner.invoke(df, args=str(ENV_VALID)).output
+
+    for loader in ("rt", "safe", "c"):
+        result = runner.invoke(
+            cli, args=["--no-cache", "--loader", loader, "env", "df", ENV_VALID],
+        )
+        assert result.exit_code == 0
+        assert result.output == expected
+
+    result = runner.invoke(
+        cli, args=["--no-cache", "--loader", "json", "env", "df", ENV_JSON],
+    )
+    assert result.exit_code == 0
+    assert result.output == expected
+
+
+ENV_MULTI = path.join(CURR_DIR, "files", "env_multi.yaml")
+
+
+def test_env_df_name() -> None:
+    """Test choosing an environment from a multi-document file."""
+    result = runner.invoke(df, args=[ENV_MULTI, "--name", "first"])
+    assert result.exit_code == 0
+    assert result.output == "FROM ubuntu\n"
+
+    result = runner.invoke(df, args=[ENV_MULTI, "-n", "missing"])
+    assert result.exit_code == 1
+    assert "No environment named 'missing'" in result.output
+
+
+def test_env_df_output(tmp_path: Path) -> None:
+    """Test writing the dockerfile to a file."""
+    output = tmp_path / "Dockerfile"
+
+    result = runner.invoke(df, args=[ENV_VALID, "-o", str(output)])
+    assert result.exit_code == 0
+    assert result.output == ""
+    assert output.read_text() == runner.invoke(df, args=[ENV_VALID]).output
+
+
+def test_env_df_optimise(tmp_path: Path) -> None:
+    """Test optimising the generated dockerfile."""
+    output = tmp_path / "Dockerfile"
+    result = runner.invoke(df, args=[ENV_VALID, "--optimise", "-o", str(output)])
+
+    assert result.exit_code == 0
+    assert result.output == "Optimised away 0 layers.\n"
+    assert output.read_text() == runner.invoke(df, args=[ENV_VALID]).output
+
+
+REGISTRY = path.join(CURR_DIR, "files", "registry.yaml")
+ENV_REQUIRES = path.join(CURR_DIR, "files", "env_requires.yaml")
+
+
+def test_env_df_registry(tmp_path: Path) -> None:
+    """Test resolving module requirements from a registry."""
+    result = runner.invoke(df, args=[ENV_REQUIRES, "--registry", REGISTRY])
+    assert result.exit_code == 0
+    assert result.output == (
+        "FROM ubuntu\n"
+        "RUN apt install python3\n"
+        "RUN pip install app\n"
+    )
+
+    registry = tmp_path / "registry.yaml"
+    registry.write_text("name: ubuntu\ncomponents: []\n")
+    result = runner.invoke(df, args=[ENV_REQUIRES, "--registry", str(registry)])
+    assert result.exit_code == 1
+    assert "The module app requires python, which is not defined." in result.output
+
+
+def test_env_df_json_documents(tmp_path: Path) -> None:
+    """Test reading several pretty-printed JSON documents with the json loader."""
+    def invoke(*args: str) -> Result:
+        return runner.invoke(cli, args=["--no-cache", "--loader", "json", *args])
+
+    with open(ENV_JSON) as fp:
+        environment = json.load(fp)
+    envs = tmp_path / "envs.json"
+    envs.write_text(json.dumps([dict(environment, name="other"), environment], indent=2))
+    expected = runner.invoke(df, args=[ENV_VALID]).output
+
+    result = invoke("env", "df", ENV_JSON, "--name", environment["name"])
+    assert result.exit_code == 0
+    assert result.output == expected
+    result = invoke("env", "df", str(envs), "--name", environment["name"])
+    assert result.exit_code == 0
+    assert result.output == expected
+
+    result = invoke("env", "df", ENV_JSON, "--name", "x")
+    assert result.exit_code == 1
+    assert f"No environment named 'x' in {ENV_JSON}." in result.output
+
+    with open(REGISTRY) as fp:
+        modules = list(parse_all(fp))
+    registry = tmp_path / "registry.json"
+    registry.write_text(json.dumps(modules, indent=2))
+    requires = tmp_path / "env_requires.json"
+    with open(ENV_REQUIRES) as fp:
+        requires.write_text(json.dumps(parse(fp.read()), indent=2))
+    result = invoke("env", "df", str(requires), "--registry", str(registry))
+    assert result.exit_code == 0
+    assert result.output == runner.invoke(
+        df, args=[ENV_REQUIRES, "--registry", REGISTRY],
+    ).output
+
+    invalid = tmp_path / "invalid.json"
+    invalid.write_text('{"modules": [}\n')
+    commands: List[Tuple[str, ...]] = [
+        ("env", "df", str(invalid)),
+        ("env", "df", str(invalid), "--name", "x"),
+        ("env", "df", ENV_JSON, "--registry", str(invalid)),
+        ("env", "build", str(invalid)),
+    ]
+    for args in commands:
+        result = invoke(*args)
+        assert result.exit_code == 1
+        assert "Error: Invalid JSON" in result.output
+
+
+ENV_PARAMETERS = path.join(CURR_DIR, "files", "env_parameters.yaml")
+
+
+def test_env_df_parameters() -> None:
+    """Test filling in module parameters."""
+    result = runner.invoke(df, args=[ENV_PARAMETERS])
+    assert result.exit_code == 0
+    assert result.output == "FROM python:3.7\nRUN pip install \n"
+
+
+ENV_BUILD_BASE = path.join(CURR_DIR, "files", "build_base.yaml")
+ENV_BUILD_APPS = path.join(CURR_DIR, "files", "build_apps.yaml")
+
+
+def test_env_build() -> None:
+    """Test building environments in dependency order."""
+    with FakeDaemon() as daemon:
+        result = runner.invoke(
+            build,
+            args=[ENV_BUILD_APPS, ENV_BUILD_BASE, "--jobs", "4", "--keep-going"],
+            env={"DOCKER_HOST": daemon.base_url, "DOCKER_API_VERSION": API_VERSION},
+        )
+
+        assert result.exit_code == 1
+        assert "built base as blowhole/base:" in result.output
+        assert "built python as blowhole/python:" in result.output
+        assert "failed broken" in result.output
+        assert "1 of 3 environments were not built." in result.output
+
+        base = daemon.find("example/base")
+        assert base is not None
+        assert "blowhole/base:" in base.tags[0]
+        assert daemon.count("POST", "/build") == 3
+        assert daemon.count("GET", "/images/json") == 1
+
+        result = runner.invoke(
+            build,
+            args=[ENV_BUILD_BASE, ENV_BUILD_APPS],
+            env={"DOCKER_HOST": daemon.base_url, "DOCKER_API_VERSION": API_VERSION},
+        )
+
+        assert result.exit_code == 1
+        assert "cached base" in result.output
+        assert daemon.count("POST", "/build") == 4
+
+
+def test_env_build_base_changed(tmp_path: Path) -> None:
+    """Test that environments are built again when their base environment changes."""
+    envdef = tmp_path / "base.yaml"
+    envdef.write_text(Path(ENV_BUILD_BASE).read_text())
+    app = tmp_path / "app.yaml"
+    app.write_text(Path(ENV_BUILD_APPS).read_text().split("---")[0])
+
+    with FakeDaemon() as daemon:
+        env = {"DOCKER_HOST": daemon.base_url, "DOCKER_API_VERSION": API_VERSION}
+
+        result = runner.invoke(build, args=[str(envdef), str(app)], env=env)
+        assert result.exit_code == 0
+        assert "built python" in result.output
+
+        result = runner.invoke(build, args=[str(envdef), str(app)], env=env)
+        assert "cached base" in result.output
+        assert "cached python" in result.output
+
+        envdef.write_text(envdef.read_text().replace("apt update", "apt upgrade"))
+        result = runner.invoke(build, args=[str(envdef), str(app)], env=env)
+        assert result.exit_code == 0
+        assert "built base" in result.output
+        assert "built python" in result.output
+        assert daemon.count("POST", "/build") == 4
+
+
+def test_env_build_events(tmp_path: Path) -> None:
+    """Test writing build events as JSON lines."""
+    events = tmp_path / "events.jsonl"
+
+    with FakeDaemon() as daemon:
+        result = runner.invoke(
+            build,
+            args=[ENV_BUILD_BASE, "--events", str(events)],
+            env={"DOCKER_HOST": daemon.base_url, "DOCKER_API_VERSION": API_VERSION},
+        )
+
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in events.read_text().splitlines()]
+    assert [e["event"] for e in lines] == [
+        "build_start",
+        "step_start", "step_end",
+        "step_start", "step_end",
+        "build_end",
+    ]
+    assert [(e["module"], e["component"]) for e in lines if "step" in e] == [
+        ("ubuntu", 0), ("ubuntu", 0), ("ubuntu", 1), ("ubuntu", 1),
+    ]
+    assert lines[2]["pulled"] == FakeDaemon.PULL_SIZE
+
+
+def test_env_build_cycle(tmp_path: Path) -> None:
+    """Test that cyclic environments are not built."""
+    envdef = tmp_path / "cycle.yaml"
+    envdef.write_text(
+        "name: a\n"
+        "modules: [{name: a, components: [\n"
+        "  {recipe: {commands: [FROM example/b]}, results: {repository: example/a}}]}]\n"
+        "---\n"
+        "name: b\n"
+        "modules: [{name: b, components: [\n"
+        "  {recipe: {commands: [FROM example/a]}, results: {repository: example/b}}]}]\n",
+    )
+
+    result = runner.invoke(build, args=[str(envdef)])
+
+    assert result.exit_code == 1
+    assert "Cyclic dependencies between a, b." in result.output
+
+
+def test_env_check(tmp_path: Path) -> None:
+    """Test checking a tree of environments and modules."""
+    (tmp_path / "envs").mkdir()
+    (tmp_path / "envs" / "env.yaml").write_text(Path(ENV_VALID).read_text())
+    (tmp_path / "registry.yaml").write_text(Path(REGISTRY).read_text())
+    (tmp_path / "other.yaml").write_text("steps: [lint]\n")
+
+    result = runner.invoke(cli, args=["env", "check", str(tmp_path), "-j", "2"])
+    assert result.exit_code == 0
+    assert "ok     " + str(tmp_path / "envs" / "env.yaml") in result.output
+    assert "(0 environments, 2 modules)" in result.output
+    assert "other.yaml" not in result.output
+    assert "Checked 2 files" in result.output
+
+    (tmp_path / "broken.yaml").write_text("name: a\nmodules: [{name: b}]\n")
+    result = runner.invoke(cli, args=["env", "check", str(tmp_path)])
+    assert result.exit_code == 1
+    assert "failed " + str(tmp_path / "broken.yaml") in result.output
+    assert "Document 0:" in result.output
+    assert "1 of 3 files are invalid." in result.output
+
+
+def _wait_for(output: Path, text: str) -> None:
+    deadline = time.monotonic() + 10
+    while not (output.exists() and output.read_text() == text):
+        assert time.monotonic() < deadline, "The dockerfile was not written."
+        time.sleep(0.05)
+
+
+def test_env_df_watch(tmp_path: Path) -> None:
+    """Test writing the dockerfile again whenever the definition changes."""
+    envdef, output = tmp_path / "env.yaml", tmp_path / "Dockerfile"
+    envdef.write_text(Path(ENV_VALID).read_text())
+    expected = runner.invoke(df, args=[ENV_VALID]).output
+
+    process = subprocess.Popen(
+        [
+            sys.executable, "-c", "from blowhole.cli import cli; cli()",
+            "--no-server", "env", "df", str(envdef), "-o", str(output),
+            "--watch", "--interval", "0.05",
+        ],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    try:
+        _wait_for(output, expected)
+
+        envdef.write_text(envdef.read_text().replace("zsh", "fish"))
+        _wait_for(output, expected.replace("zsh", "fish"))
+    finally:
+        process.send_signal(signal.SIGINT)
+        _, stderr = process.communicate(timeout=10)
+
+    assert process.returncode == 0
+    assert stderr.count("Generated the dockerfile") == 2
+
+
+def test_env_df_watch_device() -> None:
+    """Test that only files can be watched."""
+    result = runner.invoke(df, args=[devnull, "--watch"])
+    assert result.exit_code == 1
+    assert "Only files can be watched." in result.output
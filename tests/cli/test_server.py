@@ -0,0 +1,91 @@
+"""Test the server cli, and forwarding commands to the server."""
+
+import threading
+from contextlib import contextmanager
+from os import path
+from pathlib import Path
+from typing import Iterator
+
+from click.testing import CliRunner
+
+from blowhole.cli.cli import cli
+from blowhole.core.server import Server
+
+CURR_DIR = path.dirname(__file__)
+ENV_VALID = path.join(CURR_DIR, "files", "env.yaml")
+ENV_MULTI = path.join(CURR_DIR, "files", "env_multi.yaml")
+
+runner = CliRunner()
+
+
+@contextmanager
+def _serving(socket_path: str) -> Iterator[Server]:
+    server = Server(socket_path)
+    thread = threading.Thread(
+        target=server.serve_forever,
+        kwargs={"poll_interval": 0.05},
+        daemon=True,
+    )
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_df_forwarded(tmp_path: Path) -> None:
+    """Test that env df is run by the server, when one is running."""
+    socket_path = str(tmp_path / "bh.sock")
+    expected = runner.invoke(cli, ["env", "df", ENV_VALID]).output
+
+    with _serving(socket_path) as server:
+        env = {"BLOWHOLE_SOCKET": socket_path}
+        for _ in range(2):
+            result = runner.invoke(cli, ["env", "df", ENV_VALID], env=env)
+            assert result.exit_code == 0
+            assert result.output == expected
+        assert server.store.loads == 2
+
+        result = runner.invoke(cli, ["env", "df", "-n", "missing", ENV_MULTI], env=env)
+        assert result.exit_code == 1
+        assert f"No environment named 'missing' in {ENV_MULTI}." in result.output
+
+        loads = server.store.loads
+        result = runner.invoke(cli, ["--no-server", "env", "df", ENV_VALID], env=env)
+        assert result.output == expected
+        assert server.store.loads == loads
+
+
+def test_df_fallback(tmp_path: Path) -> None:
+    """Test that env df runs locally when there is no server."""
+    result = runner.invoke(
+        cli,
+        ["env", "df", ENV_VALID],
+        env={"BLOWHOLE_SOCKET": str(tmp_path / "bh.sock")},
+    )
+    assert result.exit_code == 0
+    assert result.output.startswith("FROM ubuntu\n")
+
+
+def test_server_status_stop(tmp_path: Path) -> None:
+    """Test checking on and stopping the server."""
+    socket_path = str(tmp_path / "bh.sock")
+    args = ["--socket", socket_path]
+
+    result = runner.invoke(cli, ["server", "status"] + args)
+    assert result.exit_code == 1
+    assert "No blowhole server is running" in result.output
+
+    with _serving(socket_path):
+        result = runner.invoke(cli, ["server", "status"] + args)
+        assert result.exit_code == 0
+        assert f"Running at {socket_path}" in result.output
+
+        result = runner.invoke(cli, ["server", "start"] + args)
+        assert result.exit_code == 1
+        assert "already running" in result.output
+
+        result = runner.invoke(cli, ["server", "stop"] + args)
+        assert result.exit_code == 0
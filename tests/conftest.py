@@ -0,0 +1,40 @@
+"""Configure the test session."""
+
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+_ISOLATED = ("XDG_CACHE_HOME", "XDG_RUNTIME_DIR", "BLOWHOLE_SOCKET")
+
+_saved: Dict[str, Optional[str]] = {}
+
+
+def pytest_configure(config: object) -> None:
+    """
+    Keep the tests away from the user's cache and blowhole server.
+
+    The configuration cache and the server socket are put in a temporary
+    directory for the whole session, including any subprocesses. Tests which
+    run a server give it their own socket.
+    """
+    directory = tempfile.mkdtemp(prefix="blowhole-tests-")
+    _saved.update((k, os.environ.get(k)) for k in _ISOLATED)
+    _saved["directory"] = directory
+
+    os.environ["XDG_CACHE_HOME"] = os.path.join(directory, "cache")
+    os.environ["XDG_RUNTIME_DIR"] = directory
+    os.environ["BLOWHOLE_SOCKET"] = os.path.join(directory, "blowhole.sock")
+
+
+def pytest_unconfigure(config: object) -> None:
+    """Restore the environment, and remove the temporary directory."""
+    directory = _saved.pop("directory", None)
+    for k, v in _saved.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    _saved.clear()
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1 @@
+"""Test the configuration cache."""
@@ -0,0 +1,111 @@
+"""Test the on-disk configuration cache."""
+
+import os
+from io import StringIO
+from pathlib import Path
+
+from blowhole.core.cache import ConfigCache, schema
+from blowhole.core.environment import EnvironmentDefinition
+from blowhole.core.image import ImageName
+
+CURR_DIR = os.path.dirname(__file__)
+
+ENV_VALID = os.path.join(
+    CURR_DIR, os.pardir, "environment", "files", "env_valid.yaml",
+)
+
+
+def test_cache_key() -> None:
+    """Test that keys depend on both content and class."""
+    c = ConfigCache("unused")
+
+    assert c.key(ImageName, "a") == c.key(ImageName, b"a")
+    assert c.key(ImageName, "a") != c.key(ImageName, "b")
+    assert c.key(ImageName, "a") != c.key(EnvironmentDefinition, "a")
+
+
+def test_cache_get_put(tmp_path: Path) -> None:
+    """Test storing and retrieving objects."""
+    c = ConfigCache(str(tmp_path))
+
+    assert c.get("missing") is None
+
+    c.put("k", ImageName("ubuntu", "18.04"))
+    assert c.get("k") == ImageName("ubuntu", "18.04")
+    assert len(c.entries()) == 1
+
+
+def test_cache_corrupt_entry(tmp_path: Path) -> None:
+    """Test that corrupt entries are treated as misses and removed."""
+    c = ConfigCache(str(tmp_path))
+    (tmp_path / "k.pickle").write_bytes(b"definitely not a pickle")
+
+    assert c.get("k") is None
+    assert c.entries() == []
+
+
+def test_cache_eviction(tmp_path: Path) -> None:
+    """Test that least recently used entries are evicted."""
+    c = ConfigCache(str(tmp_path))
+    c.put("a", "a" * 1000)
+    c.put("b", "b" * 1000)
+    os.utime(str(tmp_path / "a.pickle"), (1, 1))
+    os.utime(str(tmp_path / "b.pickle"), (2, 2))
+
+    c.max_size = 2500
+    c.put("c", "c" * 1000)
+
+    assert c.get("a") is None
+    assert c.get("b") is not None
+    assert c.get("c") is not None
+    assert c.size <= c.max_size
+
+
+def test_cache_clear(tmp_path: Path) -> None:
+    """Test clearing the cache."""
+    c = ConfigCache(str(tmp_path / "nonexistent"))
+    assert c.clear() == 0
+
+    c = ConfigCache(str(tmp_path))
+    c.put("a", 1)
+    c.put("b", 2)
+
+    assert c.clear() == 2
+    assert c.entries() == []
+
+
+def test_load_from_file_cached(tmp_path: Path) -> None:
+    """Test that loading through the cache returns equal models."""
+    c = ConfigCache(str(tmp_path))
+
+    with open(ENV_VALID) as fp:
+        e1 = EnvironmentDefinition.load_from_file(fp, cache=c)
+    assert len(c.entries()) == 1
+
+    with open(ENV_VALID) as fp:
+        e2 = EnvironmentDefinition.load_from_file(fp, cache=c)
+    assert len(c.entries()) == 1
+
+    assert e1 == e2
+    assert e1 is not e2
+    assert e2.recipe == e1.recipe
+
+
+def test_load_from_file_cache_hit_skips_parsing(tmp_path: Path) -> None:
+    """Test that a cached model is returned without parsing the file."""
+    c = ConfigCache(str(tmp_path))
+    content = "repository: ubuntu\ntag: '18.04'\n"
+
+    c.put(c.key(ImageName, content), ImageName("cached"))
+
+    assert ImageName.load_from_file(StringIO(content), cache=c) == ImageName("cached")
+    assert ImageName.load_from_file(StringIO(content)) == ImageName("ubuntu", "18.04")
+
+
+def test_config_cache_key_schema() -> None:
+    """Test that cache keys depend on the fields of the loaded models."""
+    assert "blowhole.core.module.Module(name:" in schema(EnvironmentDefinition)
+    assert "blowhole.core.image.ImageName" in schema(EnvironmentDefinition)
+    assert ConfigCache.key(ConfigCache(), ImageName, "a") != ConfigCache.key(
+        ConfigCache(), EnvironmentDefinition, "a",
+    )
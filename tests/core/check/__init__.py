@@ -0,0 +1 @@
+"""Test checking configuration files."""
@@ -0,0 +1,113 @@
+"""Test checking configuration files."""
+
+from pathlib import Path
+
+from blowhole.core.check import check_file, check_tree, discover
+from blowhole.core.loader import LoaderMode
+
+ENV = """\
+name: shell
+modules:
+- name: zsh
+  components:
+  - recipe:
+      commands: [FROM ubuntu]
+"""
+
+MODULES = """\
+name: ubuntu
+components:
+- recipe:
+    commands: [FROM ubuntu]
+---
+name: broken
+components:
+- recipe: {}
+  unknown: true
+"""
+
+TEMPLATED = """\
+name: shell
+modules:
+- name: python
+  components:
+  - recipe:
+      commands: ["FROM python:{{ version }}"]
+"""
+
+
+def _tree(root: Path) -> None:
+    (root / "envs").mkdir()
+    (root / "envs" / "shell.yml").write_text(ENV)
+    (root / "envs" / "templated.yaml").write_text(TEMPLATED)
+    (root / "modules.yaml").write_text(MODULES)
+    (root / "env.json").write_text(
+        '{\n  "modules": [\n    {"name": "a", "components": [{"recipe": {}}]}\n  ]\n}\n',
+    )
+    (root / "envs.jsonl").write_text(
+        '{"modules": [{"name": "a", "components": [{"recipe": {"script": []}}]}]}\n'
+        '{"name": "b", "components": [{"recipe": {}}]}\n',
+    )
+    (root / "unparseable.yml").write_text("a: [b\n")
+    (root / "other.yml").write_text("steps: [lint, test]\n")
+    (root / "notes.txt").write_text(ENV)
+    (root / ".hidden").mkdir()
+    (root / ".hidden" / "env.yml").write_text(ENV)
+
+
+def test_discover(tmp_path: Path) -> None:
+    """Test finding configuration files, skipping hidden ones."""
+    _tree(tmp_path)
+
+    paths = discover(str(tmp_path))
+
+    assert [Path(p).relative_to(tmp_path).as_posix() for p in paths] == [
+        "env.json",
+        "envs.jsonl",
+        "modules.yaml",
+        "other.yml",
+        "unparseable.yml",
+        "envs/shell.yml",
+        "envs/templated.yaml",
+    ]
+
+
+def test_check_file(tmp_path: Path) -> None:
+    """Test checking environments and modules in a file."""
+    _tree(tmp_path)
+
+    result = check_file(str(tmp_path / "envs" / "shell.yml"))
+    assert result.ok and result.environments == 1 and result.modules == 0
+
+    result = check_file(str(tmp_path / "env.json"), LoaderMode.SAFE)
+    assert result.ok and result.environments == 1
+
+    result = check_file(str(tmp_path / "envs.jsonl"), LoaderMode.JSON)
+    assert result.ok and result.environments == 1 and result.modules == 1
+
+    result = check_file(str(tmp_path / "modules.yaml"))
+    assert not result.ok and result.modules == 2
+    assert len(result.errors) == 1 and result.errors[0].startswith("Document 1:")
+
+    result = check_file(str(tmp_path / "envs" / "templated.yaml"))
+    assert not result.ok and "version" in result.errors[0]
+
+    result = check_file(str(tmp_path / "other.yml"))
+    assert result.ok and result.environments == result.modules == 0
+
+    assert not check_file(str(tmp_path / "unparseable.yml")).ok
+    assert not check_file(str(tmp_path / "missing.yml")).ok
+
+
+def test_check_tree(tmp_path: Path) -> None:
+    """Test that checking in parallel gives the same results, in order."""
+    _tree(tmp_path)
+
+    serial = list(check_tree(str(tmp_path), jobs=1))
+    parallel = list(check_tree(str(tmp_path), jobs=3))
+
+    assert [r.path for r in parallel] == discover(str(tmp_path))
+    assert [(r.path, r.errors) for r in parallel] == [
+        (r.path, r.errors) for r in serial
+    ]
+    assert [r.ok for r in parallel] == [True, True, False, True, False, True, False]
@@ -1,12 +1,21 @@
 """Test the config model."""
 
 import os
+import pickle
+from dataclasses import field
+from io import StringIO
+from typing import List, Optional
 
 import pytest
 from pydantic import ValidationError
 from pydantic.dataclasses import dataclass
 
-from blowhole.core.config import ConfigModel
+from blowhole.core.config import (
+    ConfigError,
+    ConfigModel,
+    LoaderMode,
+    yaml_loader,
+)
 
 CURR_DIR = os.path.dirname(__file__)
 
@@ -51,3 +60,101 @@ def test_load_invalid_from_file() -> None:
     with pytest.raises(ValidationError):
         with open(BAD) as fp:
             MockConfig.load_from_file(fp)
+
+
+VALID_JSON = os.path.join(CURR_DIR, 'files', 'valid.json')
+
+
+def test_load_with_each_loader() -> None:
+    """Test that every loader mode gives the same result."""
+    for mode in LoaderMode:
+        path = VALID_JSON if mode is LoaderMode.JSON else VALID
+        with open(path) as fp:
+            assert MockConfig.load_from_file(fp, loader=mode) == MockConfig("Bees")
+
+        with open(path) as fp:
+            assert MockConfig.load_from_file(fp, loader=mode) == MockConfig("Bees")
+
+
+def test_load_invalid_with_each_loader() -> None:
+    """Test that every yaml loader mode validates in the same way."""
+    for mode in (LoaderMode.ROUND_TRIP, LoaderMode.SAFE, LoaderMode.C):
+        with pytest.raises(ValidationError):
+            with open(BAD) as fp:
+                MockConfig.load_from_file(fp, loader=mode)
+
+
+def test_yaml_loader_reused() -> None:
+    """Test that yaml loaders are only created once."""
+    assert yaml_loader(LoaderMode.SAFE) is yaml_loader(LoaderMode.SAFE)
+    assert yaml_loader(LoaderMode.SAFE) is not yaml_loader(LoaderMode.ROUND_TRIP)
+
+    with pytest.raises(ValueError):
+        yaml_loader(LoaderMode.JSON)
+
+
+MULTI = os.path.join(CURR_DIR, 'files', 'multi.yml')
+MULTI_JSON = os.path.join(CURR_DIR, 'files', 'multi.jsonl')
+
+
+def test_load_all_from_file() -> None:
+    """Test lazily loading several documents from one file."""
+    for mode in LoaderMode:
+        path = MULTI_JSON if mode is LoaderMode.JSON else MULTI
+        with open(path) as fp:
+            configs = MockConfig.load_all_from_file(fp, loader=mode)
+            assert next(configs) == MockConfig("Bees")
+            assert next(configs) == MockConfig("Wasps")
+            with pytest.raises(StopIteration):
+                next(configs)
+
+
+def test_load_all_from_file_json_documents() -> None:
+    """Test that JSON documents may span lines, or be items of an array."""
+    for content in [
+        '{\n  "name": "Bees"\n}\n{\n  "name": "Wasps"\n}\n',
+        '[\n  {"name": "Bees"},\n  {"name": "Wasps"}\n]\n',
+    ]:
+        configs = MockConfig.load_all_from_file(StringIO(content), LoaderMode.JSON)
+        assert list(configs) == [MockConfig("Bees"), MockConfig("Wasps")]
+
+    with pytest.raises(ConfigError, match="Invalid JSON"):
+        list(MockConfig.load_all_from_file(StringIO('{"name": }'), LoaderMode.JSON))
+    with pytest.raises(ConfigError, match="Invalid JSON"):
+        MockConfig.load_from_file(StringIO('{"name": }'), loader=LoaderMode.JSON)
+
+
+def test_load_all_from_file_interleaved() -> None:
+    """Test loading other files while a multi-document file is being read."""
+    with open(MULTI) as fp:
+        for config in MockConfig.load_all_from_file(fp):
+            with open(VALID) as fp2:
+                assert MockConfig.load_from_file(fp2) == MockConfig("Bees")
+
+
+@dataclass
+class DefaultsConfig(ConfigModel):
+    """A mock config with defaults."""
+
+    name: str
+    tags: List[str] = field(default_factory=list)
+    description: Optional[str] = None
+
+
+def test_construct() -> None:
+    """Test creating a config model without validating it."""
+    c = DefaultsConfig.construct(name="example")
+    assert c == DefaultsConfig("example")
+    assert c.tags == [] and c.tags is not DefaultsConfig.construct(name="x").tags
+    assert pickle.loads(pickle.dumps(c)) == c
+
+    # Values are not validated.
+    assert DefaultsConfig.construct(name=1).name == 1
+
+
+def test_construct_fields() -> None:
+    """Test that constructing a config model requires its fields, and only them."""
+    with pytest.raises(TypeError, match="requires name"):
+        DefaultsConfig.construct()
+    with pytest.raises(TypeError, match="no field other"):
+        DefaultsConfig.construct(name="example", other=1)
@@ -0,0 +1,115 @@
+"""Test generating build contexts."""
+
+import io
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from blowhole.core.context import (
+    READ_SIZE,
+    ContextException,
+    context_digest,
+    context_files,
+    stream_context,
+)
+from blowhole.core.environment import EnvironmentRecipe
+from blowhole.core.image import BuildRecipe, RunRecipe
+
+
+def _recipe(*commands: str) -> EnvironmentRecipe:
+    return EnvironmentRecipe(BuildRecipe(list(commands)), RunRecipe())
+
+
+def _context(tmp_path: Path) -> Path:
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "main.py").write_text("print('hi')\n")
+    (tmp_path / "app" / "empty").mkdir()
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+    (tmp_path / "unused").write_text("unused")
+    return tmp_path
+
+
+def test_context_files(tmp_path: Path) -> None:
+    """Test finding the files copied by a recipe."""
+    root = _context(tmp_path)
+    recipe = _recipe(
+        "FROM ubuntu",
+        "COPY --chown=1000 app /app",
+        'ADD ["*.txt", "/data/"]',
+        "ADD https://example.com/file.tar /",
+        "COPY --from=build /bin/tool /bin/",
+        "COPY a.txt /a",
+    )
+
+    assert context_files(recipe, str(root)) == [
+        ("a.txt", str(root / "a.txt")),
+        ("app", str(root / "app")),
+        ("app/empty", str(root / "app" / "empty")),
+        ("app/main.py", str(root / "app" / "main.py")),
+        ("b.txt", str(root / "b.txt")),
+    ]
+    assert context_files(_recipe("FROM ubuntu"), str(root)) == []
+
+    with pytest.raises(ContextException):
+        context_files(_recipe("COPY ../secret /"), str(root))
+
+
+def test_stream_context(tmp_path: Path) -> None:
+    """Test that streamed contexts are valid tar archives."""
+    root = _context(tmp_path)
+    large = os.urandom(3 * READ_SIZE + 7)
+    (root / "app" / "large").write_bytes(large)
+    os.symlink("main.py", str(root / "app" / "link"))
+    recipe = _recipe("FROM ubuntu", "COPY app /app")
+
+    chunks = list(stream_context(recipe, context_files(recipe, str(root))))
+
+    assert max(len(c) for c in chunks) <= READ_SIZE
+    with tarfile.open(fileobj=io.BytesIO(b"".join(chunks))) as tar:
+        assert tar.getnames() == [
+            "Dockerfile",
+            "app",
+            "app/empty",
+            "app/large",
+            "app/link",
+            "app/main.py",
+        ]
+        dockerfile = tar.extractfile("Dockerfile")
+        assert dockerfile is not None
+        assert dockerfile.read() == recipe.dockerfile_str.encode("utf-8")
+        member = tar.extractfile("app/large")
+        assert member is not None
+        assert member.read() == large
+        assert tar.getmember("app/empty").isdir()
+        assert tar.getmember("app/link").linkname == "main.py"
+
+
+def test_stream_context_changed(tmp_path: Path) -> None:
+    """Test that files truncated while streaming are detected."""
+    root = _context(tmp_path)
+    recipe = _recipe("FROM ubuntu", "COPY a.txt /")
+    stream = stream_context(recipe, context_files(recipe, str(root)))
+
+    # Read up to the header of the file, which records its size.
+    while not next(stream).startswith(b"a.txt"):
+        pass
+    (root / "a.txt").write_text("")
+
+    with pytest.raises(ContextException):
+        list(stream)
+
+
+def test_context_digest(tmp_path: Path) -> None:
+    """Test that context digests depend on file names and contents."""
+    root = _context(tmp_path)
+    files = context_files(_recipe("COPY app a.txt /"), str(root))
+    digest = context_digest(files)
+
+    assert context_digest(files) == digest
+    assert context_digest(files[1:]) != digest
+
+    (root / "a.txt").write_text("changed")
+    assert context_digest(files) != digest
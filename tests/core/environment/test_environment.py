@@ -2,13 +2,21 @@
 
 from io import StringIO
 from os import path
+from pathlib import Path
+from typing import List
 
 import pytest
 from pydantic import ValidationError
 
-from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+from blowhole.core.environment import (
+    EnvironmentDefinition,
+    EnvironmentRecipe,
+    _RecipeCache,
+)
 from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
 from blowhole.core.module import Component, Module
+from blowhole.core.resolve import ModuleRegistry
+from blowhole.core.trace import recording
 
 CURR_DIR = path.dirname(__file__)
 
@@ -134,3 +142,228 @@ def test_environmentdefinition_dockerfile() -> None:
     with d1:
         with d2:
             assert d1.read() == d2.read()
+
+
+ENV_MULTI = path.join(CURR_DIR, "files", "env_multi.yaml")
+
+
+def test_environmentdefinition_load_all() -> None:
+    """Test that environments are validated one document at a time."""
+    with open(ENV_MULTI) as fp:
+        envs = EnvironmentDefinition.load_all_from_file(fp)
+
+        assert next(envs).name == "first"
+        with pytest.raises(ValidationError):
+            next(envs)
+
+
+def test_environmentdefinition_load_named() -> None:
+    """Test picking one environment from a multi-document file."""
+    with open(ENV_MULTI) as fp:
+        env = EnvironmentDefinition.load_named_from_file(fp, "second")
+
+    assert env is not None
+    assert env.recipe.dockerfile_str == "FROM alpine\n"
+
+    with open(ENV_MULTI) as fp:
+        assert EnvironmentDefinition.load_named_from_file(fp, "third") is None
+
+
+def test_environmentdefinition_recipe_cached() -> None:
+    """Test that recipes are cached until the definition changes."""
+    with open(ENV_VALID) as fp:
+        env = EnvironmentDefinition.load_from_file(fp)
+
+    r1 = env.recipe
+    cache = env.__dict__["_recipe_cache"]
+    assert env.recipe == r1
+    assert env.__dict__["_recipe_cache"] is cache
+
+    env.name = "renamed"
+    r2 = env.recipe
+    assert r2 is not r1
+    assert r2.name == "renamed"
+    assert r2.build == r1.build
+
+    env.modules = env.modules[1:]
+    assert env.recipe.build == BuildRecipe([
+        "RUN apt update && apt install zsh",
+        "RUN pacman -S zsh",
+        "CMD zsh",
+    ])
+
+
+def test_environmentdefinition_recipe_modified_in_place() -> None:
+    """Test that changing modules in place invalidates the cached recipe."""
+    env = EnvironmentDefinition([
+        Module("base", [Component(BuildRecipe(["FROM x"]))]),
+        Module("app", [Component(BuildRecipe(["RUN app"]))]),
+    ])
+    assert env.recipe.build.commands == ["FROM x", "RUN app"]
+
+    env.modules[0].components = [Component(BuildRecipe(["FROM y"]))]
+    assert env.recipe.build.commands == ["FROM y", "RUN app"]
+
+    recipe = env.modules[1].components[0].recipe
+    assert isinstance(recipe, BuildRecipe)
+    recipe.commands.append("RUN more")
+    assert env.recipe.build.commands == ["FROM y", "RUN app", "RUN more"]
+
+    env.modules[1].components.append(Component(RunRecipe(ports={(1, 2)})))
+    assert env.recipe.run.ports == {(1, 2)}
+
+
+def test_environmentdefinition_recipe_copied() -> None:
+    """Test that changing a recipe does not change the cached one."""
+    env = EnvironmentDefinition([
+        Module("base", [Component(BuildRecipe(["FROM x"]))]),
+        Module("app", [Component(RunRecipe(["run"], ports={(1, 2)}))]),
+    ])
+
+    r1 = env.recipe
+    r1.build.commands.append("RUN evil")
+    r1.run.script.append("evil")
+    r1.run.ports.add((3, 4))
+
+    r2 = env.recipe
+    assert r2.build.commands == ["FROM x"]
+    assert r2.run == RunRecipe(["run"], ports={(1, 2)})
+
+
+def test_environmentdefinition_recipe_appended() -> None:
+    """Test that appending modules extends the cached recipe."""
+    with open(ENV_VALID) as fp:
+        env = EnvironmentDefinition.load_from_file(fp)
+    zsh = env.modules.pop()
+
+    r1 = env.recipe
+    assert r1.build == BuildRecipe(["FROM ubuntu"])
+
+    env.modules.append(zsh)
+    r2 = env.recipe
+    extra = Module("extra", [Component(RunRecipe(ports=[(3000, 4000)]))])
+    env.modules = env.modules + [extra]
+    r3 = env.recipe
+
+    assert r1.build == BuildRecipe(["FROM ubuntu"])
+    assert r2 == EnvironmentDefinition(env.modules[:2], env.name).recipe
+    assert r3 == EnvironmentDefinition(env.modules, env.name).recipe
+    assert r3.run.ports == {(3000, 4000), (8080, 8080)}
+
+
+def test_environmentdefinition_recipe_unchanged_prefix() -> None:
+    """Test that only the modules after the first one changed are composed again."""
+    env = EnvironmentDefinition([
+        Module("base", [
+            Component(BuildRecipe(["FROM ubuntu"]), results=ImageName("ubuntu")),
+        ]),
+        Module("ports", [Component(RunRecipe(["a"], ports={(80, 8080)}))]),
+        Module("tools", [
+            Component(BuildRecipe(["RUN tools"]), results=ImageName("tools")),
+        ]),
+        Module("app", [
+            Component(BuildRecipe(["RUN app"]), compatible=[ImageName("tools")]),
+            Component(RunRecipe(["b"], ports={(80, 9090)})),
+        ]),
+    ])
+    env.recipe
+    with recording() as recorder:
+        env.modules[3].components[1] = Component(RunRecipe(["c"], ports={(443, 8443)}))
+        r1 = env.recipe
+        env.modules[1] = Module("ports", [Component(RunRecipe(ports={(80, 7070)}))])
+        r2 = env.recipe
+
+    composed = [s.attributes["modules"] for s in recorder.spans if s.name == "compose"]
+    assert composed == [1, 3]
+    assert r1 == EnvironmentRecipe(
+        BuildRecipe(["FROM ubuntu", "RUN tools", "RUN app"]),
+        RunRecipe(["a", "c"], ports={(80, 8080), (443, 8443)}),
+    )
+    assert r2 == EnvironmentDefinition(env.modules).recipe
+    assert env.origins == EnvironmentDefinition(env.modules).origins
+    assert env.image == ImageName("tools")
+
+
+def test_environmentdefinition_origins() -> None:
+    """Test that each build command maps back to its module and component."""
+    with open(ENV_VALID) as fp:
+        env = EnvironmentDefinition.load_from_file(fp)
+    ubuntu, zsh = env.modules
+
+    assert env.origins == [
+        (ubuntu, ubuntu.components[0]),
+        (zsh, zsh.components[0]),
+        (zsh, zsh.components[2]),
+    ]
+    assert len(env.origins) == len(env.recipe.build.commands)
+
+    extra = Module("extra", [Component(BuildRecipe(["RUN a", "RUN b"]))])
+    env.modules = env.modules + [extra]
+    assert env.origins[3:] == [(extra, extra.components[0])] * 2
+
+
+def test_environmentdefinition_resolve() -> None:
+    """Test resolving requirements, and extending resolved recipes."""
+    base = Module("base", [Component(BuildRecipe(["FROM ubuntu"]))])
+    python = Module(
+        "python", [Component(BuildRecipe(["RUN install python"]))], requires=["base"],
+    )
+    registry = ModuleRegistry([base, python])
+    app = Module("app", [Component(BuildRecipe(["RUN app"]))], requires=["python"])
+    env = EnvironmentDefinition([app], "env")
+
+    r1 = env.resolve(registry).recipe
+    assert r1.build == BuildRecipe(["FROM ubuntu", "RUN install python", "RUN app"])
+
+    extra = Module("extra", [Component(BuildRecipe(["RUN extra"]))], requires=["base"])
+    env.modules = env.modules + [extra]
+    resolved = env.resolve(registry)
+    assert resolved.modules == [base, python, app, extra]
+
+    composed: List[str] = []
+    extend = _RecipeCache.extend
+
+    def record(self: _RecipeCache, modules: List[Module]) -> None:
+        composed.extend(m.name for m in modules)
+        extend(self, modules)
+
+    _RecipeCache.extend = record  # type: ignore
+    try:
+        r2 = resolved.recipe
+    finally:
+        _RecipeCache.extend = extend  # type: ignore
+
+    # The previous recipe was extended, rather than composed again.
+    assert composed == ["extra"]
+    assert r2.build == BuildRecipe(r1.build.commands + ["RUN extra"])
+    assert r1.build.commands == ["FROM ubuntu", "RUN install python", "RUN app"]
+
+
+def test_environmentdefinition_parameters() -> None:
+    """Test filling in module parameters for each environment."""
+    python = Module(
+        "python",
+        [Component(BuildRecipe(["FROM python:{{ version }}"]))],
+        parameters={"version": "3"},
+    )
+    env = EnvironmentDefinition([python], "env", {"python": {"version": "3.7"}})
+
+    assert env.recipe.build == BuildRecipe(["FROM python:3.7"])
+    assert EnvironmentDefinition([python]).recipe.build == BuildRecipe(["FROM python:3"])
+
+    env.parameters["python"]["version"] = "3.8"
+    assert env.recipe.build == BuildRecipe(["FROM python:3.8"])
+
+
+def test_environmentdefinition_write_dockerfile(tmp_path: Path) -> None:
+    """Test writing dockerfiles straight to files."""
+    with open(ENV_VALID) as fp:
+        recipe = EnvironmentDefinition.load_from_file(fp).recipe
+
+    with open(str(tmp_path / "Dockerfile"), "wb") as fb:
+        recipe.write_dockerfile(fb)
+    with open(str(tmp_path / "Dockerfile.txt"), "w") as ft:
+        recipe.write_dockerfile(ft)
+
+    assert (tmp_path / "Dockerfile").read_text() == recipe.dockerfile_str
+    assert (tmp_path / "Dockerfile.txt").read_text() == recipe.dockerfile_str
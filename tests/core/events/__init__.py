@@ -0,0 +1 @@
+"""Test build events."""
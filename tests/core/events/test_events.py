@@ -0,0 +1,116 @@
+"""Test turning build output into events."""
+
+from typing import Dict, List
+
+from blowhole.core.events import BuildEvent, BuildMonitor
+from blowhole.core.image import BuildRecipe
+from blowhole.core.module import Component, Module
+
+
+class Clock:
+    """A clock which advances a second every time it is read."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Advance and read the clock."""
+        self.now += 1
+        return self.now
+
+
+def test_build_monitor() -> None:
+    """Test events for cached, pulled and failed steps."""
+    base = Component(BuildRecipe(["FROM ubuntu"]))
+    setup = Component(BuildRecipe(["RUN setup", "RUN false"]))
+    module = Module(name="m", components=[base, setup])
+    events: List[BuildEvent] = []
+
+    monitor = BuildMonitor(
+        "env", events.append, [(module, base), (module, setup), (module, setup)], Clock(),
+    )
+    messages: List[Dict[str, object]] = [
+        {"stream": "Step 1/3 : FROM ubuntu\n"},
+        {"status": "Downloading", "progressDetail": {"current": 5, "total": 10},
+         "id": "a"},
+        {"status": "Download complete", "progressDetail": {}, "id": "a"},
+        {"status": "Downloading", "progressDetail": {"current": 3}, "id": "b"},
+        {"stream": " ---> 0123456789ab\n"},
+        {"stream": "Step 2/3 : RUN setup\n ---> Using cache\n ---> 0123456789ab\n"},
+        {"stream": "Step 3/3 : RUN false\n"},
+    ]
+    monitor.start()
+    for message in messages:
+        monitor.feed(message)
+    monitor.finish(error="Failed.")
+
+    assert [e.as_dict() for e in events] == [
+        {"event": "build_start", "environment": "env", "time": 2.0},
+        {
+            "event": "step_start", "environment": "env", "time": 3.0,
+            "step": 1, "steps": 3, "instruction": "FROM ubuntu",
+            "module": "m", "component": 0,
+        },
+        {
+            "event": "step_end", "environment": "env", "time": 5.0,
+            "step": 1, "steps": 3, "instruction": "FROM ubuntu",
+            "module": "m", "component": 0, "cached": False, "pulled": 13,
+            "duration": 1.0,
+        },
+        {
+            "event": "step_start", "environment": "env", "time": 6.0,
+            "step": 2, "steps": 3, "instruction": "RUN setup",
+            "module": "m", "component": 1,
+        },
+        {
+            "event": "step_end", "environment": "env", "time": 8.0,
+            "step": 2, "steps": 3, "instruction": "RUN setup",
+            "module": "m", "component": 1, "cached": True, "pulled": 0,
+            "duration": 1.0,
+        },
+        {
+            "event": "step_start", "environment": "env", "time": 9.0,
+            "step": 3, "steps": 3, "instruction": "RUN false",
+            "module": "m", "component": 1,
+        },
+        {
+            "event": "step_end", "environment": "env", "time": 11.0,
+            "step": 3, "steps": 3, "instruction": "RUN false",
+            "module": "m", "component": 1, "cached": False, "pulled": 0,
+            "duration": 1.0, "error": "Failed.",
+        },
+        {
+            "event": "build_end", "environment": "env", "time": 13.0,
+            "cached": False, "duration": 11.0, "error": "Failed.",
+        },
+    ]
+
+
+def test_build_monitor_unknown_origins() -> None:
+    """Test steps without a known origin, and monitors without a callback."""
+    events: List[BuildEvent] = []
+    monitor = BuildMonitor("env", events.append)
+    monitor.start()
+    monitor.feed({"stream": "Step 1/1 : FROM ubuntu\n"})
+    monitor.finish()
+
+    assert events[1].module is None
+    assert events[1].component is None
+
+    # A component which is no longer part of its module has no known origin.
+    base = Component(BuildRecipe(["FROM ubuntu"]))
+    module = Module(name="m", components=[base])
+    events.clear()
+    monitor = BuildMonitor("env", events.append, [(module, base)])
+    module.components = [Component(BuildRecipe(["FROM debian"]))]
+    monitor.start()
+    monitor.feed({"stream": "Step 1/1 : FROM ubuntu\n"})
+    monitor.finish()
+
+    assert [(e.event, e.module, e.component) for e in events[1:3]] == [
+        ("step_start", None, None), ("step_end", None, None),
+    ]
+
+    silent = BuildMonitor("env", None)
+    silent.start()
+    silent.finish(cached=True)
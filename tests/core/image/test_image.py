@@ -1,11 +1,14 @@
 """Test docker image classes."""
 
+import time
+from io import BytesIO, StringIO
 from os import path
+from typing import Set, Tuple
 
 import pytest
 from pydantic import ValidationError
 
-from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
+from blowhole.core.image import BuildRecipe, ImageName, RunRecipe, combine
 
 CURR_DIR = path.dirname(__file__)
 
@@ -42,6 +45,65 @@ def test_imagename_from_bad_str() -> None:
         ImageName.from_str("a/b:c:d")
 
 
+def test_imagename_from_str_full() -> None:
+    """Test creating an ImageName from a full reference."""
+    image = ImageName.from_str("localhost:5000/kitchen/sink:steel@sha256:0123")
+
+    assert image == ImageName("localhost:5000/kitchen/sink", "steel", "sha256:0123")
+    assert ImageName.from_str("registry.io:443/ghoti") == ImageName(
+        "registry.io:443/ghoti",
+    )
+    assert ImageName.from_str("ghoti@sha256:4567") == ImageName(
+        "ghoti", digest="sha256:4567",
+    )
+
+
+def test_imagename_from_invalid_str() -> None:
+    """Test creating an ImageName from invalid references."""
+    for name in ("a:b:c", "a/b:c/d", "a@b", "a@sha256:1@sha256:2", "a/", "a:", ""):
+        with pytest.raises(ValueError):
+            ImageName.from_str(name)
+
+
+def test_imagename_from_str_interned() -> None:
+    """Test that parsing a name again returns the same ImageName."""
+    image = ImageName.from_str("ghoti:chips")
+
+    assert ImageName.from_str("ghoti:chips") is image
+    assert ImageName("ghoti", "chips").intern() is image
+
+
+def test_imagename_str_roundtrip() -> None:
+    """Test that parsing the string of an ImageName gives an equal one."""
+    for image in (
+        ImageName("a"),
+        ImageName("a/b", "c"),
+        ImageName("r.io:5000/a/b", "c", "sha256:0123"),
+        ImageName("r.io:5000/a", digest="sha256:4567"),
+    ):
+        assert ImageName.from_str(str(image)) == image
+
+
+def test_imagename_immutable() -> None:
+    """Test that image names cannot be changed."""
+    image = ImageName("ghoti", "chips")
+
+    with pytest.raises(AttributeError):
+        image.tag = "peas"  # type: ignore
+    with pytest.raises(AttributeError):
+        del image.tag
+    assert image == ImageName("ghoti", "chips")
+
+
+def test_imagename_hash() -> None:
+    """Test using image names as keys."""
+    images = {ImageName("abc", "def"): 1, ImageName("abc"): 2}
+
+    assert images[ImageName("abc", "def")] == 1
+    assert images[ImageName("abc")] == 2
+    assert ImageName("abc", "def", "sha256:0123") not in images
+
+
 def test_imagename_eq() -> None:
     """Test ImageName equality."""
     i1 = ImageName("abc", "def")
@@ -91,6 +153,13 @@ def test_imagename_comparisons() -> None:
     assert not frog1.is_compatible(frog2)
     assert not frog2.is_compatible(frog1)
 
+    pinned = ImageName("fish", "3.6", "sha256:0123")
+
+    assert fish1.is_compatible(pinned)
+    assert fish2.is_compatible(pinned)
+    assert not pinned.is_compatible(fish2)
+    assert not pinned.is_compatible(ImageName("fish", "3.6", "sha256:4567"))
+
 
 def test_imagename_load_from_empty() -> None:
     """Test loading empty file as ImageName."""
@@ -196,6 +265,8 @@ def test_buildrecipe_add() -> None:
     b2 += b3
 
     assert b2 == b5
+    assert b4 == BuildRecipe(["4", "5"])
+    assert (b4 + b1).commands is not b4.commands
 
 
 def test_buildrecipe_load_valid() -> None:
@@ -314,6 +385,8 @@ def test_runrecipe_add() -> None:
     r1 += r3
 
     assert r1 == r4
+    assert r2.script == ["1", "2"]
+    assert (r2 + RunRecipe()).script is not r2.script
 
 
 def test_runrecipe_load_valid() -> None:
@@ -337,3 +410,106 @@ def test_runrecipe_load_empty() -> None:
     """Test loading empty yaml as a run recipe."""
     with open(YAML_EMPTY) as fp:
         assert RunRecipe.load_from_file(fp) == RunRecipe()
+
+
+def _combine_reference(
+    first: Set[Tuple[int, int]],
+    second: Set[Tuple[int, int]],
+) -> Set[Tuple[int, int]]:
+    result = second.copy()
+    for pf in first:
+        if all(pf[0] != pr[0] and pf[1] != pr[1] for pr in result):
+            result.add(pf)
+    return result
+
+
+def test_combine() -> None:
+    """Test that combining prioritises the second set on either side."""
+    assert combine({(1, 2), (3, 4), (5, 6)}, {(1, 7), (8, 4)}) == {
+        (1, 7), (8, 4), (5, 6),
+    }
+    assert combine(set(), {(1, 2)}) == {(1, 2)}
+    assert combine({(1, 2)}, set()) == {(1, 2)}
+
+    first = {(a, b) for a in range(0, 40, 3) for b in range(0, 40, 7)}
+    second = {(a, b) for a in range(0, 40, 5) for b in range(0, 40, 11)}
+    assert combine(first, second) == _combine_reference(first, second)
+    assert combine(second, first) == _combine_reference(second, first)
+
+
+def test_runrecipe_iadd_combines() -> None:
+    """Test that accumulating run recipes gives the same result as combine."""
+    # Each set uses a source or destination once, but clashes with the others.
+    pairs = [{(a, (a * 7 + i) % 60) for a in range(i, 60, 3)} for i in range(20)]
+
+    result = RunRecipe()
+    expected: Set[Tuple[int, int]] = set()
+    for i, p in enumerate(pairs):
+        result += RunRecipe(ports=p)
+        expected = combine(expected, p)
+        assert result.ports == expected
+
+        if i == 10:
+            # Changing the set in place, or replacing it, is picked up.
+            result.ports.add((1000, 1000))
+            expected.add((1000, 1000))
+        if i == 15:
+            result.ports = {(5, 5)}
+            expected = {(5, 5)}
+
+
+def test_runrecipe_iadd_changed_in_place() -> None:
+    """Test that changes in place which keep the size are picked up."""
+    r = RunRecipe(ports={(80, 8080)})
+    r += RunRecipe(ports={(22, 2222)})
+    r.ports.discard((80, 8080))
+    r.ports.add((443, 8443))
+
+    r += RunRecipe(ports={(443, 9443)})
+
+    assert r.ports == combine({(22, 2222), (443, 8443)}, {(443, 9443)})
+    assert r.ports == {(22, 2222), (443, 9443)}
+    assert repr(r.ports) == repr({(22, 2222), (443, 9443)})
+
+    r.ports |= {(1, 1)}
+    r.ports -= {(22, 2222)}
+    r += RunRecipe(ports={(1, 2), (3, 2222)})
+    assert r.ports == {(443, 9443), (1, 2), (3, 2222)}
+
+
+def test_runrecipe_iadd_scales_linearly() -> None:
+    """Test that accumulating distinct run recipes is not quadratic."""
+    def accumulate(n: int) -> float:
+        recipes = [
+            RunRecipe(ports={(i, i)}, volumes={(f"/h/{i}", f"/c/{i}")})
+            for i in range(n)
+        ]
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            result = RunRecipe()
+            for r in recipes:
+                result += r
+            best = min(best, time.perf_counter() - start)
+        assert len(result.ports) == len(result.volumes) == n
+        return best
+
+    # Quadratic accumulation would take 16 times as long for 4 times as many.
+    assert accumulate(8000) < 8 * accumulate(2000)
+
+
+def test_buildrecipe_write() -> None:
+    """Test writing BuildRecipe lines to text and binary streams."""
+    b = BuildRecipe(["FROM example:17", "RUN echo £"])
+
+    text = StringIO()
+    b.write(text)
+    assert text.getvalue() == b.build_str
+
+    binary = BytesIO()
+    b.write(binary)
+    assert binary.getvalue() == b.build_str.encode("utf-8")
+
+    binary = BytesIO()
+    b.write(binary, encoding="latin-1")
+    assert binary.getvalue() == b.build_str.encode("latin-1")
@@ -7,6 +7,7 @@ from pydantic import ValidationError
 
 from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
 from blowhole.core.module import Component, Module
+from blowhole.core.template import TemplateError
 
 CURR_DIR = path.dirname(__file__)
 
@@ -118,3 +119,140 @@ def test_module_load_empty() -> None:
     with pytest.raises(TypeError):
         with open(YAML_EMPTY) as fp:
             Module.load_from_file(fp)
+
+
+def test_component_should_run_matches_is_compatible() -> None:
+    """Test that indexed matching agrees with ImageName.is_compatible."""
+    images = [
+        ImageName(repo, tag, digest)
+        for repo in ("ubuntu", "debian", "arch", "a/b")
+        for tag in (None, "latest", "18.04", "stretch")
+        for digest in (None, "sha256:0123", "sha256:4567")
+    ]
+
+    for i in range(len(images)):
+        compatible = images[i::5] + images[:i:3]
+        c = Component(RunRecipe(), compatible)
+
+        for source in images:
+            expected = any(image.is_compatible(source) for image in compatible)
+            assert c.should_run(source) == expected
+
+
+def test_component_shares_images() -> None:
+    """Test that components share one object for each distinct image."""
+    c1 = Component(RunRecipe(), [ImageName("ubuntu", "18.04")], ImageName("a/b"))
+    c2 = Component.validate({
+        "recipe": {"script": []},
+        "compatible": [{"repository": "ubuntu", "tag": "18.04"}],
+        "results": {"repository": "a/b"},
+    })
+
+    assert c1.compatible is not None and c2.compatible is not None
+    assert c1.compatible[0] is c2.compatible[0]
+    assert c1.results is c2.results
+
+
+def test_component_should_run_reassigned() -> None:
+    """Test that reassigning compatible images updates the index."""
+    c = Component(RunRecipe(), [ImageName("ubuntu")])
+    assert c.should_run(ImageName("ubuntu", "18.04"))
+
+    c.compatible = [ImageName("debian")]
+    assert not c.should_run(ImageName("ubuntu", "18.04"))
+    assert c.should_run(ImageName("debian", "stretch"))
+
+
+def test_component_should_run_modified() -> None:
+    """Test that modifying compatible images in place updates the index."""
+    c = Component(RunRecipe(), [ImageName("debian")])
+    assert c.compatible is not None
+    assert not c.should_run(ImageName("ubuntu"))
+
+    c.compatible.append(ImageName("ubuntu"))
+    assert c.should_run(ImageName("ubuntu"))
+
+    c.compatible[1] = ImageName("ubuntu", "18.04")
+    assert not c.should_run(ImageName("ubuntu"))
+    assert c.should_run(ImageName("ubuntu", "18.04"))
+
+    c.compatible[:] = [ImageName("fedora")]
+    assert not c.should_run(ImageName("debian"))
+    assert c.should_run(ImageName("fedora"))
+
+    c.compatible += [ImageName("debian")]
+    del c.compatible[0]
+    assert not c.should_run(ImageName("fedora"))
+    assert c.should_run(ImageName("debian"))
+    assert repr(c.compatible) == repr([ImageName("debian")])
+
+    c.compatible.clear()
+    assert not c.should_run(ImageName("debian"))
+
+
+def test_component_should_run_index_reused() -> None:
+    """Test that the index is kept while the compatible images are unchanged."""
+    c = Component(RunRecipe(), [ImageName("debian"), ImageName("ubuntu")])
+    c.should_run(ImageName("debian"))
+    index = c._compatible_index()
+
+    assert c.should_run(ImageName("ubuntu"))
+    assert c._compatible_index() is index
+    assert c.compatible == [ImageName("debian"), ImageName("ubuntu")]
+
+
+def test_module_recipes() -> None:
+    """Test filling in parameters of component recipes."""
+    build = Component(BuildRecipe([
+        "FROM python:{{ version }}",
+        "RUN pip install {{ pkgs }}",
+    ]))
+    run = Component(RunRecipe(script=["python{{ version }}"], ports={(80, 80)}))
+    static = Component(BuildRecipe(["CMD python"]))
+    m = Module("python", [build, run, static], parameters={"version": "3.7", "pkgs": ""})
+
+    recipes = m.recipes({"pkgs": "numpy"})
+
+    assert recipes[0] == BuildRecipe(["FROM python:3.7", "RUN pip install numpy"])
+    assert recipes[1] == RunRecipe(script=["python3.7"], ports={(80, 80)})
+    assert recipes[2] is static.recipe
+    assert m.recipes()[0] == BuildRecipe(["FROM python:3.7", "RUN pip install "])
+    assert build.recipe.commands[0] == "FROM python:{{ version }}"
+
+    with pytest.raises(TemplateError, match="python has no value for the parameter pkgs"):
+        Module("python", [build]).recipes({"version": "3"})
+
+
+def test_module_recipes_go_templates() -> None:
+    """Test that Go template braces are kept in recipes."""
+    inspect = "RUN docker inspect --format '{{.Id}}' {{ image }}"
+    static = Component(BuildRecipe(["RUN docker inspect --format '{{json .}}' x"]))
+    escaped = Component(BuildRecipe(["RUN docker inspect --format '\\{{ json }}' x"]))
+
+    m = Module("m", [Component(BuildRecipe([inspect])), static, escaped])
+
+    recipes = m.recipes({"image": "ubuntu"})
+    assert recipes[0] == BuildRecipe(["RUN docker inspect --format '{{.Id}}' ubuntu"])
+    assert recipes[1] is static.recipe
+    assert recipes[2] == BuildRecipe(["RUN docker inspect --format '{{ json }}' x"])
+    assert Module("m", [escaped]).recipes()[0] == recipes[2]
+
+
+def test_module_recipes_compiled_once() -> None:
+    """Test that templates are compiled until the recipes change."""
+    m = Module("m", [Component(BuildRecipe(["RUN {{ a }}"]))])
+
+    compiled = m._compiled()
+    assert m.recipes({"a": "x"})[0] == BuildRecipe(["RUN x"])
+    assert m._compiled() is compiled
+
+    m.components = [Component(BuildRecipe(["RUN {{ b }}"]))]
+    assert m._compiled() is not compiled
+    assert m.recipes({"b": "y"})[0] == BuildRecipe(["RUN y"])
+
+    recompiled = m._compiled()
+    recipe = m.components[0].recipe
+    assert isinstance(recipe, BuildRecipe)
+    recipe.commands.append("RUN {{ c }}")
+    assert m._compiled() is not recompiled
+    assert m.recipes({"b": "y", "c": "z"})[0] == BuildRecipe(["RUN y", "RUN z"])
@@ -0,0 +1 @@
+"""Test the Dockerfile optimiser."""
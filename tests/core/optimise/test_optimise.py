@@ -0,0 +1,157 @@
+"""Test the Dockerfile layer optimiser."""
+
+from blowhole.core.image import BuildRecipe
+from blowhole.core.optimise import optimise, split_instruction
+
+
+def test_split_instruction() -> None:
+    """Test splitting Dockerfile lines."""
+    assert split_instruction("run  apt update") == ("RUN", "apt update")
+    assert split_instruction("  CMD") == ("CMD", "")
+    assert split_instruction("") == ("", "")
+
+
+def test_optimise_empty() -> None:
+    """Test optimising an empty recipe."""
+    assert optimise(BuildRecipe()) == (BuildRecipe(), 0)
+
+
+def test_optimise_run() -> None:
+    """Test chaining consecutive RUN instructions."""
+    build, saved = optimise(BuildRecipe([
+        "FROM ubuntu",
+        "RUN apt update",
+        "run apt install -y zsh",
+        "RUN apt install -y git",
+        "CMD zsh",
+        "RUN echo done",
+    ]))
+
+    assert build == BuildRecipe([
+        "FROM ubuntu",
+        "RUN apt update && apt install -y zsh && apt install -y git",
+        "CMD zsh",
+        "RUN echo done",
+    ])
+    assert saved == 2
+
+
+def test_optimise_run_many() -> None:
+    """Test chaining a long run of RUN instructions."""
+    commands = [f"RUN echo {i}" for i in range(20000)]
+
+    build, saved = optimise(BuildRecipe(commands + ["CMD zsh"] + commands[:2]))
+
+    assert build.commands == [
+        f"RUN {' && '.join(c[4:] for c in commands)}",
+        "CMD zsh",
+        "RUN echo 0 && echo 1",
+    ]
+    assert saved == 20000
+
+
+def test_optimise_run_unsafe() -> None:
+    """Test that RUN instructions are kept apart when chaining is unsafe."""
+    commands = [
+        "RUN [\"echo\", \"exec form\"]",
+        "RUN echo a # a comment",
+        "RUN sleep 10 &",
+        "RUN --mount=type=cache,target=/var/cache apt update",
+        "RUN echo a",
+        "SHELL [\"powershell\", \"-Command\"]",
+        "RUN Write-Host a",
+        "RUN Write-Host b",
+    ]
+
+    assert optimise(BuildRecipe(commands)) == (BuildRecipe(commands), 0)
+
+
+def test_optimise_run_subshells() -> None:
+    """Test that chained RUN instructions which would interact use subshells."""
+    assert optimise(BuildRecipe([
+        "FROM x",
+        "RUN false",
+        "RUN echo hi || true",
+    ]))[0] == BuildRecipe(["FROM x", "RUN false && ( echo hi || true )"])
+
+    assert optimise(BuildRecipe([
+        "RUN cd /tmp",
+        "RUN make",
+        "RUN export A=1; echo $A",
+        "RUN A=1",
+        "RUN set -e",
+        "RUN echo a | grep a && cd / && ls",
+        "RUN echo 'cd' \"a;b\" | tr -d ';'",
+    ]))[0] == BuildRecipe([
+        "RUN ( cd /tmp ) && make && ( export A=1; echo $A ) && ( A=1 ) "
+        "&& ( set -e ) && ( echo a | grep a && cd / && ls ) "
+        "&& echo 'cd' \"a;b\" | tr -d ';'",
+    ])
+
+
+def test_optimise_env_label() -> None:
+    """Test folding adjacent ENV and LABEL instructions."""
+    build, saved = optimise(BuildRecipe([
+        "ENV A=1",
+        "ENV B=\"two words\" C=3",
+        "LABEL a=b",
+        "LABEL c=\"d e\"",
+        "ENV D 4",
+        "ENV E=5",
+    ]))
+
+    assert build == BuildRecipe([
+        "ENV A=1 B=\"two words\" C=3",
+        "LABEL a=b c=\"d e\"",
+        "ENV D 4",
+        "ENV E=5",
+    ])
+    assert saved == 2
+
+
+def test_optimise_env_references() -> None:
+    """Test that ENV instructions referencing earlier values are not folded."""
+    build, saved = optimise(BuildRecipe([
+        "ENV A=1 AB=2",
+        "ENV B=${A}",
+        "ENV C=$AB D=3",
+        "ENV E=$ABC",
+        "ENV F=\"$D\"",
+    ]))
+
+    assert build == BuildRecipe([
+        "ENV A=1 AB=2",
+        "ENV B=${A} C=$AB D=3 E=$ABC",
+        "ENV F=\"$D\"",
+    ])
+    assert saved == 2
+
+
+def test_optimise_duplicates() -> None:
+    """Test dropping repeated instructions which have no further effect."""
+    build, saved = optimise(BuildRecipe([
+        "FROM ubuntu",
+        "FROM ubuntu",
+        "EXPOSE 8080",
+        "EXPOSE 8080",
+        "ENV PATH=$PATH:/opt/bin",
+        "ENV PATH=$PATH:/opt/bin",
+        "WORKDIR src",
+        "WORKDIR src",
+        "USER app",
+        "USER app",
+        "CMD zsh",
+    ]))
+
+    assert build == BuildRecipe([
+        "FROM ubuntu",
+        "FROM ubuntu",
+        "EXPOSE 8080",
+        "ENV PATH=$PATH:/opt/bin",
+        "ENV PATH=$PATH:/opt/bin",
+        "WORKDIR src",
+        "WORKDIR src",
+        "USER app",
+        "CMD zsh",
+    ])
+    assert saved == 2
@@ -0,0 +1 @@
+"""Test base image planning."""
@@ -0,0 +1,91 @@
+"""Test shared base image planning."""
+
+from typing import List
+
+from blowhole.core.environment import EnvironmentDefinition
+from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
+from blowhole.core.module import Component, Module
+from blowhole.core.plan import is_splittable, plan
+
+
+def _env(name: str, commands: List[str]) -> EnvironmentDefinition:
+    return EnvironmentDefinition(
+        name=name,
+        modules=[Module(
+            name=name,
+            components=[
+                Component(BuildRecipe(commands)),
+                Component(RunRecipe(script=[name])),
+            ],
+        )],
+    )
+
+
+def test_is_splittable() -> None:
+    """Test which builds can be split."""
+    assert is_splittable(BuildRecipe(["FROM a", "RUN b"]))
+    assert not is_splittable(BuildRecipe([]))
+    assert not is_splittable(BuildRecipe(["RUN b"]))
+    assert not is_splittable(BuildRecipe(["FROM a AS x", "FROM b", "COPY --from=x a b"]))
+    assert not is_splittable(BuildRecipe(["FROM a", "ARG b", "RUN $b"]))
+    assert not is_splittable(BuildRecipe(["FROM a", "ONBUILD RUN b"]))
+
+
+def test_plan_no_sharing() -> None:
+    """Test that unrelated environments are left as they are."""
+    envs = [_env("a", ["FROM a", "RUN x"]), _env("b", ["FROM b", "RUN x"])]
+
+    p = plan(envs)
+
+    assert p.bases == []
+    assert p.environments == [e.recipe for e in envs]
+
+
+def test_plan_shared_prefixes() -> None:
+    """Test planning nested shared base images."""
+    envs = [
+        _env("python", ["FROM ubuntu", "RUN apt update", "RUN install python"]),
+        _env("rust", ["FROM ubuntu", "RUN apt update", "RUN install rust"]),
+        _env("py-dev", [
+            "FROM ubuntu", "RUN apt update", "RUN install python", "RUN install zsh",
+        ]),
+        _env("plain", ["FROM ubuntu"]),
+        _env("multi", ["FROM ubuntu AS a", "FROM a"]),
+    ]
+
+    p = plan(envs, repository="example/base")
+
+    assert len(p.bases) == 3
+    ubuntu, update, python = p.bases
+
+    assert ubuntu.base is None
+    assert ubuntu.build == BuildRecipe(["FROM ubuntu"])
+    assert update.base == ubuntu.tag
+    assert update.build == BuildRecipe([f"FROM {ubuntu.tag}", "RUN apt update"])
+    assert python.base == update.tag
+    assert python.build == BuildRecipe([f"FROM {update.tag}", "RUN install python"])
+
+    for image in p.bases:
+        assert image.tag.repository == "example/base"
+
+    py, rust, py_dev, plain, multi = p.environments
+
+    assert py.build == BuildRecipe([f"FROM {python.tag}"])
+    assert rust.build == BuildRecipe([f"FROM {update.tag}", "RUN install rust"])
+    assert py_dev.build == BuildRecipe([f"FROM {python.tag}", "RUN install zsh"])
+    assert plain.build == BuildRecipe([f"FROM {ubuntu.tag}"])
+    assert multi == envs[4].recipe
+
+    assert py.name == "python"
+    assert py.run == RunRecipe(script=["python"])
+
+
+def test_plan_tags_content_addressed() -> None:
+    """Test that base image tags only depend on their commands."""
+    a = plan([_env("a", ["FROM x", "RUN y", "RUN a"]), _env("b", ["FROM x", "RUN y"])])
+    b = plan([_env("c", ["FROM x", "RUN y", "RUN c"]), _env("d", ["FROM x", "RUN y"])])
+    c = plan([_env("e", ["FROM x", "RUN z", "RUN e"]), _env("f", ["FROM x", "RUN z"])])
+
+    assert a.bases[0].tag == b.bases[0].tag
+    assert a.bases[0].tag != c.bases[0].tag
+    assert a.bases[0].tag != ImageName("blowhole/base")
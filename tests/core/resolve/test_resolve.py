@@ -0,0 +1,173 @@
+"""Test resolving dependencies between modules."""
+
+from typing import List
+
+import pytest
+
+from blowhole.core.image import BuildRecipe
+from blowhole.core.module import Component, Module
+from blowhole.core.resolve import DependencyError, ModuleRegistry
+
+
+def _module(name: str, *requires: str) -> Module:
+    return Module(
+        name=name,
+        components=[Component(BuildRecipe([f"RUN {name}"]))],
+        requires=list(requires),
+    )
+
+
+def _names(modules: List[Module]) -> List[str]:
+    return [m.name for m in modules]
+
+
+def test_registry() -> None:
+    """Test adding and finding modules."""
+    a = _module("a")
+    registry = ModuleRegistry([a])
+
+    assert "a" in registry
+    assert registry["a"] is a
+    assert list(registry) == [a]
+    assert len(registry) == 1
+
+    with pytest.raises(DependencyError, match="defined twice"):
+        registry.add(_module("a"))
+
+
+def test_closure() -> None:
+    """Test that closures are stable topological orders."""
+    registry = ModuleRegistry([
+        _module("app", "python", "git", "zsh"),
+        _module("python", "apt"),
+        _module("git", "apt", "base"),
+        _module("zsh", "base"),
+        _module("apt", "base"),
+        _module("base"),
+    ])
+
+    assert _names(list(registry.closure("base"))) == ["base"]
+    assert _names(list(registry.closure("app"))) == [
+        "base", "apt", "python", "git", "zsh", "app",
+    ]
+    assert registry.closure("app") is registry.closure("app")
+
+
+def test_closure_memoised() -> None:
+    """Test that shared sub-graphs are memoised while resolving."""
+    registry = ModuleRegistry([
+        _module("a", "c"),
+        _module("b", "c", "d"),
+        _module("c", "d"),
+        _module("d"),
+    ])
+
+    a = registry.closure("a")
+    # The closure of c was memoised while resolving a.
+    c = registry.closure("c")
+    assert _names(list(c)) == ["d", "c"]
+    assert a[:2] == c
+    assert _names(list(registry.closure("b"))) == ["d", "c", "b"]
+
+    registry.add(_module("e", "a"))
+    assert registry.closure("c") is not c
+    assert registry.closure("c") == c
+
+
+def test_closure_long_chain() -> None:
+    """Test that deep dependency graphs do not recurse."""
+    registry = ModuleRegistry(
+        [_module("m0")] + [_module(f"m{i}", f"m{i - 1}") for i in range(1, 5000)],
+    )
+
+    closure = registry.closure("m4999")
+
+    assert len(closure) == 5000
+    assert closure[0].name == "m0"
+    assert registry.closure("m2000") == closure[:2001]
+
+
+def test_closure_shared() -> None:
+    """Test that a sub-graph shared by many requirements is followed once."""
+    chain = [_module("c0")] + [_module(f"c{i}", f"c{i - 1}") for i in range(1, 2000)]
+    users = [_module(f"u{i}", "c1999") for i in range(2000)]
+    registry = ModuleRegistry(chain + users + [
+        _module("top", *(u.name for u in users)),
+    ])
+    for u in users:
+        assert registry.closure(u.name)[-2:] == (chain[-1], u)
+
+    closure = registry.closure("top")
+
+    assert list(closure) == chain + users + [registry["top"]]
+    assert registry.closure("c1999") == tuple(chain)
+
+
+def test_closure_errors() -> None:
+    """Test missing and cyclic requirements."""
+    registry = ModuleRegistry([
+        _module("a", "b"),
+        _module("b", "c"),
+        _module("c", "a"),
+        _module("d", "missing"),
+    ])
+
+    with pytest.raises(DependencyError, match="a -> b -> c -> a"):
+        registry.closure("a")
+    with pytest.raises(DependencyError, match="d requires missing"):
+        registry.closure("d")
+    with pytest.raises(DependencyError, match="no module named e"):
+        registry.closure("e")
+
+
+def test_resolve() -> None:
+    """Test ordering given modules after their requirements."""
+    registry = ModuleRegistry([
+        _module("base"),
+        _module("python", "base"),
+        _module("tools", "python"),
+    ])
+    local = _module("python", "base")
+    app = _module("app", "tools", "extra")
+    extra = _module("extra", "python")
+
+    resolved = registry.resolve([app, local, extra])
+
+    assert _names(resolved) == ["base", "python", "tools", "extra", "app"]
+    assert resolved[1] is local
+    assert registry.resolve([]) == []
+
+    with pytest.raises(DependencyError, match="x -> y -> x"):
+        registry.resolve([_module("x", "y"), _module("y", "x")])
+
+
+def test_resolve_given_requirements() -> None:
+    """Test that given modules standing in for registry modules are followed."""
+    registry = ModuleRegistry([
+        _module("base"),
+        _module("python", "base"),
+        _module("tools", "python"),
+    ])
+    local = _module("python", "base", "compiler")
+    compiler = _module("compiler", "base")
+
+    resolved = registry.resolve([_module("app", "tools"), local, compiler])
+
+    assert _names(resolved) == ["base", "compiler", "python", "tools", "app"]
+    assert resolved[2] is local
+
+    with pytest.raises(DependencyError, match="python requires missing"):
+        registry.resolve([_module("app", "tools"), _module("python", "missing")])
+    with pytest.raises(DependencyError, match="tools -> python -> tools"):
+        registry.resolve([_module("app", "tools"), _module("python", "tools")])
+
+
+def test_resolve_long_chain() -> None:
+    """Test that given modules with deep requirements do not recurse."""
+    modules = [_module("m0")] + [_module(f"m{i}", f"m{i - 1}") for i in range(1, 5000)]
+
+    resolved = ModuleRegistry().resolve(list(reversed(modules)))
+
+    assert resolved == modules
+    with pytest.raises(DependencyError, match="m0 -> m4999 -> .* -> m1 -> m0 form"):
+        ModuleRegistry().resolve([_module("m0", "m4999")] + modules[1:])
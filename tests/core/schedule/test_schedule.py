@@ -0,0 +1,183 @@
+"""Test scheduling parallel builds."""
+
+import threading
+import time
+from typing import List, Optional
+
+import pytest
+
+from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
+from blowhole.core.module import Component, Module
+from blowhole.core.schedule import (
+    BuildOutcome,
+    BuildTask,
+    ScheduleException,
+    base_images,
+    dependencies,
+    run_builds,
+)
+
+
+def _task(name: str, base: str, produces: Optional[str] = None) -> BuildTask:
+    return BuildTask(
+        name,
+        EnvironmentRecipe(BuildRecipe([f"FROM {base}", f"RUN {name}"]), RunRecipe()),
+        [ImageName.from_str(produces)] if produces else [],
+    )
+
+
+def test_base_images() -> None:
+    """Test finding the base images of each build stage."""
+    assert base_images(BuildRecipe(["RUN a"])) == []
+    assert base_images(BuildRecipe(["from ubuntu:18.04", "RUN a"])) == [
+        ImageName("ubuntu", "18.04"),
+    ]
+    assert base_images(BuildRecipe([
+        "FROM --platform=linux/amd64 golang AS build",
+        "FROM build",
+        "FROM alpine",
+    ])) == [ImageName("golang"), ImageName("alpine")]
+    assert base_images(BuildRecipe(["FROM localhost:5000/a/b@sha256:0123"])) == [
+        ImageName("localhost:5000/a/b", digest="sha256:0123"),
+    ]
+
+
+def test_build_task_from_definition() -> None:
+    """Test that tasks produce component results other than their bases."""
+    definition = EnvironmentDefinition(
+        name="env",
+        modules=[Module(name="m", components=[
+            Component(BuildRecipe(["FROM ubuntu"]), results=ImageName("ubuntu")),
+            Component(BuildRecipe(["RUN a"]), results=ImageName("example/a", "1")),
+        ])],
+    )
+
+    task = BuildTask.from_definition("env", definition)
+
+    assert task.uses == [ImageName("ubuntu", "latest")]
+    assert task.produces == [ImageName("example/a", "1")]
+
+
+def test_build_task_from_definition_final_image() -> None:
+    """Test that tasks only produce the image resulting from the components run."""
+    definition = EnvironmentDefinition(
+        name="env",
+        modules=[Module(name="m", components=[
+            Component(BuildRecipe(["FROM ubuntu"]), results=ImageName("ubuntu")),
+            Component(BuildRecipe(["RUN a"]), results=ImageName("example/a")),
+            Component(BuildRecipe(["RUN b"]), results=ImageName("example/b")),
+            Component(
+                BuildRecipe(["RUN c"]),
+                compatible=[ImageName("alpine")],
+                results=ImageName("example/c"),
+            ),
+        ])],
+    )
+
+    task = BuildTask.from_definition("env", definition)
+
+    assert definition.image == ImageName("example/b")
+    assert task.produces == [ImageName("example/b", "latest")]
+
+
+def test_dependencies() -> None:
+    """Test that tasks depend on the tasks producing their bases."""
+    tasks = [
+        _task("app", "example/base"),
+        _task("base", "ubuntu", "example/base:latest"),
+        _task("other", "alpine"),
+        _task("tool", "example/app:1"),
+        _task("app-image", "example/base", "example/app:1"),
+    ]
+
+    assert dependencies(tasks) == [{1}, set(), set(), {4}, {1}]
+
+
+def test_dependencies_invalid() -> None:
+    """Test that cycles and duplicate images cannot be scheduled."""
+    with pytest.raises(ScheduleException, match="Cyclic"):
+        dependencies([
+            _task("a", "example/b", "example/a"),
+            _task("b", "example/a", "example/b"),
+            _task("c", "ubuntu"),
+        ])
+
+    with pytest.raises(ScheduleException, match="produce"):
+        dependencies([
+            _task("a", "ubuntu", "example/a"),
+            _task("b", "ubuntu", "example/a"),
+        ])
+
+
+def test_run_builds_order() -> None:
+    """Test that builds run in parallel after their dependencies."""
+    tasks = [
+        _task("base", "ubuntu", "example/base"),
+        _task("a", "example/base"),
+        _task("b", "example/base"),
+        _task("c", "example/base"),
+    ]
+    finished: List[str] = []
+    running: List[str] = []
+    peak = 0
+    lock = threading.Lock()
+
+    def build(task: BuildTask) -> bool:
+        nonlocal peak
+        with lock:
+            running.append(task.name)
+            peak = max(peak, len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(task.name)
+            finished.append(task.name)
+        return task.name == "c"
+
+    outcomes = run_builds(tasks, build, jobs=2)
+
+    assert finished[0] == "base"
+    assert peak == 2
+    assert [(o.name, o.status) for o in outcomes] == [
+        ("base", "built"), ("a", "built"), ("b", "built"), ("c", "cached"),
+    ]
+    assert all(o.duration >= 0.05 for o in outcomes)
+
+
+def _failing(task: BuildTask) -> bool:
+    if task.name == "broken":
+        raise RuntimeError("Build failed.")
+    return False
+
+
+def test_run_builds_fail_fast() -> None:
+    """Test that no builds are started after a failure."""
+    tasks = [
+        _task("broken", "ubuntu", "example/base"),
+        _task("dependent", "example/base"),
+        _task("independent", "alpine"),
+    ]
+    reported: List[BuildOutcome] = []
+
+    outcomes = run_builds(tasks, _failing, jobs=1, on_outcome=reported.append)
+
+    assert [(o.name, o.status) for o in outcomes] == [
+        ("broken", "failed"), ("dependent", "skipped"), ("independent", "skipped"),
+    ]
+    assert outcomes[0].error == "Build failed."
+    assert sorted(o.name for o in reported) == ["broken", "dependent", "independent"]
+
+
+def test_run_builds_keep_going() -> None:
+    """Test that independent builds continue after a failure."""
+    tasks = [
+        _task("broken", "ubuntu", "example/base"),
+        _task("dependent", "example/base"),
+        _task("independent", "alpine"),
+    ]
+
+    outcomes = run_builds(tasks, _failing, jobs=1, keep_going=True)
+
+    assert [(o.name, o.status) for o in outcomes] == [
+        ("broken", "failed"), ("dependent", "skipped"), ("independent", "built"),
+    ]
@@ -0,0 +1 @@
+"""Test the blowhole server."""
@@ -0,0 +1,189 @@
+"""Test the blowhole server and its warm store."""
+
+import os
+import threading
+from contextlib import contextmanager
+from os import path
+from pathlib import Path
+from shutil import copyfile
+from typing import Iterator
+
+import pytest
+
+from blowhole.core.client import ServerError, ServerUnavailable, request
+from blowhole.core.server import Server, WarmStore
+
+FILES = path.join(path.dirname(__file__), "..", "..", "cli", "files")
+ENV_VALID = path.join(FILES, "env.yaml")
+ENV_REQUIRES = path.join(FILES, "env_requires.yaml")
+REGISTRY = path.join(FILES, "registry.yaml")
+
+
+@contextmanager
+def _serving(socket_path: str) -> Iterator[Server]:
+    server = Server(socket_path)
+    thread = threading.Thread(
+        target=server.serve_forever,
+        kwargs={"poll_interval": 0.05},
+        daemon=True,
+    )
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _touch(p: Path, content: str) -> None:
+    """Rewrite a file, making sure its signature changes."""
+    mtime = p.stat().st_mtime_ns
+    p.write_text(content)
+    os.utime(str(p), ns=(mtime + 10**9, mtime + 10**9))
+
+
+def test_store_reuses_unchanged() -> None:
+    """Test that objects are only loaded once while their files are unchanged."""
+    store = WarmStore()
+    first = store.definition(ENV_VALID)
+    assert first is not None
+    assert store.definition(ENV_VALID) is first
+    assert store.loads == 1
+
+    assert store.dockerfile(ENV_VALID) == (first.recipe.dockerfile_str, 0)
+    assert store.dockerfile(ENV_VALID) == (first.recipe.dockerfile_str, 0)
+    assert store.loads == 2
+
+
+def test_store_reloads_changed(tmp_path: Path) -> None:
+    """Test that objects are loaded again when their files change."""
+    envdef = tmp_path / "env.yaml"
+    copyfile(ENV_VALID, str(envdef))
+    store = WarmStore()
+    before = store.dockerfile(str(envdef))
+    assert before is not None
+
+    _touch(envdef, envdef.read_text().replace("CMD zsh", "CMD bash"))
+    after = store.dockerfile(str(envdef))
+    assert after is not None
+    assert after[0] == before[0].replace("CMD zsh", "CMD bash")
+
+
+def test_store_registry_changed(tmp_path: Path) -> None:
+    """Test that a dockerfile is generated again when its registry changes."""
+    registry = tmp_path / "registry.yaml"
+    copyfile(REGISTRY, str(registry))
+    store = WarmStore()
+    before = store.dockerfile(ENV_REQUIRES, registry=str(registry))
+    assert before is not None
+
+    _touch(registry, registry.read_text().replace("python3", "python4"))
+    after = store.dockerfile(ENV_REQUIRES, registry=str(registry))
+    assert after is not None
+    assert after[0] == before[0].replace("python3", "python4")
+
+
+def test_store_bounded() -> None:
+    """Test that the least recently used objects are discarded."""
+    store = WarmStore(size=2)
+    store.get("a", [ENV_VALID], lambda: 1)
+    store.get("b", [ENV_VALID], lambda: 2)
+    store.get("a", [ENV_VALID], lambda: 1)
+    store.get("c", [ENV_VALID], lambda: 3)
+
+    assert len(store) == 2
+    assert store.loads == 3
+    assert store.get("a", [ENV_VALID], lambda: 0) == 1
+    assert store.get("b", [ENV_VALID], lambda: 0) == 0
+
+
+def test_store_loads_concurrently() -> None:
+    """Test that different objects load at once, but each is loaded once."""
+    store = WarmStore()
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow() -> str:
+        started.set()
+        assert release.wait(5)
+        return "slow"
+
+    def fetch() -> None:
+        results.append(store.get("slow", [ENV_VALID], slow))
+
+    threads = [threading.Thread(target=fetch) for _ in range(2)]
+    for t in threads:
+        t.start()
+    assert started.wait(5)
+
+    # Another object is loaded while the slow one is still loading.
+    assert store.get("fast", [ENV_VALID], lambda: "fast") == "fast"
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert results == ["slow", "slow"]
+    assert store.loads == 2
+
+
+def test_store_missing_name() -> None:
+    """Test that a missing environment name is reported as None."""
+    assert WarmStore().dockerfile(ENV_VALID, name="missing") is None
+
+
+def test_server_df(tmp_path: Path) -> None:
+    """Test generating a dockerfile with the server."""
+    socket_path = str(tmp_path / "bh.sock")
+    with _serving(socket_path) as server:
+        response = request("df", {"envdef": ENV_VALID}, socket_path=socket_path)
+        assert response["dockerfile"] == "FROM ubuntu\n" \
+            "RUN apt update && apt install zsh\n" \
+            "CMD zsh\n"
+        request("df", {"envdef": ENV_VALID}, socket_path=socket_path)
+        assert server.store.loads == 2
+
+        assert request("ping", socket_path=socket_path)["entries"] == 2
+
+
+def test_server_errors(tmp_path: Path) -> None:
+    """Test that errors are reported to the client, and the server keeps running."""
+    socket_path = str(tmp_path / "bh.sock")
+    with _serving(socket_path):
+        with pytest.raises(ServerError, match="No such file"):
+            request("df", {"envdef": str(tmp_path / "missing.yaml")}, socket_path)
+        with pytest.raises(ServerError, match="Unknown command"):
+            request("format", socket_path=socket_path)
+        request("ping", socket_path=socket_path)
+
+
+def test_server_unavailable(tmp_path: Path) -> None:
+    """Test requests when there is no server."""
+    with pytest.raises(ServerUnavailable):
+        request("ping", socket_path=str(tmp_path / "bh.sock"))
+
+
+def test_server_stop(tmp_path: Path) -> None:
+    """Test stopping the server with a request."""
+    socket_path = str(tmp_path / "bh.sock")
+    server = Server(socket_path)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+    thread.start()
+    request("stop", socket_path=socket_path)
+    thread.join(5)
+    assert not thread.is_alive()
+    server.server_close()
+    assert not path.exists(socket_path)
+
+
+def test_server_socket(tmp_path: Path) -> None:
+    """Test that stale sockets are replaced, and running servers are not."""
+    socket_path = str(tmp_path / "bh.sock")
+    Server(socket_path).socket.close()
+    assert path.exists(socket_path)
+
+    with _serving(socket_path):
+        assert os.stat(socket_path).st_mode & 0o077 == 0
+        with pytest.raises(ServerError, match="already running"):
+            Server(socket_path)
@@ -0,0 +1,41 @@
+"""Test compiling and filling in templates."""
+
+from blowhole.core.template import compile_template
+
+
+def test_compile_template() -> None:
+    """Test splitting templates into literals and parameters."""
+    t = compile_template("RUN apt install {{ packages }} python{{version}}")
+
+    assert t.literals == ("RUN apt install ", " python", "")
+    assert t.names == ("packages", "version")
+    assert compile_template("RUN apt install {{ packages }} python{{version}}") is t
+
+    static = compile_template("RUN echo {} }}")
+    assert static.names == ()
+    assert static.substitute({}) == "RUN echo {} }}"
+
+
+def test_compile_template_literal_braces() -> None:
+    """Test that braces which are not placeholders are literal text."""
+    for text in [
+        "RUN echo {{ name",
+        "RUN echo {{ 1 }}",
+        "RUN docker inspect --format '{{.Id}}' x",
+        "RUN docker inspect --format '{{ json .Config }}' x",
+    ]:
+        t = compile_template(text)
+        assert t.names == ()
+        assert t.substitute({}) == text
+
+    t = compile_template("RUN docker inspect --format '\\{{ json }}' {{ name }}")
+    assert t.names == ("name",)
+    assert t.substitute({"name": "x"}) == "RUN docker inspect --format '{{ json }}' x"
+
+
+def test_substitute() -> None:
+    """Test filling in templates."""
+    t = compile_template("FROM {{ image }}:{{ tag }}")
+
+    assert t.substitute({"image": "ubuntu", "tag": "18.04"}) == "FROM ubuntu:18.04"
+    assert t.substitute({"image": "{{ tag }}", "tag": "x"}) == "FROM {{ tag }}:x"
@@ -0,0 +1,180 @@
+"""Test our asynchronous docker wrappers."""
+
+import asyncio
+from pathlib import Path
+from typing import Awaitable, Dict, List, Optional, Tuple, TypeVar
+
+import pytest
+
+from blowhole.core.aio import AsyncDockerManager, async_whale_call
+from blowhole.core.docker import DockerException, DockerManager
+from blowhole.core.environment import EnvironmentRecipe
+from blowhole.core.events import BUILD_END, BuildEvent, BuildMonitor
+from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
+from blowhole.testing import API_VERSION, FakeDaemon
+
+T = TypeVar('T')
+
+
+def _run(coroutine: Awaitable[T]) -> T:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _recipe(name: str, *commands: str) -> EnvironmentRecipe:
+    return EnvironmentRecipe(BuildRecipe(list(commands)), RunRecipe(), name)
+
+
+def test_async_whale_call() -> None:
+    """Test that errors in coroutines are translated."""
+    @async_whale_call
+    async def add(x: int, y: int) -> int:
+        return x + y
+
+    @async_whale_call
+    async def disconnect() -> None:
+        raise ConnectionResetError
+
+    @async_whale_call
+    async def fail() -> None:
+        raise ValueError
+
+    assert _run(add(17, 3)) == 20
+    with pytest.raises(DockerException):
+        _run(disconnect())
+    with pytest.raises(ValueError):
+        _run(fail())
+
+
+def test_async_docker_manager_build() -> None:
+    """Test building several environments concurrently."""
+    with FakeDaemon() as daemon:
+        manager = AsyncDockerManager(base_url=daemon.base_url, version=API_VERSION)
+        r1 = _recipe("one", "FROM ubuntu", "RUN setup")
+        r2 = _recipe("two", "FROM ubuntu", "RUN other-setup")
+
+        assert _run(manager.ping())
+
+        first = _run(manager.build(r1, tags=[ImageName("example/one")]))
+        assert not first.cached
+        image = daemon.find("example/one")
+        assert image is not None
+        assert str(first.image) in image.tags
+
+        results = _run(manager.build_all([r1, r2, r2]))
+        assert [r.cached for r in results] == [True, False, False]
+        assert results[1] == results[2]
+        assert daemon.count("POST", "/build") == 2
+
+        # Both managers agree on which images already exist.
+        assert DockerManager(
+            base_url=daemon.base_url, version=API_VERSION,
+        ).build(r2).cached
+
+
+def test_async_docker_manager_build_shared_image() -> None:
+    """Test that environments with the same digest can all be found by name."""
+    with FakeDaemon() as daemon:
+        manager = AsyncDockerManager(base_url=daemon.base_url, version=API_VERSION)
+
+        a = _recipe("a", "FROM ubuntu", "RUN setup")
+        b = _recipe("b", "FROM ubuntu", "RUN setup")
+        c = _recipe("c", "FROM ubuntu", "RUN setup")
+
+        results = _run(manager.build_all([a, b]))
+        assert results[0].digest == results[1].digest
+        for r in results:
+            assert daemon.find(str(r.image)) is not None
+
+        result = _run(manager.build(c, tags=[ImageName("example/c")]))
+        assert result.cached
+        assert daemon.find(str(result.image)) is daemon.find("example/c")
+        assert daemon.count("POST", "/build") == 1
+
+
+def test_async_docker_manager_build_duplicate_events() -> None:
+    """Test that identical environments are reported once their image is built."""
+    with FakeDaemon() as daemon:
+        manager = AsyncDockerManager(base_url=daemon.base_url, version=API_VERSION)
+        events: List[BuildEvent] = []
+
+        _run(manager.build_all(
+            [_recipe(n, "FROM ubuntu", "RUN setup") for n in ("a", "b", "c")],
+            on_event=events.append,
+        ))
+
+        ends = [e.environment for e in events if e.event == BUILD_END]
+        assert ends == ["a", "b", "c"]
+
+
+class _SlowManager(AsyncDockerManager):
+    """A manager whose builds of environments named slow never finish."""
+
+    async def _build_stream(
+        self,
+        recipe: EnvironmentRecipe,
+        image: ImageName,
+        digest: str,
+        buildargs: Optional[Dict[str, str]],
+        files: List[Tuple[str, str]],
+        monitor: BuildMonitor,
+    ) -> None:
+        if recipe.name == "slow":
+            await asyncio.sleep(60)
+        await super()._build_stream(recipe, image, digest, buildargs, files, monitor)
+
+
+def test_async_docker_manager_build_cancelled() -> None:
+    """Test that the other builds are cancelled when one fails."""
+    with FakeDaemon() as daemon:
+        manager = _SlowManager(base_url=daemon.base_url, version=API_VERSION)
+        events: List[BuildEvent] = []
+
+        with pytest.raises(DockerException, match="non-zero code"):
+            _run(manager.build_all(
+                [
+                    _recipe("slow", "FROM ubuntu", "RUN setup"),
+                    _recipe("broken", "FROM ubuntu", "RUN false"),
+                ],
+                on_event=events.append,
+            ))
+
+        errors = {e.environment: e.error for e in events if e.event == BUILD_END}
+        assert errors["slow"] == "The build was cancelled."
+        assert daemon.images == {}
+
+
+def test_async_docker_manager_errors(tmp_path: Path) -> None:
+    """Test that failures raise DockerExceptions."""
+    with FakeDaemon() as daemon:
+        manager = AsyncDockerManager(base_url=daemon.base_url, version=API_VERSION)
+
+        with pytest.raises(DockerException, match="non-zero code"):
+            _run(manager.build(_recipe("broken", "FROM ubuntu", "RUN false")))
+        with pytest.raises(DockerException, match="No such image"):
+            _run(manager.tag(ImageName("missing"), ImageName("other")))
+
+    missing = AsyncDockerManager(base_url=f"unix://{tmp_path / 'missing.sock'}")
+    with pytest.raises(DockerException, match="Unable to communicate"):
+        _run(missing.cached_digests())
+
+    with pytest.raises(DockerException, match="Only unix sockets"):
+        _run(AsyncDockerManager(base_url="tcp://localhost:2375").ping())
+
+
+def test_async_docker_manager_build_context(tmp_path: Path) -> None:
+    """Test that copied files are streamed to the daemon."""
+    (tmp_path / "setup.sh").write_text("echo setup\n")
+    recipe = _recipe("copy", "FROM ubuntu", "COPY setup.sh /", "RUN /setup.sh")
+
+    with FakeDaemon() as daemon:
+        manager = AsyncDockerManager(base_url=daemon.base_url, version=API_VERSION)
+
+        result = _run(manager.build(recipe, context=str(tmp_path)))
+
+        image = daemon.find(str(result.image))
+        assert image is not None
+        assert image.context == {"setup.sh": b"echo setup\n"}
@@ -1,8 +1,26 @@
 """Test our docker wrappers."""
 
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
 import pytest
+import requests
 
-from blowhole.core.docker import DockerException, whale_call
+from blowhole.core.docker import (
+    DockerException,
+    DockerManager,
+    build_digest,
+    image_name,
+    whale_call,
+)
+from blowhole.core.environment import EnvironmentDefinition, EnvironmentRecipe
+from blowhole.core.events import BuildEvent
+from blowhole.core.image import BuildRecipe, ImageName, RunRecipe
+from blowhole.core.module import Component, Module
+from blowhole.core.trace import recording
+from blowhole.testing import API_VERSION, FakeDaemon
 
 
 def test_whale_call() -> None:
@@ -32,3 +50,223 @@ def test_whale_call_othererror() -> None:
 
     with pytest.raises(ValueError):
         fail()
+
+
+def _recipe(name: str, *commands: str) -> EnvironmentRecipe:
+    return EnvironmentRecipe(BuildRecipe(list(commands)), RunRecipe(), name)
+
+
+def test_build_digest() -> None:
+    """Test that build digests depend on the Dockerfile and build arguments."""
+    r1 = _recipe("a", "FROM ubuntu")
+    r2 = _recipe("b", "FROM ubuntu")
+    r3 = _recipe("a", "FROM debian")
+
+    assert build_digest(r1) == build_digest(r2)
+    assert build_digest(r1) != build_digest(r3)
+    assert build_digest(r1) != build_digest(r1, {"VERSION": "1"})
+    assert build_digest(r1, {}) == build_digest(r1)
+    assert build_digest(r1, bases=["sha256:0123"]) != build_digest(r1)
+    assert build_digest(r1, bases=["sha256:0123"]) != build_digest(
+        r1, bases=["sha256:4567"],
+    )
+
+
+def test_image_name() -> None:
+    """Test content-addressed image names."""
+    digest = "0123456789abcdef" * 4
+
+    assert image_name(_recipe("Python 3.7!"), digest) == ImageName(
+        "blowhole/python-3.7", digest[:32],
+    )
+    assert image_name(EnvironmentRecipe(BuildRecipe(), RunRecipe()), digest) == (
+        ImageName("blowhole/environment", digest[:32])
+    )
+
+
+def test_docker_manager_build_cached() -> None:
+    """Test that builds are skipped when an identical image exists."""
+    with FakeDaemon() as daemon:
+        manager = DockerManager(base_url=daemon.base_url, version=API_VERSION)
+
+        r1 = _recipe("one", "FROM ubuntu", "RUN setup")
+        r2 = _recipe("two", "FROM ubuntu", "RUN other-setup")
+
+        first = manager.build(r1)
+        assert not first.cached
+        assert daemon.find(str(first.image)) is not None
+
+        results = manager.build_all([r1, r2, r2])
+        assert [r.cached for r in results] == [True, False, True]
+        assert results[0].image == first.image
+        assert results[1].image == image_name(
+            r2, build_digest(r2, bases=["ubuntu:latest"]),
+        )
+
+        assert daemon.count("POST", "/build") == 2
+        assert daemon.count("GET", "/images/json") == 2
+
+
+def test_docker_manager_build_shared_image() -> None:
+    """Test that environments with the same digest can all be found by name."""
+    with FakeDaemon() as daemon:
+        manager = DockerManager(base_url=daemon.base_url, version=API_VERSION)
+
+        a = _recipe("a", "FROM ubuntu", "RUN setup")
+        b = _recipe("b", "FROM ubuntu", "RUN setup")
+        c = _recipe("c", "FROM ubuntu", "RUN setup")
+
+        results = manager.build_all([a, b])
+        assert [r.cached for r in results] == [False, True]
+        assert results[0].digest == results[1].digest
+        for r in results:
+            assert daemon.find(str(r.image)) is not None
+
+        # An image built before is tagged with the new name too.
+        result = manager.build(c, tags=[ImageName("example/c")])
+        assert result.cached
+        assert daemon.find(str(result.image)) is daemon.find("example/c")
+        assert daemon.count("POST", "/build") == 1
+
+        # Names which already exist are not tagged again.
+        manager.build_all([a, b, c])
+        tags = sum(1 for m, p in daemon.requests if p.endswith("/tag"))
+        assert tags == 3
+
+
+def test_docker_manager_build_base_changed() -> None:
+    """Test that environments are built again when the image they use changes."""
+    with FakeDaemon() as daemon:
+        manager = DockerManager(base_url=daemon.base_url, version=API_VERSION)
+        base = ImageName("example/base")
+        app = _recipe("app", "FROM example/base", "RUN setup")
+
+        manager.build(_recipe("base", "FROM ubuntu", "RUN one"), tags=[base])
+        first = manager.build(app)
+        assert not first.cached
+        assert manager.build(app).cached
+
+        manager.build(_recipe("base", "FROM ubuntu", "RUN two"), tags=[base])
+        second = manager.build(app)
+        assert not second.cached
+        assert second.digest != first.digest
+        assert daemon.count("POST", "/build") == 4
+
+
+def test_docker_manager_build_failure() -> None:
+    """Test that failed builds raise DockerExceptions."""
+    with FakeDaemon() as daemon:
+        manager = DockerManager(base_url=daemon.base_url, version=API_VERSION)
+
+        with pytest.raises(DockerException):
+            manager.build(_recipe("broken", "FROM ubuntu", "RUN false"))
+
+        assert daemon.images == {}
+
+
+def test_docker_manager_no_daemon(tmp_path: Path) -> None:
+    """Test that missing daemons raise DockerExceptions."""
+    base_url = f"unix://{tmp_path / 'missing.sock'}"
+    manager = DockerManager(base_url=base_url, version=API_VERSION)
+
+    with pytest.raises(DockerException):
+        manager.cached_digests()
+
+
+def test_docker_manager_shared_client() -> None:
+    """Test that one client is shared and reconnected when it fails."""
+    with FakeDaemon() as daemon:
+        with DockerManager(base_url=daemon.base_url, version=API_VERSION) as manager:
+            client = manager.client
+            assert manager.client is client
+
+            manager.build(_recipe("one", "FROM ubuntu"))
+            assert manager.client is client
+
+            def dropped(**kwargs: object) -> None:
+                raise requests.exceptions.ConnectionError("Connection aborted.")
+
+            client.api.images = dropped
+            assert len(manager.cached_digests()) == 1
+            assert manager.client is not client
+
+        assert manager.reset() is False
+
+
+def test_docker_lazy_import() -> None:
+    """Test that the docker package is only imported when a client is needed."""
+    code = (
+        "import sys\n"
+        "from blowhole.core.docker import DockerManager\n"
+        "m = DockerManager()\n"
+        "assert 'docker' not in sys.modules\n"
+        "m.reset()\n"
+        "assert 'docker' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_docker_manager_build_context(tmp_path: Path) -> None:
+    """Test that copied files are sent to the daemon and affect the digest."""
+    (tmp_path / "setup.sh").write_text("echo setup\n")
+    recipe = _recipe("copy", "FROM ubuntu", "COPY setup.sh /", "RUN /setup.sh")
+
+    with FakeDaemon() as daemon:
+        manager = DockerManager(base_url=daemon.base_url, version=API_VERSION)
+
+        with pytest.raises(DockerException, match="setup.sh"):
+            manager.build(recipe)
+
+        first = manager.build(recipe, context=str(tmp_path))
+        image = daemon.find(str(first.image))
+        assert image is not None
+        assert image.context == {"setup.sh": b"echo setup\n"}
+
+        assert manager.build(recipe, context=str(tmp_path)).cached
+        (tmp_path / "setup.sh").write_text("echo changed\n")
+        assert not manager.build(recipe, context=str(tmp_path)).cached
+
+
+def test_docker_manager_build_events() -> None:
+    """Test that build progress is reported with each step's origin."""
+    base = Module("base", [Component(BuildRecipe(["FROM ubuntu", "RUN setup"]))])
+    tools = Module("tools", [
+        Component(RunRecipe(script=["run"])),
+        Component(BuildRecipe(["RUN tools"])),
+    ])
+    first = EnvironmentDefinition([base], "first")
+    second = EnvironmentDefinition([base, tools], "second")
+    events: List[BuildEvent] = []
+
+    with FakeDaemon() as daemon:
+        manager = DockerManager(base_url=daemon.base_url, version=API_VERSION)
+        for env in (first, second, first):
+            manager.build(env.recipe, on_event=events.append, origins=env.origins)
+
+    ends = [e for e in events if e.event == "step_end"]
+    assert [(e.environment, e.module, e.component, e.cached) for e in ends] == [
+        ("first", "base", 0, False),
+        ("first", "base", 0, False),
+        ("second", "base", 0, False),
+        ("second", "base", 0, True),
+        ("second", "tools", 1, False),
+    ]
+    assert [e.pulled for e in ends] == [FakeDaemon.PULL_SIZE, 0, 0, 0, 0]
+    assert all(e.duration is not None and e.duration >= 0 for e in ends)
+
+    builds = [e for e in events if e.event == "build_end"]
+    assert [(e.environment, e.cached) for e in builds] == [
+        ("first", False), ("second", False), ("first", True),
+    ]
+
+
+def test_docker_manager_traced() -> None:
+    """Test that calls to docker are traced."""
+    with FakeDaemon() as daemon:
+        manager = DockerManager(base_url=daemon.base_url, version=API_VERSION)
+        with recording() as recorder:
+            manager.build(_recipe("one", "FROM ubuntu"))
+
+    spans = {s.name: s for s in recorder.spans}
+    assert spans["docker.build_all"].parent is spans["docker.build"]
+    assert "docker.image_index" in spans
@@ -0,0 +1 @@
+"""Test tracing."""
@@ -0,0 +1,94 @@
+"""Test tracing the phases of blowhole."""
+
+import json
+import threading
+from io import StringIO
+from os import path
+from typing import List, Optional
+
+from blowhole.core.environment import EnvironmentDefinition
+from blowhole.core.trace import Span, add_hook, recording, remove_hook, span
+
+ENV_VALID = path.join(
+    path.dirname(__file__), "..", "..", "cli", "files", "env.yaml",
+)
+
+
+def test_span_untraced() -> None:
+    """Test that spans record nothing without any hooks."""
+    with span("nothing") as s:
+        assert s is None
+
+
+def test_span_hooks() -> None:
+    """Test that hooks are given spans as they finish, nested in each other."""
+    finished: List[Span] = []
+    add_hook(finished.append)
+    try:
+        with span("outer", size=1) as outer:
+            with span("inner") as inner:
+                pass
+    finally:
+        remove_hook(finished.append)
+
+    assert outer is not None and inner is not None
+    assert finished == [inner, outer]
+    assert inner.parent is outer and inner.depth == 1
+    assert outer.parent is None and outer.depth == 0
+    assert outer.attributes == {"size": 1}
+    assert outer.duration >= inner.duration >= 0
+
+    with span("removed"):
+        pass
+    assert len(finished) == 2
+
+
+def test_span_out_of_order() -> None:
+    """Test spans which finish before a span they contain, as coroutines may."""
+    with recording() as recorder:
+        first = span("first")
+        second = span("second")
+        first.__enter__()
+        second.__enter__()
+        first.__exit__(None, None, None)
+        with span("third") as third:
+            pass
+        second.__exit__(None, None, None)
+
+    assert [s.name for s in recorder.spans] == ["first", "third", "second"]
+    assert third is not None and third.parent is recorder.spans[2]
+
+
+def test_span_threads() -> None:
+    """Test that spans in other threads are not nested in this thread's spans."""
+    parents: List[Optional[Span]] = []
+
+    def run() -> None:
+        with span("thread") as s:
+            assert s is not None
+            parents.append(s.parent)
+
+    with recording() as recorder:
+        with span("main"):
+            t = threading.Thread(target=run)
+            t.start()
+            t.join()
+
+    assert parents == [None]
+    assert len({s.thread for s in recorder.spans}) == 2
+
+
+def test_recorder_write() -> None:
+    """Test writing a trace of the phases of loading an environment."""
+    with recording() as recorder:
+        with open(ENV_VALID) as fp:
+            env = EnvironmentDefinition.load_from_file(fp)
+        env.recipe.dockerfile_str
+
+    f = StringIO()
+    recorder.write(f)
+    events = json.loads(f.getvalue())["traceEvents"]
+    assert [e["name"] for e in events] == ["parse", "validate", "compose", "render"]
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+    assert events[1]["args"]["model"] == "EnvironmentDefinition"
+    assert isinstance(events[0]["args"]["blocks"], int)
@@ -0,0 +1 @@
+"""Test watching environments."""
@@ -0,0 +1,126 @@
+"""Test watching environments."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from blowhole.core.trace import recording
+from blowhole.core.watch import DockerfileWatcher, WatchError, write_if_changed
+
+ENV = """\
+name: shell
+modules:
+- name: base
+  components:
+  - recipe:
+      commands: [FROM ubuntu]
+- name: shell
+  requires: [python]
+  components:
+  - recipe:
+      commands: [RUN apt install {shell}]
+"""
+
+REGISTRY = """\
+name: python
+components:
+- recipe:
+    commands: [RUN apt install python3]
+"""
+
+
+def _edit(path: Path, text: str) -> None:
+    """Write a file, making sure that its modification time changes."""
+    mtime = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(text)
+    os.utime(str(path), ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+
+
+def test_watcher_poll(tmp_path: Path) -> None:
+    """Test that the dockerfile is only generated again once files change."""
+    env, registry = tmp_path / "env.yaml", tmp_path / "registry.yaml"
+    _edit(env, ENV.format(shell="zsh"))
+    _edit(registry, REGISTRY)
+    w = DockerfileWatcher(str(env), registry=str(registry))
+
+    assert w.poll() == (
+        "FROM ubuntu\nRUN apt install python3\nRUN apt install zsh\n"
+    )
+    assert w.poll() is None
+
+    # Touching a file without changing the dockerfile does not produce one.
+    _edit(env, ENV.format(shell="zsh"))
+    assert w.poll() is None
+
+    _edit(env, ENV.format(shell="fish"))
+    assert w.poll() == (
+        "FROM ubuntu\nRUN apt install python3\nRUN apt install fish\n"
+    )
+
+    _edit(registry, REGISTRY.replace("python3", "python3.8"))
+    assert w.poll() == (
+        "FROM ubuntu\nRUN apt install python3.8\nRUN apt install fish\n"
+    )
+
+
+def test_watcher_reuses_modules(tmp_path: Path) -> None:
+    """Test that unchanged modules, and the recipe composed from them, are kept."""
+    env, registry = tmp_path / "env.yaml", tmp_path / "registry.yaml"
+    _edit(env, ENV.format(shell="zsh"))
+    _edit(registry, REGISTRY)
+    w = DockerfileWatcher(str(env), registry=str(registry))
+    w.poll()
+    assert w.environment is not None
+    before = w.environment.modules
+
+    _edit(env, ENV.format(shell="fish"))
+    with recording() as recorder:
+        w.poll()
+    assert w.environment is not None
+    after = w.environment.modules
+
+    assert [m.name for m in after] == ["base", "python", "shell"]
+    assert after[0] is before[0] and after[1] is before[1]
+    assert after[2] is not before[2]
+    # Only the changed module was composed again.
+    composed = [s.attributes["modules"] for s in recorder.spans if s.name == "compose"]
+    assert composed == [1]
+
+
+def test_watcher_errors(tmp_path: Path) -> None:
+    """Test that invalid files raise once, until they change."""
+    env = tmp_path / "env.yaml"
+    _edit(env, ENV.format(shell="zsh"))
+    w = DockerfileWatcher(str(env), name="shell")
+    assert w.poll() is not None
+
+    _edit(env, "modules: [{name: a}]\n")
+    with pytest.raises(Exception):
+        w.poll()
+    assert w.poll() is None
+
+    _edit(env, ENV.format(shell="zsh").replace("name: shell\n", "name: other\n", 1))
+    with pytest.raises(WatchError):
+        w.poll()
+
+    _edit(env, ENV.format(shell="fish"))
+    assert w.poll() is not None
+
+
+def test_write_if_changed(tmp_path: Path) -> None:
+    """Test that files are only written when their content changes."""
+    path = tmp_path / "Dockerfile"
+
+    assert write_if_changed(str(path), "FROM ubuntu\n")
+    path.chmod(0o640)
+    mtime = path.stat().st_mtime_ns
+    os.utime(str(path), ns=(mtime - 10 ** 9, mtime - 10 ** 9))
+
+    assert not write_if_changed(str(path), "FROM ubuntu\n")
+    assert path.stat().st_mtime_ns == mtime - 10 ** 9
+
+    assert write_if_changed(str(path), "FROM debian\n")
+    assert path.read_text() == "FROM debian\n"
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert [p.name for p in tmp_path.iterdir()] == ["Dockerfile"]